@@ -24,8 +24,6 @@ x = np.arange(-5, 6)
 
 func = functools.partial(mnf.model, x=x, inD=len(pnames))
 
-prior = functools.partial(mnf.prior, pmin=pmin, pmax=pmax, pstep=pstep)
-
 loglike = functools.partial(mnf.loglikelihood, 
                             data=data, uncert=uncert, model=func)
 
@@ -34,12 +32,12 @@ outputdir = "./output_multinest/"
 if not os.path.isdir(outputdir):
     os.mkdir(outputdir)
 
-# Run it
+# Run it.  The prior defaults to uniform between pmin and pmax
 samp = lisa.run('multinest', fbestp='output_bestp.npy', 
                 fext='.png', fsavefile='output_posterior.npy', 
                 kll=None, loglike=loglike, model=func, 
                 niter=100000, nlive=1000, outputdir=outputdir, 
-                pnames=pnames, prior=prior, pstep=pstep, 
-                truepars=pars, verb=1)
+                pinit=pinit, pmax=pmax, pmin=pmin, pnames=pnames, 
+                pstep=pstep, truepars=pars, verb=1)
 
 
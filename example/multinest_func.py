@@ -22,15 +22,6 @@ def model(pars, x, inD):
 
 
 
-def prior(cube, ndim, nparams, pmin, pmax, pstep):
-    # Cube begins as [0,1] interval -- scale to [pmin, pmax]
-    for i in range(ndim):
-        cube[i] = cube[i]                                 \
-                  * (pmax[pstep>0][i] - pmin[pstep>0][i]) \
-                  +  pmin[pstep>0][i]
-    return cube
-
-
 def loglikelihood(cube, ndim, nparams, data, uncert, model):
     ymodel = model(cube)
     loglike = (-0.5 * ((ymodel - data) / uncert)**2).sum()
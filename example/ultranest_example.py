@@ -24,26 +24,19 @@ x = np.arange(-5, 6)[None, :]
 
 func = functools.partial(unf.model, x=x)
 
-prior = functools.partial(unf.prior, pmin=pmin, pmax=pmax, pstep=pstep)
-
-loglike = functools.partial(unf.loglikelihood, 
-                            data=data, uncert=uncert, model=func)
-
-prior.__name__ = 'prior'
-loglike.__name__ = 'loglike'
-
 # Ensure the output directory exists
 outputdir = "./output_ultranest/"
 if not os.path.isdir(outputdir):
     os.mkdir(outputdir)
 
-# Run it
+# Run it.  The prior defaults to uniform between pmin and pmax, and the 
+# log likelihood to the built-in Gaussian one, evaluated in batches
 samp = lisa.run('ultranest', dlogz=0.2, fbestp='output_bestp.npy', 
                 fext='.png', frac_remain=0.1, 
-                fsavefile='output_posterior.npy', 
-                kll=None, loglike=loglike, model=func, 
+                data=data, fsavefile='output_posterior.npy', 
+                kll=None, model=func, 
                 niter=100000, nlive=500, outputdir=outputdir, 
-                pnames=pnames, prior=prior, pstep=pstep, 
-                truepars=pars, verb=1)
+                pinit=pinit, pmax=pmax, pmin=pmin, pnames=pnames, 
+                pstep=pstep, truepars=pars, uncert=uncert, verb=1)
 
 
@@ -24,8 +24,8 @@ def setup(alg, **kwargs):
     Inputs
     ------
     alg     : string. Sampling algorithm to use.
-                      Options: demc, dnest4, dynesty, multinest, polychord, 
-                               snooker, ultranest
+                      Options: demc, dnest4, dream, dynesty, multinest, 
+                               polychord, snooker, ultranest
     **kwargs: Parameters for the sampling algorithm.
               For a list & description of parameters, see the user manual.
 
@@ -33,26 +33,8 @@ def setup(alg, **kwargs):
     -------
     Sampler object, with the supplied **kwargs set.
     """
-    if alg == 'demc':
-        Sampler = wrappers.demc_wrapper.Sampler
-    elif alg == 'dnest4':
-        Sampler = wrappers.dnest4_wrapper.Sampler
-    elif alg == 'dream':
-        Sampler = wrappers.dream_wrapper.Sampler
-    elif alg == 'dynesty':
-        Sampler = wrappers.dynesty_wrapper.Sampler
-    elif alg == 'multinest':
-        Sampler = wrappers.multinest_wrapper.Sampler
-    elif alg == 'polychord':
-        Sampler = wrappers.polychord_wrapper.Sampler
-    elif alg == 'snooker':
-        Sampler = wrappers.snooker_wrapper.Sampler
-    elif alg == 'ultranest':
-        Sampler = wrappers.ultranest_wrapper.Sampler
-    else:
-        raise ValueError("The supplied algorithm does not exist in LISA.\n"   +\
-                         "Options: demc, dnest4, dream, dynesty, multinest, " +\
-                         "polychord, snooker, ultranest\nReceived: " + alg)
+    # Only the requested sampler's wrapper (and package) is imported
+    Sampler = wrappers.load(alg).Sampler
     return Sampler(**kwargs)
 
 
@@ -0,0 +1,425 @@
+#! /usr/bin/env python
+"""
+Batch driver: runs one sampler configuration on many datasets, each in its
+own worker process, and gathers a summary table of the runs.
+
+Each dataset is a data file (NPY), with its uncertainties file, and runs in
+a subdirectory of `outputdir` named after the data file.  Runs are started
+in fresh, non-daemonic processes (so that samplers may start their own
+workers, e.g., DREAM or dynesty with nchains > 1), and the number of runs at
+once is limited by the number of CPUs and the available memory.  The output
+of each run is written to a log file in its subdirectory.  Failed runs are
+retried, and runs that completed in an earlier batch are skipped, so that
+an interrupted batch may be started again with the same arguments.
+
+Usage
+-----
+    python -m lisa.batch ALG --data PATTERN [PATTERN ...]
+                             [--uncert PATTERN [PATTERN ...]]
+                             --config MODULE:NAME [--outputdir DIR]
+                             [--nproc N] [--maxmem MB] [--memper MB]
+                             [--retries N] [--plots] [--rerun]
+
+The sampler configuration is given as a Python reference: NAME is a
+dictionary of sampler parameters, or a function that returns one, defined in
+MODULE.
+
+Functions
+---------
+expand     : list of files matching paths or glob patterns
+load_config: loads sampler parameters from a Python reference
+run_batch  : runs a sampler on many datasets
+main       : command-line interface
+"""
+
+import sys, os
+import argparse
+import csv
+import glob
+import importlib
+import json
+import resource
+import time
+import traceback
+import numpy as np
+
+# Name of the file recording the outcome of a run, in its subdirectory
+STATUS = 'status.json'
+# Columns of the summary table before the best parameters
+COLUMNS = ['name', 'status', 'attempts', 'time', 'maxrss', 'nsamples',
+           'logz', 'logzerr', 'outputdir', 'error']
+# Seconds between checks of the running processes
+POLL = 1.
+
+
+def expand(paths):
+    """
+    Expands paths and glob patterns into a sorted list of files.  Patterns
+    are expanded in the order given.  Raises a ValueError if a pattern
+    matches no file.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    files = []
+    for path in paths:
+        if glob.has_magic(path):
+            found = sorted(glob.glob(path))
+        else:
+            found = [path] if os.path.exists(path) else []
+        if not found:
+            raise ValueError("No file matches " + path + ".")
+        files += found
+    return files
+
+
+def _names(files):
+    """
+    Names of the runs: the file names without extension, made unique by
+    appending their index when needed.
+    """
+    stems = [os.path.splitext(os.path.basename(f))[0] for f in files]
+    return [stem if stems.count(stem) == 1 else stem + '_' + str(i)
+            for i, stem in enumerate(stems)]
+
+
+def _available_memory():
+    """
+    Memory available for new processes, in MB, or None if unknown.
+    """
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * \
+               os.sysconf('SC_AVPHYS_PAGES') / 2**20
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def _maxrss():
+    """
+    Peak resident memory of this process plus that of its finished children
+    (e.g., a sampler's workers), in MB.
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + \
+          resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Reported in bytes on macOS, in kilobytes elsewhere
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+
+def _write_status(outputdir, row):
+    fname = os.path.join(outputdir, STATUS)
+    with open(fname + '.tmp', 'w') as f:
+        json.dump(row, f, indent=1)
+    os.replace(fname + '.tmp', fname)
+
+
+def _read_status(outputdir):
+    try:
+        with open(os.path.join(outputdir, STATUS), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _run_one(alg, task, kwargs, plots, flog):
+    """
+    Runs the sampler on one dataset, in the current process.  Returns the
+    row of the summary table; raises an exception if the run failed.
+    """
+    import lisa
+    start = time.time()
+    if flog is not None:
+        # Redirect at the file descriptor level, so that the output of
+        # compiled samplers (e.g., MultiNest) is captured too
+        log = open(os.path.join(task['outputdir'], flog), 'a')
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+    samp = lisa.setup(alg, data=task['data'], uncert=task['uncert'],
+                      outputdir=task['outputdir'], **kwargs)
+    try:
+        samp.run()
+        if getattr(samp, 'bestp', None) is None:
+            raise RuntimeError("The sampler did not complete; see the " + \
+                               "log of the run.")
+        if plots:
+            samp.make_plots()
+        outp = getattr(samp, 'outp', None)
+        row  = {'name'     : task['name'],
+                'status'   : 'done',
+                'time'     : time.time() - start,
+                'maxrss'   : _maxrss(),
+                'nsamples' : None if outp is None else int(outp.shape[-1]),
+                'logz'     : None if samp.logz    is None else
+                             float(samp.logz),
+                'logzerr'  : None if samp.logzerr is None else
+                             float(samp.logzerr),
+                'bestp'    : np.asarray(samp.bestp, dtype=float).tolist()}
+    finally:
+        samp.close()
+    return row
+
+
+def _worker(conn, alg, task, kwargs, plots, flog):
+    """
+    Target of the worker processes: sends the outcome of the run through
+    `conn`.
+    """
+    try:
+        conn.send(('done', _run_one(alg, task, kwargs, plots, flog)))
+    except BaseException:
+        error = traceback.format_exc()
+        sys.stderr.write(error)
+        conn.send(('failed', error))
+    finally:
+        conn.close()
+
+
+def _budget(nproc, memper, maxmem, nrunning):
+    """
+    Whether another run may start, given the number of runs in progress.
+    """
+    if nrunning >= nproc:
+        return False
+    if nrunning == 0 or memper is None:
+        return True
+    avail = _available_memory() if maxmem is None else \
+            maxmem - nrunning * memper
+    return avail is None or avail >= memper
+
+
+def run_batch(alg, data, uncert=None, config=None, outputdir='batch',
+              flog='run.log', fsummary='summary.csv', maxmem=None,
+              memper=None, nproc=None, plots=False, rerun=False, retries=1,
+              verb=1):
+    """
+    Runs sampler `alg` on each dataset, with the same parameters, in worker
+    processes.
+
+    Inputs
+    ------
+    alg      : string. Sampling algorithm to use.
+    data     : string, or list of strings.  Paths or glob patterns of the
+                       data files (NPY).
+    uncert   : string, or list of strings.  Paths or glob patterns of the
+                       uncertainties files, matching `data` one to one
+                       after sorting.  A single file is used for all
+                       datasets.  If None, no uncertainties are given.
+    config   : dict.   Parameters of the sampler, shared by all runs.
+                       `data`, `uncert`, and `outputdir` are set for each
+                       run.
+    outputdir: string. Directory of the batch.  Each run is performed in a
+                       subdirectory named after its data file.
+    flog     : string. File name of the log of each run, in its
+                       subdirectory.  If None, runs print to the terminal.
+    fsummary : string. File name of the summary table (CSV), in
+                       `outputdir`.  If None, it is not saved.
+    maxmem   : float.  Memory available to the batch, in MB.  If None, the
+                       memory available is checked before each run starts.
+    memper   : float.  Memory needed per run, in MB.  If None, it is taken
+                       as the largest peak memory of the runs completed so
+                       far (until one completes, only the number of CPUs
+                       limits the runs at once).
+    nproc    : int.    Maximum number of runs at once.  If None, the number
+                       of CPUs divided by the processes used per run
+                       (`ncpu` or `nchains` in `config`, if given).
+    plots    : bool.   Determines whether to make the plots of each run.
+    rerun    : bool.   Determines whether to repeat the runs that completed
+                       in an earlier batch in the same `outputdir`.
+    retries  : int.    Number of times a failed run is retried.
+    verb     : int.    Verbosity level.  If 1, reports the start and end of
+                       each run.
+
+    Outputs
+    -------
+    rows: list of dicts. Summary of each run, in the order of the data
+                         files: name, status ('done' or 'failed'),
+                         attempts, time (s), maxrss (peak memory, MB),
+                         nsamples, logz, logzerr, outputdir, error (the
+                         traceback of the last failure), and bestp.
+    """
+    import multiprocess as mp
+    from multiprocess.connection import wait
+
+    kwargs = {key : val for key, val in (config or {}).items()
+              if key not in ['data', 'uncert', 'outputdir']}
+    dfiles = expand(data)
+    ufiles = [None] * len(dfiles) if uncert is None else expand(uncert)
+    if len(ufiles) == 1:
+        ufiles = ufiles * len(dfiles)
+    if len(ufiles) != len(dfiles):
+        raise ValueError("The number of uncertainties files (" + \
+                         str(len(ufiles)) + ") does not match the number " + \
+                         "of data files (" + str(len(dfiles)) + ").")
+    if retries < 0:
+        raise ValueError("The number of retries must be non-negative.")
+    if nproc is None:
+        nper  = max(int(kwargs.get('ncpu', 1) or 1),
+                    int(kwargs.get('nchains', 1) or 1))
+        nproc = max(1, (os.cpu_count() or 1) // nper)
+    if nproc < 1:
+        raise ValueError("The number of processes must be positive.")
+
+    outputdir = os.path.abspath(outputdir)
+    rows  = {}
+    queue = []
+    for name, dfile, ufile in zip(_names(dfiles), dfiles, ufiles):
+        subdir = os.path.join(outputdir, name)
+        os.makedirs(subdir, exist_ok=True)
+        task = {'name'      : name,
+                'data'      : os.path.abspath(dfile),
+                'uncert'    : None if ufile is None else
+                              os.path.abspath(ufile),
+                'outputdir' : subdir,
+                'attempts'  : 0}
+        status = None if rerun else _read_status(subdir)
+        if status is not None and status.get('status') == 'done':
+            rows[name] = status
+        else:
+            queue.append(task)
+    order = _names(dfiles)
+    if verb and len(queue) < len(order):
+        print("Skipping", len(order) - len(queue), "completed run(s).")
+
+    running = {} # connection -> (process, task)
+    peak    = None # largest peak memory of the completed runs
+    try:
+        while queue or running:
+            while queue and _budget(nproc, memper or peak, maxmem,
+                                    len(running)):
+                task = queue.pop(0)
+                task['attempts'] += 1
+                recv, send = mp.Pipe(duplex=False)
+                proc = mp.Process(target=_worker,
+                                  args=(send, alg, task, kwargs, plots, flog))
+                proc.start()
+                send.close()
+                running[recv] = (proc, task)
+                if verb:
+                    print("Started run", task['name'], "(attempt " + \
+                          str(task['attempts']) + ").")
+            for conn in wait(list(running), timeout=POLL):
+                proc, task = running.pop(conn)
+                try:
+                    outcome, result = conn.recv()
+                except EOFError:
+                    outcome, result = 'failed', "The process exited " + \
+                                      "without a result."
+                conn.close()
+                proc.join()
+                if outcome == 'failed' and proc.exitcode not in (0, None):
+                    result += "\nExit code: " + str(proc.exitcode)
+                if outcome == 'done':
+                    row   = result
+                    peak  = max(peak or 0, row['maxrss'])
+                    row['error'] = None
+                elif task['attempts'] <= retries:
+                    if verb:
+                        print("Run", task['name'], "failed; retrying.")
+                    queue.append(task)
+                    continue
+                else:
+                    row = {'name' : task['name'], 'status' : 'failed',
+                           'error' : result}
+                row['attempts']  = task['attempts']
+                row['outputdir'] = task['outputdir']
+                _write_status(task['outputdir'], row)
+                rows[task['name']] = row
+                if verb:
+                    print("Run", task['name'], row['status'] + ".",
+                          len(rows), "of", len(order), "finished.")
+    finally:
+        # On interruption, stop the runs in progress
+        for proc, task in running.values():
+            proc.terminate()
+            proc.join()
+
+    rows = [rows[name] for name in order]
+    if fsummary is not None:
+        _save_summary(os.path.join(outputdir, fsummary), rows)
+    if verb:
+        nfail = sum(row['status'] != 'done' for row in rows)
+        print(len(rows) - nfail, "run(s) completed,", nfail, "failed.")
+    return rows
+
+
+def _save_summary(fname, rows):
+    """
+    Saves the summary table as CSV, one column per best parameter.
+    """
+    npar = max([len(row.get('bestp') or []) for row in rows] + [0])
+    with open(fname, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS + ['bestp' + str(i) for i in range(npar)])
+        for row in rows:
+            bestp = list(row.get('bestp') or [])
+            error = row.get('error')
+            # Only the last line of a traceback, to keep one line per run
+            if error:
+                row = dict(row, error=error.strip().splitlines()[-1])
+            writer.writerow([row.get(col) for col in COLUMNS] + bestp + \
+                            [None] * (npar - len(bestp)))
+
+
+def load_config(ref):
+    """
+    Loads a sampler configuration from a Python reference, 'module:name',
+    where `name` is a dictionary, or a function that returns one.
+    """
+    if ':' not in ref:
+        raise ValueError("The configuration must be given as module:name.")
+    modname, name = ref.split(':', 1)
+    # Modules next to the caller may be referred to by name
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    config = getattr(importlib.import_module(modname), name)
+    if callable(config):
+        config = config()
+    if not isinstance(config, dict):
+        raise ValueError("The configuration " + ref + " is not a " + \
+                         "dictionary.")
+    return dict(config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a sampler on " + \
+                                     "many datasets.")
+    parser.add_argument('alg', help='Sampling algorithm.')
+    parser.add_argument('--data', nargs='+', required=True,
+                        help='Data files (NPY), or glob patterns.')
+    parser.add_argument('--uncert', nargs='+', default=None,
+                        help='Uncertainties files (NPY), or glob patterns.')
+    parser.add_argument('--config', required=True,
+                        help='Sampler parameters, as module:name.')
+    parser.add_argument('--outputdir', default='batch',
+                        help='Directory of the batch.')
+    parser.add_argument('--nproc', type=int, default=None,
+                        help='Maximum number of runs at once.')
+    parser.add_argument('--maxmem', type=float, default=None,
+                        help='Memory available to the batch, in MB.')
+    parser.add_argument('--memper', type=float, default=None,
+                        help='Memory needed per run, in MB.')
+    parser.add_argument('--retries', type=int, default=1,
+                        help='Number of times a failed run is retried.')
+    parser.add_argument('--plots', action='store_true',
+                        help='Make the plots of each run.')
+    parser.add_argument('--rerun', action='store_true',
+                        help='Repeat the runs completed earlier.')
+    args = parser.parse_args()
+
+    rows = run_batch(args.alg, args.data, args.uncert,
+                     load_config(args.config), args.outputdir,
+                     maxmem=args.maxmem, memper=args.memper,
+                     nproc=args.nproc, plots=args.plots, rerun=args.rerun,
+                     retries=args.retries)
+    return int(any(row['status'] != 'done' for row in rows))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
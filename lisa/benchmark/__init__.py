@@ -0,0 +1,11 @@
+"""
+Benchmarks for LISA.
+
+Modules
+-------
+import_time: measures the import time of LISA and its sampler backends
+problems   : catalog of inference problems with known solutions
+suite      : runs the samplers on the problems, and compares to a baseline
+"""
+
+__all__ = ['import_time', 'problems', 'suite']
@@ -0,0 +1,130 @@
+#! /usr/bin/env python
+"""
+Measures the time to import LISA and the wrapper of a single sampler, and
+checks that no other sampler backend (or plotting package) is imported along
+the way.  Each measurement is made in a fresh interpreter.
+
+Usage
+-----
+    python -m lisa.benchmark.import_time [--alg ALG] [--max-time SECONDS]
+                                         [--repeat N]
+
+Exits with a nonzero status if a check fails, so that it can guard against
+regressions in automated jobs.
+
+Functions
+---------
+measure: imports LISA (and optionally a sampler's wrapper) in a subprocess
+check  : compares a measurement against the limits
+main   : command-line interface
+"""
+
+import sys, os
+import argparse
+import json
+import subprocess
+
+# Packages that LISA must not import unless they were requested
+HEAVY = {'demc'      : ['MCcubed'],
+         'dnest4'    : ['dnest4'],
+         'dream'     : ['pydream'],
+         'dynesty'   : ['dynesty'],
+         'multinest' : ['pymultinest'],
+         'polychord' : ['pypolychord'],
+         'snooker'   : ['MCcubed'],
+         'ultranest' : ['ultranest'],
+         'plotting'  : ['matplotlib', 'mcplots']}
+
+_SCRIPT = """
+import sys, time, json
+t0 = time.perf_counter()
+import lisa
+t1 = time.perf_counter()
+alg = {alg!r}
+if alg is not None:
+    lisa.wrappers.load(alg)
+t2 = time.perf_counter()
+print(json.dumps({{'import' : t1 - t0, 'load' : t2 - t1,
+                  'modules' : sorted(m.split('.')[0] for m in sys.modules)}}))
+"""
+
+
+def measure(alg=None):
+    """
+    Imports LISA in a fresh interpreter, optionally loading the wrapper of a
+    sampler.
+
+    Inputs
+    ------
+    alg: string. Sampling algorithm to load.  If None, only imports LISA.
+
+    Outputs
+    -------
+    result: dict. Contains `import` and `load`, the times in seconds, and
+                  `modules`, the top-level modules imported.
+    """
+    out = subprocess.run([sys.executable, '-c', _SCRIPT.format(alg=alg)],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         cwd=os.path.join(os.path.dirname(__file__),
+                                          '..', '..'))
+    if out.returncode:
+        raise RuntimeError(out.stderr.decode().strip().splitlines()[-1])
+    return json.loads(out.stdout.decode().strip().splitlines()[-1])
+
+
+def check(result, alg=None, max_time=None):
+    """
+    Checks a measurement for unrequested imports and excessive import time.
+
+    Inputs
+    ------
+    result  : dict.   Output of measure().
+    alg     : string. Sampling algorithm that was loaded, if any.
+    max_time: float.  Maximum allowed time, in seconds, to import LISA and
+                      load the sampler.  If None, time is not checked.
+
+    Outputs
+    -------
+    problems: list of strings.  Description of each failed check.
+    """
+    allowed  = set(HEAVY.get(alg, []))
+    imported = set(result['modules'])
+    problems = []
+    for mods in HEAVY.values():
+        for mod in mods:
+            if mod in imported and mod not in allowed:
+                problems.append(mod + " was imported, but was not requested.")
+    total = result['import'] + result['load']
+    if max_time is not None and total > max_time:
+        problems.append("Import took {:.3f} s, exceeding the limit of " \
+                        "{:.3f} s.".format(total, max_time))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--alg', default=None,
+                        help='Sampling algorithm to load after importing.')
+    parser.add_argument('--max-time', type=float, default=None,
+                        help='Maximum allowed time, in seconds.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of measurements; the fastest is used.')
+    args = parser.parse_args(argv)
+
+    try:
+        results = [measure(args.alg) for i in range(args.repeat)]
+    except RuntimeError as e:
+        print("FAILED:", e)
+        return 1
+    result  = min(results, key=lambda r: r['import'] + r['load'])
+    print("import lisa: {:.3f} s".format(result['import']))
+    if args.alg is not None:
+        print("load('{}'): {:.3f} s".format(args.alg, result['load']))
+    problems = check(result, args.alg, args.max_time)
+    for problem in problems:
+        print("FAILED:", problem)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""
+Catalog of inference problems for benchmarking the samplers.
+
+Each problem has a known posterior mean and standard deviation and, under a
+uniform prior between `pmin` and `pmax`, a known log evidence, against which
+the samplers' results are compared.  The log likelihoods are vectorized:
+they accept a single point, shape (ndim,), or a batch, shape (nbatch, ndim).
+
+The MCMCs fit a model to data rather than evaluate a log likelihood, so each
+problem also provides a model for which the chi-squared of `data` (a single
+zero with unit uncertainty) is -2 * (loglike - logl_max), where `logl_max`
+is an upper bound of the log likelihood.
+
+Problems
+--------
+quadratic: the example/ problem, a quadratic fit to 11 noisy data points
+gaussian : correlated Gaussian, 10 dimensions by default
+mixture  : mixture of two well-separated Gaussians, 2 dimensions by default
+banana   : curved (Rosenbrock-like) distribution in 2 dimensions
+
+Functions
+---------
+get: builds a problem from the catalog
+
+Classes
+-------
+Problem: inference problem with a known solution
+"""
+
+import functools
+import numpy as np
+
+# Seed used to generate the problems' data, so that they are reproducible
+SEED = 20240601
+
+
+def _residual_model(params, loglike=None, logl_max=None):
+    """
+    Model whose chi-squared, for data 0 and uncertainty 1, equals
+    -2 * (loglike(params) - logl_max).
+    """
+    chisq = 2. * (logl_max - loglike(params))
+    return np.sqrt(np.maximum(chisq, 0.))[..., None]
+
+
+class Problem(object):
+    """
+    Inference problem with a known solution.
+
+    Attributes
+    ----------
+    name    : string. Name of the problem in the catalog.
+    ndim    : int.    Number of parameters.
+    pnames  : array.  Parameter names.
+    pmin    : array.  Minimum of the uniform prior for each parameter.
+    pmax    : array.  Maximum of the uniform prior for each parameter.
+    pinit   : array.  Initial values, for the MCMCs.
+    pstep   : array.  Initial step sizes, for the MCMCs.
+    loglike : object. Vectorized log likelihood.
+    logl_max: float.  Upper bound of the log likelihood.
+    logz    : float.  Log evidence under the uniform prior.
+    mean    : array.  Posterior mean of each parameter.
+    std     : array.  Posterior standard deviation of each parameter.
+    model   : object. Model to fit to `data` and `uncert`, for the MCMCs.
+    data    : array.  A single zero.
+    uncert  : array.  A single one.
+    """
+    def __init__(self, name, pmin, pmax, loglike, logl_max, logz, mean, std,
+                       pinit=None, pstep=None):
+        self.name     = name
+        self.pmin     = np.asarray(pmin, dtype=float)
+        self.pmax     = np.asarray(pmax, dtype=float)
+        self.ndim     = self.pmin.size
+        self.pnames   = np.array(['p' + str(i) for i in range(self.ndim)])
+        if pinit is None:
+            pinit = 0.5 * (self.pmin + self.pmax)
+        if pstep is None:
+            pstep = 0.1 * (self.pmax - self.pmin)
+        self.pinit    = np.asarray(pinit, dtype=float)
+        self.pstep    = np.asarray(pstep, dtype=float)
+        self.loglike  = loglike
+        self.logl_max = logl_max
+        self.logz     = logz
+        self.mean     = np.asarray(mean, dtype=float)
+        self.std      = np.asarray(std,  dtype=float)
+        self.model    = functools.partial(_residual_model, loglike=loglike,
+                                          logl_max=logl_max)
+        self.data     = np.zeros(1)
+        self.uncert   = np.ones(1)
+
+    def log_volume(self):
+        """
+        Log of the prior volume.
+        """
+        return np.sum(np.log(self.pmax - self.pmin))
+
+
+def _quadratic_loglike(params, x=None, data=None, uncert=None):
+    params = np.asarray(params)
+    model  = params[..., 0:1] * x**2 + params[..., 1:2] * x + params[..., 2:3]
+    return -0.5 * np.sum(((model - data) / uncert)**2, axis=-1)
+
+
+def quadratic(a=3., b=-2., c=50.):
+    """
+    The problem of example/: a quadratic with coefficients `a`, `b`, and `c`
+    observed at x = -5, ..., 5, with Poisson-like noise.  The model is
+    linear in the parameters, so the posterior is Gaussian.
+    """
+    rng    = np.random.RandomState(SEED)
+    x      = np.arange(-5, 6)
+    true   = a * x**2 + b * x + c
+    uncert = np.sqrt(true)
+    data   = true + rng.normal(0, uncert)
+    # Weighted least squares gives the posterior mean and covariance
+    design = np.stack([x**2, x, np.ones(x.size)], axis=1) / uncert[:, None]
+    cov    = np.linalg.inv(design.T @ design)
+    mean   = cov @ design.T @ (data / uncert)
+    loglike  = functools.partial(_quadratic_loglike, x=x, data=data,
+                                 uncert=uncert)
+    logl_max = float(loglike(mean))
+    pmin     = np.array([-10., -10., -10.])
+    pmax     = np.array([ 10.,  10., 100.])
+    logz     = logl_max + 0.5 * mean.size * np.log(2. * np.pi) + \
+               0.5 * np.linalg.slogdet(cov)[1] - np.sum(np.log(pmax - pmin))
+    return Problem('quadratic', pmin, pmax, loglike, logl_max, logz, mean,
+                   np.sqrt(np.diag(cov)), pinit=np.zeros(3),
+                   pstep=np.array([3., 3., 3.]))
+
+
+def _gaussian_loglike(params, mean=None, icov=None, norm=None):
+    diff = np.asarray(params) - mean
+    return norm - 0.5 * np.einsum('...i,ij,...j->...', diff, icov, diff)
+
+
+def gaussian(ndim=10, rho=0.5):
+    """
+    Gaussian in `ndim` dimensions, with standard deviations from 0.1 to 1
+    and correlation `rho` between neighboring parameters.
+    """
+    std  = np.logspace(-1, 0, ndim)
+    corr = np.eye(ndim) + rho * (np.eye(ndim, k=1) + np.eye(ndim, k=-1))
+    cov  = corr * np.outer(std, std)
+    mean = np.linspace(-1, 1, ndim)
+    norm = -0.5 * (ndim * np.log(2. * np.pi) + np.linalg.slogdet(cov)[1])
+    loglike = functools.partial(_gaussian_loglike, mean=mean,
+                                icov=np.linalg.inv(cov), norm=norm)
+    pmin = -5. * np.ones(ndim)
+    pmax =  5. * np.ones(ndim)
+    return Problem('gaussian', pmin, pmax, loglike, norm,
+                   -np.sum(np.log(pmax - pmin)), mean, std)
+
+
+def _mixture_loglike(params, means=None, sigmas=None, weights=None):
+    params = np.asarray(params)
+    ndim   = means.shape[1]
+    # Log of each weighted component, shape (..., ncomp)
+    diff   = params[..., None, :] - means
+    logc   = np.log(weights) - ndim * np.log(np.sqrt(2. * np.pi) * sigmas) - \
+             0.5 * np.sum(diff**2, axis=-1) / sigmas**2
+    top    = np.max(logc, axis=-1)
+    return top + np.log(np.sum(np.exp(logc - top[..., None]), axis=-1))
+
+
+def mixture(ndim=2, weights=(0.3, 0.7), sigma=0.3, sep=2.5):
+    """
+    Mixture of two isotropic Gaussians with standard deviation `sigma`,
+    centered at -`sep` and +`sep` along every axis.
+    """
+    weights = np.asarray(weights, dtype=float)
+    sigmas  = np.full(weights.size, sigma)
+    means   = np.array([-sep, sep])[:, None] * np.ones(ndim)
+    loglike = functools.partial(_mixture_loglike, means=means, sigmas=sigmas,
+                                weights=weights)
+    # Sum of the component peaks bounds the density
+    logl_max = np.log(np.sum(weights * (np.sqrt(2. * np.pi) *
+                                        sigmas)**-ndim))
+    mean = weights @ means
+    var  = weights @ (means**2 + sigmas[:, None]**2) - mean**2
+    pmin = -5. * np.ones(ndim)
+    pmax =  5. * np.ones(ndim)
+    return Problem('mixture', pmin, pmax, loglike, logl_max,
+                   -np.sum(np.log(pmax - pmin)), mean, np.sqrt(var))
+
+
+def _banana_loglike(params, a=None, b=None, s0=None, s1=None):
+    params = np.asarray(params)
+    p0, p1 = params[..., 0], params[..., 1]
+    return -0.5 * (p0 / s0)**2 - 0.5 * ((p1 - b * (p0**2 - a)) / s1)**2 - \
+           np.log(2. * np.pi * s0 * s1)
+
+
+def banana(a=1., b=1., s0=1., s1=0.5):
+    """
+    Banana-shaped distribution: p0 ~ N(0, s0), and p1 - b * (p0**2 - a) ~
+    N(0, s1).
+    """
+    loglike = functools.partial(_banana_loglike, a=a, b=b, s0=s0, s1=s1)
+    mean = np.array([0., b * (s0**2 - a)])
+    std  = np.sqrt([s0**2, s1**2 + 2. * b**2 * s0**4])
+    pmin = np.array([-6., -5.])
+    pmax = np.array([ 6., 20.])
+    return Problem('banana', pmin, pmax, loglike,
+                   -np.log(2. * np.pi * s0 * s1),
+                   -np.sum(np.log(pmax - pmin)), mean, std)
+
+
+CATALOG = {'banana'    : banana,
+           'gaussian'  : gaussian,
+           'mixture'   : mixture,
+           'quadratic' : quadratic}
+
+
+def get(name, **kwargs):
+    """
+    Builds a problem from the catalog.
+
+    Inputs
+    ------
+    name    : string. Name of the problem.  See CATALOG for the options.
+    **kwargs: Options of the problem (e.g., ndim for gaussian).
+
+    Outputs
+    -------
+    problem: Problem.
+    """
+    if name not in CATALOG:
+        raise ValueError("Unknown problem: " + str(name) + ".  Options: " + \
+                         ", ".join(sorted(CATALOG)))
+    return CATALOG[name](**kwargs)
@@ -0,0 +1,403 @@
+#! /usr/bin/env python
+"""
+Runs the samplers on the problems of the catalog (problems.py), and records
+their wall time, peak memory, number of likelihood calls, accuracy (log
+evidence and posterior moments), and effective sample size (ESS) per second
+to a JSON file.  Each sampler/problem case runs in a fresh interpreter, so
+that memory peaks and imports do not carry over between cases.
+
+Results may be compared against a baseline (a results file from an earlier
+run), to catch regressions in speed or accuracy.
+
+Usage
+-----
+    python -m lisa.benchmark.suite [--problems P [P ...]] [--algs A [A ...]]
+                                   [--output FILE] [--baseline FILE]
+                                   [--tolerance TOL] [--timeout SECONDS]
+                                   [--settings JSON] [--workdir DIR]
+
+Exits with a nonzero status if a case fails or, when a baseline is given, if
+a case regressed.
+
+Functions
+---------
+run_case: runs one sampler on one problem, in the current process
+measure : runs one sampler on one problem, in a subprocess
+compare : compares results against a baseline
+main    : command-line interface
+"""
+
+import sys, os
+import argparse
+import datetime
+import json
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import functools
+import numpy as np
+
+from . import problems
+
+ALGS = ['demc', 'dnest4', 'dream', 'dynesty', 'multinest', 'polychord',
+        'snooker', 'ultranest']
+# Samplers that fit the problem's model to data instead of its log likelihood
+MODEL_ALGS = ['demc', 'snooker']
+# Samplers whose posterior is made of `nchains` chains
+MCMC_ALGS  = ['demc', 'dream', 'snooker']
+
+# Settings of each sampler, on top of those defined by the problem
+SETTINGS = {'demc'      : {'burnin' : 2000, 'nchains' : 10,
+                           'niter' : 100000},
+            'dnest4'    : {'niter' : 5000, 'nlevel' : 30,
+                           'nlevelint' : 1000, 'nperstep' : 100},
+            'dream'     : {'burnin' : 2000, 'nchains' : 4, 'niter' : 20000},
+            'dynesty'   : {'dlogz' : 0.1, 'nlive' : 500,
+                           'nlive_batch' : 500},
+            'multinest' : {'dlogz' : 0.1, 'nlive' : 500},
+            'polychord' : {'dlogz' : 0.01, 'nlive' : 500},
+            'snooker'   : {'burnin' : 2000, 'nchains' : 10,
+                           'niter' : 100000},
+            'ultranest' : {'dlogz' : 0.5, 'nlive' : 400}}
+
+# Name of the results file written by each case
+CASE_RESULT = 'result.json'
+
+
+class Counter(object):
+    """
+    Wraps a function to count the number of points it is evaluated on.
+    Calls made in worker processes of the samplers are not counted.
+    """
+    def __init__(self, func):
+        self.func   = func
+        self.ncalls = 0
+
+    def __call__(self, params, *args, **kwargs):
+        self.ncalls += 1 if np.ndim(params) < 2 else len(params)
+        return self.func(params, *args, **kwargs)
+
+
+def _perturb(coords, pmin=None, pmax=None):
+    """
+    Proposal for DNest4: moves one parameter by a heavy-tailed step, and
+    wraps it into [pmin, pmax].
+    """
+    import dnest4
+    i = np.random.randint(coords.size)
+    width      = pmax[i] - pmin[i]
+    coords[i] += width * dnest4.randh()
+    coords[i]  = pmin[i] + np.mod(coords[i] - pmin[i], width)
+    return 0.0
+
+
+def sampler_kwargs(problem, alg, func, outputdir, settings=None):
+    """
+    Builds the inputs of sampler `alg` for `problem`.
+
+    Inputs
+    ------
+    problem  : Problem. Problem to solve.
+    alg      : string.  Sampling algorithm.
+    func     : object.  The problem's model (for MODEL_ALGS) or log
+                        likelihood (otherwise), possibly wrapped by a Counter.
+    outputdir: string.  Directory for the sampler's outputs.
+    settings : dict.    Inputs that override SETTINGS[alg].
+
+    Outputs
+    -------
+    kwargs: dict. Inputs of the sampler.
+    """
+    kwargs = {'outputdir' : outputdir, 'pmax' : problem.pmax,
+              'pmin' : problem.pmin, 'pnames' : problem.pnames}
+    if alg in MODEL_ALGS:
+        kwargs.update(data=problem.data, indparams=[], model=func,
+                      pinit=problem.pinit, pstep=problem.pstep,
+                      uncert=problem.uncert)
+    elif alg == 'dream':
+        kwargs.update(loglike=func)
+    else:
+        # Nested samplers: uniform prior between pmin and pmax by default
+        kwargs.update(model=problem.model, pinit=problem.pinit,
+                      pstep=np.ones(problem.ndim), loglike=func)
+        if alg in ['multinest', 'polychord']:
+            # These samplers have their own calling conventions
+            import lisa
+            wrapper = lisa.wrappers.load(alg)
+            kwargs['loglike'] = functools.partial(wrapper.gaussian_loglike,
+                                                  loglike=func)
+        elif alg == 'dnest4':
+            kwargs['perturb'] = functools.partial(_perturb, pmin=problem.pmin,
+                                                  pmax=problem.pmax)
+    kwargs.update(SETTINGS[alg])
+    if settings is not None:
+        kwargs.update(settings)
+    return kwargs
+
+
+def _maxrss(who):
+    """
+    Peak resident memory, in MB.
+    """
+    rss = resource.getrusage(who).ru_maxrss
+    # Reported in bytes on macOS, in kilobytes elsewhere
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+
+def run_case(name, alg, outputdir, settings=None, seed=problems.SEED):
+    """
+    Runs sampler `alg` on problem `name`, in the current process.
+
+    Inputs
+    ------
+    name     : string. Name of the problem in the catalog.
+    alg      : string. Sampling algorithm.
+    outputdir: string. Directory for the sampler's outputs.
+    settings : dict.   Inputs that override SETTINGS[alg].
+    seed     : int.    Seed of NumPy's global random number generator.
+
+    Outputs
+    -------
+    result: dict. Measurements of the run: time (s), ncalls (points on
+                  which the log likelihood, or model, was evaluated),
+                  nsamples, maxrss and maxrss_children (peak memory, MB),
+                  logz and logzerr (nested samplers), logz_true,
+                  logz_error, mean_error (largest error of the posterior
+                  means, in posterior standard deviations), std_error
+                  (largest relative error of the standard deviations), ess
+                  (smallest bulk ESS over the parameters, see
+                  lisa.wrappers.diagnostics), and ess_per_sec.
+    """
+    import lisa
+    np.random.seed(seed)
+    problem = problems.get(name)
+    counter = Counter(problem.model if alg in MODEL_ALGS else problem.loglike)
+    samp    = lisa.setup(alg, **sampler_kwargs(problem, alg, counter,
+                                                outputdir, settings))
+    start   = time.perf_counter()
+    samp.run()
+    elapsed = time.perf_counter() - start
+    if getattr(samp, 'outp', None) is None:
+        raise RuntimeError("The sampler did not produce a posterior.")
+    outp    = np.asarray(samp.outp)
+    nchains = samp.nchains if alg in MCMC_ALGS else 1
+    chains  = lisa.wrappers.chains.chain_view(outp, nchains)
+    # Bulk ESS, as in the samplers' own convergence diagnostics
+    neff    = float(np.min(lisa.wrappers.diagnostics.diagnose(chains)
+                           ['ess_bulk']))
+    mean    = outp.mean(axis=1)
+    std     = outp.std(axis=1)
+    result  = {'problem'     : name,
+               'alg'         : alg,
+               'status'      : 'ok',
+               'time'        : elapsed,
+               'ncalls'      : counter.ncalls,
+               'nsamples'    : outp.shape[1],
+               'maxrss'      : _maxrss(resource.RUSAGE_SELF),
+               'maxrss_children' : _maxrss(resource.RUSAGE_CHILDREN),
+               'logz'        : None,
+               'logzerr'     : None,
+               'logz_true'   : float(problem.logz),
+               'logz_error'  : None,
+               'mean_error'  : float(np.max(np.abs(mean - problem.mean) /
+                                            problem.std)),
+               'std_error'   : float(np.max(np.abs(std / problem.std - 1.))),
+               'ess'         : neff,
+               'ess_per_sec' : neff / elapsed}
+    if samp.logz is not None:
+        result['logz']       = float(samp.logz)
+        result['logz_error'] = float(samp.logz - problem.logz)
+        if samp.logzerr is not None:
+            result['logzerr'] = float(samp.logzerr)
+    return result
+
+
+def measure(name, alg, workdir, settings=None, timeout=None):
+    """
+    Runs sampler `alg` on problem `name` in a fresh interpreter.
+
+    Inputs
+    ------
+    name    : string. Name of the problem in the catalog.
+    alg     : string. Sampling algorithm.
+    workdir : string. Directory under which the case's outputs are saved.
+    settings: dict.   Inputs that override SETTINGS[alg].
+    timeout : float.  Maximum time, in seconds, allowed for the case.
+
+    Outputs
+    -------
+    result: dict. Output of run_case(), or, if the case failed, the problem,
+                  alg, status ('failed' or 'timeout'), and error message.
+    """
+    outputdir = os.path.abspath(os.path.join(workdir, name + '_' + alg))
+    if not os.path.isdir(outputdir):
+        os.makedirs(outputdir)
+    fresult = os.path.join(outputdir, CASE_RESULT)
+    if os.path.exists(fresult):
+        os.remove(fresult)
+    cmd = [sys.executable, '-m', 'lisa.benchmark.suite', '--case', name, alg,
+           '--workdir', outputdir]
+    if settings:
+        cmd += ['--settings', json.dumps(settings)]
+    try:
+        out = subprocess.run(cmd, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, timeout=timeout,
+                             cwd=os.path.join(os.path.dirname(__file__),
+                                              '..', '..'))
+    except subprocess.TimeoutExpired:
+        return {'problem' : name, 'alg' : alg, 'status' : 'timeout',
+                'error' : "Exceeded " + str(timeout) + " s."}
+    if out.returncode or not os.path.exists(fresult):
+        lines = out.stderr.decode().strip().splitlines() or ['Unknown error']
+        return {'problem' : name, 'alg' : alg, 'status' : 'failed',
+                'error' : lines[-1]}
+    with open(fresult, 'r') as f:
+        return json.load(f)
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Compares results against a baseline.
+
+    Inputs
+    ------
+    results  : list of dicts. Results of each case, as from measure().
+    baseline : list of dicts. Results of each case in the baseline.
+    tolerance: float.         Allowed relative increase in time and decrease
+                              in ESS per second, and allowed increase in the
+                              error of the log evidence (in nats, beyond
+                              3 times its estimated uncertainty) and of the
+                              posterior mean (in posterior standard
+                              deviations).
+
+    Outputs
+    -------
+    regressions: list of strings.  Description of each regression.
+    """
+    base        = {(r['problem'], r['alg']) : r for r in baseline}
+    regressions = []
+    for res in results:
+        key  = (res['problem'], res['alg'])
+        case = res['alg'] + " on " + res['problem'] + ": "
+        if key not in base or base[key]['status'] != 'ok':
+            continue
+        ref = base[key]
+        if res['status'] != 'ok':
+            regressions.append(case + "now fails (" + res['status'] + ").")
+            continue
+        if res['time'] > (1. + tolerance) * ref['time']:
+            regressions.append(case + "time increased from {:.3g} s to " \
+                               "{:.3g} s.".format(ref['time'], res['time']))
+        if res['ess_per_sec'] < ref['ess_per_sec'] / (1. + tolerance):
+            regressions.append(case + "ESS/s decreased from {:.3g} to " \
+                               "{:.3g}.".format(ref['ess_per_sec'],
+                                                res['ess_per_sec']))
+        if res['logz_error'] is not None and ref['logz_error'] is not None:
+            allowed = abs(ref['logz_error']) + tolerance + \
+                      3. * (res['logzerr'] or 0.)
+            if abs(res['logz_error']) > allowed:
+                regressions.append(case + "log evidence error increased " \
+                                   "from {:.3g} to {:.3g}.".format(
+                                   ref['logz_error'], res['logz_error']))
+        if res['mean_error'] > ref['mean_error'] + tolerance:
+            regressions.append(case + "posterior mean error increased " \
+                               "from {:.3g} to {:.3g} std.".format(
+                               ref['mean_error'], res['mean_error']))
+    return regressions
+
+
+def _table(results):
+    """
+    Formats the results as a table.
+    """
+    fmt   = "{:<10} {:<10} {:>8} {:>10} {:>9} {:>10} {:>9} {:>10}"
+    lines = [fmt.format('problem', 'alg', 'status', 'time [s]', 'ncalls',
+                        'logz err', 'mean err', 'ESS/s')]
+    for r in results:
+        if r['status'] != 'ok':
+            lines.append(fmt.format(r['problem'], r['alg'], r['status'],
+                                    '', '', '', '', ''))
+            continue
+        lines.append(fmt.format(r['problem'], r['alg'], r['status'],
+                     "{:.3g}".format(r['time']), r['ncalls'],
+                     '' if r['logz_error'] is None else
+                     "{:.3f}".format(r['logz_error']),
+                     "{:.3f}".format(r['mean_error']),
+                     "{:.3g}".format(r['ess_per_sec'])))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--problems', nargs='+',
+                        default=sorted(problems.CATALOG),
+                        help='Problems to run.  Default: all')
+    parser.add_argument('--algs', nargs='+', default=ALGS,
+                        help='Samplers to run.  Default: all')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='Results file (JSON).')
+    parser.add_argument('--baseline', default=None,
+                        help='Results file to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Tolerance of the comparison.  See compare().')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='Maximum time, in seconds, for each case.')
+    parser.add_argument('--settings', type=json.loads, default=None,
+                        help='JSON object of sampler inputs, which override '
+                             'the defaults (e.g., \'{"nlive" : 1000}\').')
+    parser.add_argument('--workdir', default=None,
+                        help='Directory for the samplers\' outputs.  '
+                             'Default: a temporary directory')
+    # Internal: runs a single case in this process
+    parser.add_argument('--case', nargs=2, default=None,
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case is not None:
+        result = run_case(args.case[0], args.case[1], args.workdir,
+                          args.settings)
+        with open(os.path.join(args.workdir, CASE_RESULT), 'w') as f:
+            json.dump(result, f, indent=1)
+        return 0
+
+    for alg in args.algs:
+        if alg not in ALGS:
+            parser.error("Unknown sampler: " + alg)
+    for name in args.problems:
+        if name not in problems.CATALOG:
+            parser.error("Unknown problem: " + name)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workdir = args.workdir or tmpdir
+        results = []
+        for name in args.problems:
+            for alg in args.algs:
+                print("Running", alg, "on", name, flush=True)
+                results.append(measure(name, alg, workdir, args.settings,
+                                       args.timeout))
+    from .._version import __version__
+    output = {'lisa_version' : __version__,
+              'python'       : platform.python_version(),
+              'platform'     : platform.platform(),
+              'date'         : datetime.datetime.now().isoformat(),
+              'settings'     : args.settings,
+              'cases'        : results}
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=1)
+    print(_table(results))
+    failed = [r for r in results if r['status'] != 'ok']
+    for r in failed:
+        print("FAILED:", r['alg'], "on", r['problem'] + ":", r['error'])
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(results, json.load(f)['cases'],
+                                  args.tolerance)
+        for problem in regressions:
+            print("REGRESSION:", problem)
+    return 1 if failed or regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,306 @@
+"""
+Command-line interface of LISA: runs a sampler, or a batch of runs (see
+batch.py), as described by a configuration file, so that runs can be
+launched and resumed from job schedulers without a Python script.
+
+The configuration is a TOML, YAML, or JSON file (by extension) that names
+the sampling algorithm, `alg`, and sets the sampler's parameters (see
+lisa.setup(alg).helpinfo, or the user manual).  The log likelihood, model,
+and prior are given as references to importable functions, 'module:name',
+or as tables with a `function` reference and the `kwargs` to bind to it.
+Modules are searched for in the directory of the configuration file and in
+the current directory.  For example, in TOML:
+
+    alg       = "dynesty"
+    data      = "data.npy"
+    uncert    = "uncert.npy"
+    outputdir = "output_dynesty"
+    pmin      = [-10, -10, -10]
+    pmax      = [ 10,  10,  10]
+    pstep     = [  3,   3,   3]
+    nlive     = 1000
+
+    [model]
+    function = "dynesty_func:model"
+    kwargs   = {x = [-5, -4, -3, -2, -1, 0, 1, 2, 3, 4, 5]}
+
+    [batch]
+    data   = "spectra/*.npy"
+    uncert = "uncert/*.npy"
+    nproc  = 8
+
+The optional `batch` table holds the arguments of batch.run_batch(), used by
+the batch command.  Only the wrapper of `alg` (and its sampling package) is
+imported.
+
+Usage
+-----
+    lisa run   CONFIG [--dry-run] [--resume] [--no-plots] [--set KEY=VALUE]
+    lisa batch CONFIG [--dry-run] [--data PATTERN [PATTERN ...]]
+                      [--uncert PATTERN [PATTERN ...]] [--nproc N]
+                      [--rerun] [--set KEY=VALUE]
+
+--dry-run only checks the configuration: the sampler is set up and its
+inputs prepared (for a batch, with the first dataset), without sampling.
+--set overrides a parameter of the configuration; VALUE is parsed as JSON,
+or taken as a string if that fails.  The exit status is 0 if all runs
+completed, 1 if one failed or is not prepared, and 2 if the configuration
+is invalid.
+
+Functions
+---------
+read_config  : reads a configuration file
+load_function: imports a function from a 'module:name' reference
+make_kwargs  : sampler parameters from a configuration
+main         : command-line interface
+"""
+
+import sys, os
+import argparse
+import functools
+import importlib
+import inspect
+import json
+import numpy as np
+
+# Parameters given as references to functions
+FUNCTIONS = ['loglike', 'model', 'prior']
+# Keys of the configuration that are not sampler parameters
+RESERVED  = ['alg', 'batch']
+
+
+def read_config(fname):
+    """
+    Reads a configuration file, TOML (.toml), YAML (.yaml, .yml), or JSON
+    (any other extension), into a dictionary.
+    """
+    ext = os.path.splitext(fname)[1].lower()
+    if ext == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ValueError("Reading TOML files requires Python " + \
+                                 "3.11+ or the tomli package.")
+        with open(fname, 'rb') as f:
+            config = tomllib.load(f)
+    elif ext in ['.yaml', '.yml']:
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("Reading YAML files requires the PyYAML " + \
+                             "package.")
+        with open(fname, 'r') as f:
+            config = yaml.safe_load(f)
+    else:
+        with open(fname, 'r') as f:
+            config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError("The configuration in " + fname + " must be a " + \
+                         "table of parameters.")
+    return config
+
+
+def load_function(ref):
+    """
+    Imports a function (or any object) from a reference 'module:name',
+    where `name` may be a dotted path within the module.
+    """
+    if not isinstance(ref, str) or ref.count(':') != 1:
+        raise ValueError("Functions must be given as 'module:name', not " + \
+                         repr(ref) + ".")
+    modname, name = ref.split(':')
+    try:
+        obj = importlib.import_module(modname)
+    except ImportError as e:
+        raise ValueError("Unable to import " + modname + ": " + str(e))
+    for attr in name.split('.'):
+        if not hasattr(obj, attr):
+            raise ValueError("Module " + modname + " has no " + name + ".")
+        obj = getattr(obj, attr)
+    return obj
+
+
+def _function(key, spec):
+    """
+    The function of parameter `key` from its specification: a reference, or
+    a table with a `function` reference and its `kwargs`.
+    """
+    if isinstance(spec, dict):
+        if 'function' not in spec or set(spec) - {'function', 'kwargs'}:
+            raise ValueError(key + " must have a 'function' reference, " + \
+                             "and optionally 'kwargs'.")
+        func   = load_function(spec['function'])
+        kwargs = {name : np.asarray(val) if isinstance(val, list) else val
+                  for name, val in (spec.get('kwargs') or {}).items()}
+        func   = functools.partial(func, **kwargs)
+        # Names are used by some samplers' outputs
+        func.__name__ = key
+        return func
+    return load_function(spec)
+
+
+def make_kwargs(config, cfgdir='.'):
+    """
+    Returns the sampler parameters of a configuration, with the functions
+    imported.  Modules are searched for in `cfgdir` and the current
+    directory.
+    """
+    for path in [os.getcwd(), os.path.abspath(cfgdir)]:
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    kwargs = {}
+    for key, val in config.items():
+        if key in RESERVED:
+            continue
+        kwargs[key] = _function(key, val) if key in FUNCTIONS and \
+                      val is not None else val
+    return kwargs
+
+
+def _override(config, items):
+    """
+    Applies the KEY=VALUE overrides of --set to `config`.
+    """
+    for item in items or []:
+        if '=' not in item:
+            raise ValueError("--set expects KEY=VALUE, not " + item + ".")
+        key, val = item.split('=', 1)
+        try:
+            val = json.loads(val)
+        except ValueError:
+            pass
+        config[key] = val
+
+
+def _error(msg):
+    print("lisa: error:", msg, file=sys.stderr)
+    return 2
+
+
+def _setup(alg, kwargs):
+    """
+    Sets up the sampler, or returns None if the algorithm or parameters are
+    invalid.
+    """
+    import lisa
+    try:
+        return lisa.setup(alg, **kwargs)
+    except ImportError as e:
+        _error(e)
+        return None
+    except (TypeError, ValueError) as e:
+        # Unknown parameters are rejected by the sampler's constructor
+        _error("Invalid configuration for " + alg + ": " + str(e))
+        return None
+
+
+def _run(args, config, kwargs):
+    if args.resume:
+        kwargs['resume'] = True
+    samp = _setup(config['alg'], kwargs)
+    if samp is None:
+        return 2
+    try:
+        if args.dry_run:
+            ready = samp.prepare()
+            print("The sampler is ready." if ready else
+                  "The sampler is not prepared; see the messages above.")
+            return 0 if ready else 1
+        ret = samp.run()
+        if getattr(samp, 'bestp', None) is None:
+            return 1
+        if ret is not None and not args.no_plots:
+            samp.make_plots()
+    finally:
+        samp.close()
+    return 0
+
+
+def _batch(args, config, kwargs):
+    from . import batch
+    options = dict(config.get('batch') or {})
+    for key in ['data', 'uncert', 'nproc']:
+        if getattr(args, key) is not None:
+            options[key] = getattr(args, key)
+    if args.rerun:
+        options['rerun'] = True
+    unknown = set(options) - set(inspect.signature(batch.run_batch).parameters)
+    if unknown or {'alg', 'config'} & set(options):
+        return _error("Invalid batch options: " + \
+                      ", ".join(sorted(unknown | {'alg', 'config'} &
+                                       set(options))) + ".")
+    if 'data' not in options:
+        return _error("A batch requires data files, via --data or the " + \
+                      "'data' of the batch table.")
+    try:
+        dfiles = batch.expand(options['data'])
+        ufiles = None if options.get('uncert') is None else \
+                 batch.expand(options['uncert'])
+    except ValueError as e:
+        return _error(e)
+    if args.dry_run:
+        print(len(dfiles), "dataset(s) found.")
+        samp = _setup(config['alg'],
+                      dict(kwargs, data=dfiles[0],
+                           uncert=None if ufiles is None else ufiles[0]))
+        if samp is None:
+            return 2
+        try:
+            ready = samp.prepare()
+        finally:
+            samp.close()
+        print("The sampler is ready." if ready else
+              "The sampler is not prepared; see the messages above.")
+        return 0 if ready else 1
+    rows = batch.run_batch(config['alg'], config=kwargs, **options)
+    return int(any(row['status'] != 'done' for row in rows))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='lisa', description="Runs " + \
+                                     "LISA as described by a " + \
+                                     "configuration file (TOML, YAML, " + \
+                                     "or JSON).")
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+    prun = sub.add_parser('run', help='Run a sampler.')
+    pbat = sub.add_parser('batch', help='Run a sampler on many datasets.')
+    for p in [prun, pbat]:
+        p.add_argument('config', help='Configuration file.')
+        p.add_argument('--dry-run', action='store_true',
+                       help='Only check the configuration and inputs.')
+        p.add_argument('--set', action='append', metavar='KEY=VALUE',
+                       help='Override a parameter of the configuration.')
+    prun.add_argument('--resume', action='store_true',
+                      help='Resume an interrupted run.')
+    prun.add_argument('--no-plots', action='store_true',
+                      help='Do not make the posterior plots.')
+    pbat.add_argument('--data', nargs='+', default=None,
+                      help='Data files (NPY), or glob patterns.')
+    pbat.add_argument('--uncert', nargs='+', default=None,
+                      help='Uncertainties files (NPY), or glob patterns.')
+    pbat.add_argument('--nproc', type=int, default=None,
+                      help='Maximum number of runs at once.')
+    pbat.add_argument('--rerun', action='store_true',
+                      help='Repeat the runs completed earlier.')
+    args = parser.parse_args(argv)
+
+    try:
+        config = read_config(args.config)
+        _override(config, args.set)
+        kwargs = make_kwargs(config, os.path.dirname(args.config) or '.')
+    except (OSError, ValueError) as e:
+        return _error(e)
+    if 'alg' not in config:
+        return _error("The configuration must set 'alg', the sampling " + \
+                      "algorithm.")
+    if args.command == 'run':
+        return _run(args, config, kwargs)
+    return _batch(args, config, kwargs)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
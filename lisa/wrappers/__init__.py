@@ -1,57 +1,85 @@
-__all__ = ['demc_wrapper', 'dnest4_wrapper', 'dream_wrapper', 'dynesty_wrapper', 
-           'helper', 'multinest_wrapper', 'polychord_wrapper', 
-           'snooker_wrapper', 'ultranest_wrapper']
+"""
+Wrappers for the sampling algorithms available in LISA.
 
-import warnings
+Each wrapper imports its sampling package, which can take seconds, so the
+wrappers are only imported when first requested, either via load(alg) or by
+accessing them as attributes (e.g., lisa.wrappers.dynesty_wrapper).
 
+Functions
+---------
+load: imports the wrapper for a sampling algorithm
+"""
+
+__all__ = ['adapter', 'cache', 'chains', 'demc_wrapper', 'diagnostics',
+           'dnest4_wrapper', 'dream_wrapper', 'dynesty_wrapper', 'fingerprint',
+           'helper', 'likelihood', 'modelstore', 'multinest_wrapper',
+           'plotting', 'polychord_wrapper', 'profiling', 'quantiles',
+           'resample', 'result', 'sharedmem', 'snooker_wrapper', 'storage',
+           'streamplots', 'summary', 'textio', 'transform', 'ultranest_wrapper']
+
+import importlib
+
+from . import adapter
+from . import cache
+from . import chains
+from . import diagnostics
+from . import fingerprint
 from . import helper
+from . import likelihood
+from . import modelstore
+from . import plotting
+from . import profiling
+from . import quantiles
+from . import resample
+from . import result
+from . import sharedmem
+from . import storage
+from . import streamplots
+from . import summary
+from . import textio
+from . import transform
+
+# Wrapper module for each sampling algorithm
+ALGORITHMS = {'demc'      : 'demc_wrapper',
+              'dnest4'    : 'dnest4_wrapper',
+              'dream'     : 'dream_wrapper',
+              'dynesty'   : 'dynesty_wrapper',
+              'multinest' : 'multinest_wrapper',
+              'polychord' : 'polychord_wrapper',
+              'snooker'   : 'snooker_wrapper',
+              'ultranest' : 'ultranest_wrapper'}
+
+
+def load(alg):
+    """
+    Imports the wrapper for a sampling algorithm.
+
+    Inputs
+    ------
+    alg: string. Sampling algorithm.  See ALGORITHMS for the options.
 
-try:
-    from . import demc_wrapper
-except:
-    warnings.warn("DEMC wrapper unable to be imported, possible because it is installed.")
-    demc_wrapper = None
-
-try:
-    from . import dnest4_wrapper
-except:
-    warnings.warn("DNest4 wrapper unable to be imported, possibly because it is not installed.")
-    dnest4_wrapper = None
-
-try:
-    from . import dream_wrapper
-except:
-    warnings.warn("DREAM wrapper unable to be imported, possibly because it is not installed.")
-    dream_wrapper = None
-
-try:
-    from . import dynesty_wrapper
-except:
-    warnings.warn("Dynesty wrapper unable to be imported, possibly because it is not installed.")
-    dynesty_wrapper = None
-
-try:
-    from . import multinest_wrapper
-except:
-    warnings.warn("Multinest wrapper unable to be imported, possibly because it is not installed.")
-    multinest_wrapper = None
-
-try:
-    from . import polychord_wrapper
-except:
-    warnings.warn("PolyChord wrapper unable to be imported, possibly because it is not installed.")
-    polychord_wrapper = None
-
-try:
-    from . import snooker_wrapper
-except:
-    warnings.warn("DEMCzs (snooker) wrapper unable to be imported, possibly because it is not installed.")
-    snooker_wrapper = None
-
-try:
-    from . import ultranest_wrapper
-except:
-    warnings.warn("Ultranest wrapper unable to be imported, possibly because it is not installed.")
-    ultranest_wrapper = None
+    Outputs
+    -------
+    The wrapper module for `alg`.
+    """
+    if alg not in ALGORITHMS:
+        raise ValueError("The supplied algorithm does not exist in LISA.\n" + \
+                         "Options: " + ", ".join(sorted(ALGORITHMS)) + \
+                         "\nReceived: " + str(alg))
+    try:
+        return importlib.import_module('.' + ALGORITHMS[alg], __name__)
+    except ImportError as e:
+        raise ImportError("The " + alg + " wrapper could not be imported, " + \
+                          "possibly because it is not installed.\n" + \
+                          str(e)) from e
 
 
+def __getattr__(name):
+    """
+    Imports wrapper modules on first access.
+    """
+    for alg, module in ALGORITHMS.items():
+        if name == module:
+            return load(alg)
+    raise AttributeError("module " + repr(__name__) + \
+                         " has no attribute " + repr(name))
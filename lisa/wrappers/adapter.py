@@ -0,0 +1,161 @@
+"""
+Adapts user functions (priors, log likelihoods) to the calling convention of
+each sampler.
+
+Some samplers evaluate one point per call, others (e.g., UltraNest) a batch
+of points, shape (nbatch, ndim).  A user function is probed once to find
+out which of the two it accepts, and wrapped so that it can be called either
+way: batches are passed to functions that accept them in a single call,
+single points are passed as a batch of one to functions that only accept
+batches, and batches are mapped over a thread or process pool for
+functions that only accept single points.
+
+Functions
+---------
+probe: determines whether a function accepts single points and/or batches
+
+Classes
+-------
+Adapter: wraps a function for single-point and batch calls
+"""
+
+import copy
+import numpy as np
+
+# Types of pool used to map single-point functions over batches
+MAPTYPES = ['thread', 'process']
+
+
+def probe(func, points):
+    """
+    Determines how `func` may be called.
+
+    Inputs
+    ------
+    func  : object. Function of a point, shape (ndim,), or of a batch of
+                    points, shape (nbatch, ndim).
+    points: array.  At least 2 valid points, shape (npoints, ndim).
+
+    Outputs
+    -------
+    batch : bool. Whether `func` evaluates a batch in a single call,
+                  returning one result per point, consistent with single
+                  calls (when those are supported).
+    single: bool. Whether `func` accepts a single point.
+    """
+    points = np.asarray(points)
+    try:
+        single = np.asarray(func(points[0]))
+    except Exception:
+        single = None
+    try:
+        batch = np.asarray(func(points[:2]))
+    except Exception:
+        return False, single is not None
+    if batch.ndim < 1 or batch.shape[0] != 2:
+        return False, single is not None
+    if single is None:
+        return True, False
+    return single.size == batch[0].size and \
+           np.allclose(np.ravel(single), np.ravel(batch[0])), True
+
+
+class Adapter(object):
+    """
+    Wraps a function so that it may be called on single points, via
+    single(), or on batches of points, via batch(), whichever the function
+    itself accepts.
+
+    Functions with a `batch` method (e.g., GaussianLogLike) are called
+    directly for batches, without probing.
+    """
+    def __init__(self, func, points, ncpu=1, maptype='thread'):
+        """
+        Inputs
+        ------
+        func   : object. Function to wrap.
+        points : array.  At least 2 valid points, shape (npoints, ndim), to
+                         probe `func` with.
+        ncpu   : int.    Number of workers used to map `func` over batches,
+                         if it only accepts single points.
+        maptype: string. Type of workers: 'thread' or 'process'.
+        """
+        if maptype not in MAPTYPES:
+            raise ValueError("maptype must be one of: " + \
+                             ", ".join(MAPTYPES) + ".  Received: " + \
+                             str(maptype))
+        self.func    = func
+        self.ncpu    = ncpu
+        self.maptype = maptype
+        self._pool   = None
+        if hasattr(func, 'batch'):
+            self.vectorized, self.scalar = True, True
+            self._batch = func.batch
+        else:
+            self.vectorized, self.scalar = probe(func, points)
+            self._batch = func
+        if not self.vectorized and not self.scalar:
+            raise ValueError("Unable to evaluate " + \
+                             getattr(func, '__name__', repr(func)) + \
+                             " on either a single point or a batch.")
+
+    def single(self, point):
+        """
+        Evaluates the function on a single point.
+        """
+        if self.scalar:
+            return self.func(point)
+        return self._batch(np.asarray(point)[None])[0]
+
+    def batch(self, points):
+        """
+        Evaluates the function on a batch of points.
+        """
+        if self.vectorized:
+            return self._batch(points)
+        if self.ncpu > 1 and len(points) > 1:
+            return np.asarray(list(self._map(points)))
+        return np.asarray([self.func(point) for point in points])
+
+    def _map(self, points):
+        """
+        Maps the function over the points with a pool of `ncpu` workers,
+        created on first use.
+        """
+        if self._pool is None:
+            if self.maptype == 'thread':
+                from concurrent.futures import ThreadPoolExecutor
+                self._pool = ThreadPoolExecutor(self.ncpu)
+            else:
+                import multiprocess as mp
+                self._pool = mp.Pool(self.ncpu)
+        return self._pool.map(self.func, list(points))
+
+    def close(self):
+        """
+        Shuts down the worker pool, if any.
+        """
+        if self._pool is not None:
+            if self.maptype == 'thread':
+                self._pool.shutdown()
+            else:
+                self._pool.close()
+                self._pool.join()
+            self._pool = None
+
+    def share_arrays(self, pool):
+        """
+        Returns a copy whose function has its large arrays in the shared
+        memory of `pool`, a SharedPool.
+        """
+        new        = copy.copy(self)
+        new._pool  = None
+        new.func   = pool.share(self.func)
+        new._batch = pool.share(self._batch)
+        return new
+
+    def __getstate__(self):
+        # Pools cannot be sent to other processes
+        state          = self.__dict__.copy()
+        state['_pool'] = None
+        return state
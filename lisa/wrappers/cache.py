@@ -0,0 +1,275 @@
+"""
+Memoization of expensive functions (log likelihood, forward model) by the
+parameters at which they are evaluated.
+
+Samplers often re-evaluate a function at a point they already visited (e.g.,
+DNest4 perturbations, DE-MC proposals clipped to the boundaries, or resumed
+runs).  Each parameter vector is hashed (blake2b of its float64 bytes), and
+the result of the function is kept in a bounded in-memory tier with least-
+recently-used eviction and, optionally, in an on-disk SQLite tier, which has
+no size limit and persists across runs, so that resumed runs reuse it.
+
+The cache only depends on the parameters and the name of the function, so
+the name must identify the function and its inputs (the samplers include a
+fingerprint of the model, data, and uncertainties in it).  Cached results
+are returned as read-only arrays shared by all hits, so they must not be
+modified in place.
+
+Classes
+-------
+Cache   : two-tier store of results by parameter hash
+Memoized: wraps a function to look up its results in a Cache
+"""
+
+import copy
+import time
+import pickle
+import hashlib
+import sqlite3
+import threading
+import collections
+import numpy as np
+
+# Pending disk insertions are committed after this many insertions, or this
+# many seconds, whichever comes first
+COMMIT_EVERY    = 100
+COMMIT_INTERVAL = 1.
+
+
+def param_key(params, name=''):
+    """
+    Hash of the parameter vector `params` (converted to float64), prefixed by
+    `name` so that different functions can share a Cache.
+    """
+    arr = np.ascontiguousarray(params, dtype=np.float64)
+    h   = hashlib.blake2b(name.encode(), digest_size=16)
+    h.update(str(arr.shape).encode())
+    h.update(arr.tobytes())
+    return h.digest()
+
+
+class Cache(object):
+    """
+    Results of functions by parameter hash, in an in-memory tier of at most
+    `maxsize` entries, evicting the least recently used, and an optional
+    on-disk tier.  Keeps count of the hits and misses.
+    """
+    def __init__(self, maxsize=0, fname=None):
+        """
+        Inputs
+        ------
+        maxsize: int.    Maximum number of results held in memory.  If 0,
+                         only the disk tier is used.
+        fname  : string. Path/to/SQLite file of the disk tier.  If None,
+                         only the memory tier is used.
+        """
+        if maxsize < 0:
+            raise ValueError("The cache size must be non-negative.")
+        self.maxsize   = maxsize
+        self.fname     = fname
+        self.hits      = 0
+        self.disk_hits = 0
+        self.misses    = 0
+        self.evictions = 0
+        self._mem      = collections.OrderedDict()
+        self._conn     = None
+        self._pending  = 0
+        self._commit   = time.time()
+        # Functions may be mapped over threads (see adapter.py)
+        self._lock     = threading.RLock()
+
+    def _db(self):
+        """
+        Returns the connection to the disk tier, opening it if needed.
+        """
+        if self._conn is None:
+            # Workers may share the file, so allow for waiting on locks
+            self._conn = sqlite3.connect(self.fname, timeout=60,
+                                         check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache " + \
+                               "(key BLOB PRIMARY KEY, value BLOB)")
+        return self._conn
+
+    def _remember(self, key, value):
+        if not self.maxsize:
+            return
+        self._mem[key] = value
+        self._mem.move_to_end(key)
+        if len(self._mem) > self.maxsize:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key):
+        """
+        Returns the result stored under `key`, or None if there is none.
+        """
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        if key in self._mem:
+            self._mem.move_to_end(key)
+            self.hits += 1
+            return self._mem[key]
+        if self.fname is not None:
+            row = self._db().execute("SELECT value FROM cache WHERE key=?",
+                                     (key,)).fetchone()
+            if row is not None:
+                value = pickle.loads(row[0])
+                self._remember(key, value)
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """
+        Stores `value`, which must not be None, under `key`.
+        """
+        with self._lock:
+            self._remember(key, value)
+            if self.fname is None:
+                return
+            self._db().execute("INSERT OR REPLACE INTO cache VALUES (?, ?)",
+                               (key, pickle.dumps(value, protocol=-1)))
+            self._pending += 1
+            if self._pending >= COMMIT_EVERY or \
+               time.time() - self._commit > COMMIT_INTERVAL:
+                self.flush()
+
+    def flush(self):
+        """
+        Commits pending insertions to the disk tier.
+        """
+        with self._lock:
+            if self._conn is not None and self._pending:
+                self._conn.commit()
+            self._pending = 0
+            self._commit  = time.time()
+
+    def close(self):
+        """
+        Commits pending insertions and closes the disk tier.  It is reopened
+        if the Cache is used again.
+        """
+        with self._lock:
+            self.flush()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self):
+        """
+        Returns a dictionary of the number of hits (memory and disk), misses,
+        evictions from memory, entries in memory, and the hit rate.
+        """
+        ncalls = self.hits + self.disk_hits + self.misses
+        return {'hits'      : self.hits,
+                'disk_hits' : self.disk_hits,
+                'misses'    : self.misses,
+                'evictions' : self.evictions,
+                'size'      : len(self._mem),
+                'hit_rate'  : (self.hits + self.disk_hits) / ncalls
+                              if ncalls else None}
+
+    def __len__(self):
+        return len(self._mem)
+
+    def __getstate__(self):
+        # Worker processes start with an empty memory tier, and open their
+        # own connection to the disk tier
+        self.flush()
+        state          = self.__dict__.copy()
+        state['_mem']  = collections.OrderedDict()
+        state['_conn'] = None
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+
+def _frozen(value):
+    """
+    Returns `value` as stored in the cache: arrays are copied and made
+    read-only, so that callers cannot alter the cached result.
+    """
+    if isinstance(value, np.ndarray):
+        value = np.array(value)
+        value.flags.writeable = False
+    return value
+
+
+class Memoized(object):
+    """
+    Wraps a function of a parameter vector to look up its results in a
+    Cache.  If `vectorized`, calls on a 2D array are treated as batches of
+    points, and only the points missing from the cache are evaluated, in a
+    single call.  If the function has a `batch` method (e.g.,
+    GaussianLogLike), so does the wrapper.  Calls with other arguments than
+    `args` (e.g., MultiNest's ctypes pointers) are passed through uncached.
+    """
+    def __init__(self, func, cache, name='', args=(), vectorized=False):
+        """
+        Inputs
+        ------
+        func      : object. Function to memoize, called as
+                            func(params, *args).
+        cache     : Cache.  Store of the results.
+        name      : string. Name of the function, distinguishing its results
+                            from those of other functions sharing `cache`.
+        args      : tuple.  Fixed arguments passed after the parameters
+                            (e.g., MC3's indparams).
+        vectorized: bool.   Whether `func` evaluates batches of points.
+        """
+        self.func       = func
+        self.cache      = cache
+        self.name       = name
+        self.args       = tuple(args)
+        self.vectorized = vectorized
+        if hasattr(func, 'batch'):
+            self.batch = Memoized(func.batch, cache, name, args, True)
+
+    def __call__(self, params, *args, **kwargs):
+        if kwargs or len(args) != len(self.args) or \
+           any(a is not b for a, b in zip(args, self.args)):
+            return self.func(params, *args, **kwargs)
+        try:
+            arr = np.asarray(params)
+        except Exception:
+            arr = None
+        if arr is None or arr.dtype.kind not in 'biuf' or arr.ndim > 2 or \
+           (arr.ndim == 2 and not self.vectorized):
+            return self.func(params, *args)
+        if arr.ndim == 2:
+            return self._call_batch(arr, args)
+        key   = param_key(arr, self.name)
+        value = self.cache.get(key)
+        if value is None:
+            value = _frozen(self.func(params, *args))
+            self.cache.put(key, value)
+        return value
+
+    def _call_batch(self, arr, args):
+        keys   = [param_key(row, self.name) for row in arr]
+        values = [self.cache.get(key) for key in keys]
+        imiss  = [i for i, value in enumerate(values) if value is None]
+        if imiss:
+            new = self.func(arr[imiss], *args)
+            for i, value in zip(imiss, new):
+                values[i] = _frozen(value)
+                self.cache.put(keys[i], values[i])
+        return np.array(values)
+
+    def share_arrays(self, pool):
+        """
+        Returns a copy whose function has its large arrays in the shared
+        memory of `pool`, a SharedPool.
+        """
+        new      = copy.copy(self)
+        new.func = pool.share(self.func)
+        if hasattr(self, 'batch'):
+            new.batch = self.batch.share_arrays(pool)
+        return new
@@ -0,0 +1,104 @@
+"""
+Combines per-chain MCMC histories into LISA's posterior layout, with shape
+(npar, nchains * nkeep), where the chains are concatenated one after another.
+
+Functions
+---------
+nkeep       : number of iterations kept per chain
+stack_chains: discards burn-in, thins, and concatenates chains in one pass
+chain_view  : views a stacked posterior as separate chains
+"""
+
+import numpy as np
+
+
+def nkeep(niter, burnin=0, thinning=1):
+    """
+    Computes the number of iterations kept per chain after discarding
+    burn-in and thinning.
+
+    Inputs
+    ------
+    niter   : int. Number of iterations per chain.
+    burnin  : int. Number of initial iterations to discard.
+    thinning: int. Thinning factor (keep every `thinning` iterations).
+
+    Outputs
+    -------
+    Number of iterations kept.
+    """
+    return len(range(burnin, niter, thinning))
+
+
+def _stacked_view(chains, burnin, thinning):
+    """
+    Returns the stacked posterior as a view into `chains`, or None if that
+    is not possible without a copy.
+    """
+    if len(chains) == 1:
+        return np.asarray(chains[0])[burnin::thinning].T
+    if isinstance(chains, np.ndarray) and burnin == 0 and thinning == 1:
+        # (nchains, niter, npar) -> (npar, nchains*niter) merges the chain
+        # and iteration axes, which share a stride pattern
+        view = chains.transpose(2, 0, 1).reshape(chains.shape[2], -1)
+        if np.shares_memory(view, chains):
+            return view
+    return None
+
+
+def stack_chains(chains, burnin=0, thinning=1, out=None, copy=True):
+    """
+    Discards burn-in, thins, and concatenates MCMC chains into a posterior,
+    making a single pass over each chain.
+
+    Inputs
+    ------
+    chains  : list of arrays, or array.  History of each chain, each of
+              shape (niter, npar), e.g., as returned by PyDREAM.
+    burnin  : int.   Number of initial iterations to discard per chain.
+    thinning: int.   Thinning factor (keep every `thinning` iterations).
+    out     : array. Preallocated array of shape (npar, nchains*nkeep) to
+                     hold the posterior.  If None, one is allocated.
+    copy    : bool.  If False, and `out` is None, returns a view into
+                     `chains` when possible (a single chain, or an array of
+                     chains without burn-in or thinning) instead of a copy.
+
+    Outputs
+    -------
+    outp: array. Posterior, shape (npar, nchains*nkeep).
+    """
+    nchains     = len(chains)
+    niter, npar = np.shape(chains[0])
+    nk          = nkeep(niter, burnin, thinning)
+    if not copy and out is None:
+        view = _stacked_view(chains, burnin, thinning)
+        if view is not None:
+            return view
+    if out is None:
+        out = np.empty((npar, nchains*nk), dtype=np.asarray(chains[0]).dtype)
+    elif out.shape != (npar, nchains*nk):
+        raise ValueError("`out` has shape " + str(out.shape) + \
+                         ", but the posterior has shape " + \
+                         str((npar, nchains*nk)) + ".")
+    for c in range(nchains):
+        out[:, c*nk:(c+1)*nk] = np.asarray(chains[c])[burnin::thinning].T
+    return out
+
+
+def chain_view(outp, nchains):
+    """
+    Views a stacked posterior as separate chains.
+
+    Inputs
+    ------
+    outp   : array. Posterior, shape (npar, nchains*nkeep), as returned by
+                    stack_chains().
+    nchains: int.   Number of chains.
+
+    Outputs
+    -------
+    Array of shape (nchains, npar, nkeep).  A view of `outp` when its
+    memory layout allows, otherwise a copy.
+    """
+    npar = outp.shape[0]
+    return outp.reshape(npar, nchains, -1).transpose(1, 0, 2)
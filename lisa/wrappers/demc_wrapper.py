@@ -8,6 +8,7 @@ import sys, os
 import numpy as np
 
 from .helper import BaseSampler
+from . import modelstore
 
 mc3dir = os.path.join(os.path.dirname(__file__), '..', 'modules', 'MCcubed')
 sys.path.append(mc3dir)
@@ -15,14 +16,16 @@ import MCcubed as mc3
 
 
 class Sampler(BaseSampler):
-    def __init__(self, burnin=None, data=None, fbestp='bestp.npy', 
-                       fext='.png', flog='MCMC.log', 
-                       fsavefile='output.npy', fsavemodel=None, 
-                       indparams=[], kll=None, model=None, 
-                       modelper=0, nchains=1, niter=None, 
-                       outputdir=None, pinit=None, pmax=None, 
-                       pmin=None, pnames=None, pstep=None, resume=False, 
-                       thinning=1, truepars=None, uncert=None, verb=0):
+    def __init__(self, burnin=None, cachesize=0, data=None, fbestp='bestp.npy', 
+                       fcache=None, fext='.png', flog='MCMC.log', 
+                       fresult=None, fsavefile='output.npy', fsavemodel=None, 
+                       fsummary='summary.json', indparams=[], invalidate=False, 
+                       kll=None, model=None, modeldtype=None, modelper=0, 
+                       nchains=1, niter=None, outputdir=None, pinit=None, 
+                       plotcpu=1, plotmode='full', pmax=None, pmin=None, 
+                       pnames=None, profile=False, pstep=None, resume=False, 
+                       reuse=False, thinning=1, truepars=None, uncert=None, 
+                       verb=0):
         """
         For details on the inputs, instantiate an object `obj` and call 
         obj.help('parameter'), or see the description in the user manual.
@@ -34,32 +37,46 @@ class Sampler(BaseSampler):
         self.reqpar = ['burnin', 'data', 'model', 'nchains', 'niter', 
                        'outputdir', 'pinit', 'pmax', 'pmin', 'pstep', 
                        'uncert'] #required parameters
-        self.optpar = ['fbestp', 'flog', 'fext', 'fsavefile', 'fsavemodel', 
-                       'indparams', 'kll', 'modelper', 'pnames', 'resume', 
-                       'thinning', 'truepars', 'verb'] #optional parameters
+        self.optpar = ['cachesize', 'fbestp', 'fcache', 'flog', 'fext', 
+                       'fresult', 'fsavefile', 'fsavemodel', 'fsummary', 
+                       'indparams', 'invalidate', 'kll', 'modeldtype', 
+                       'modelper', 'plotcpu', 'plotmode', 'pnames', 'profile', 
+                       'resume', 'reuse', 'thinning', 'truepars', 
+                       'verb'] #optional parameters
         # Only keep help entries relevant to this algorithm
         self.helpinfo = {key : self.helpinfo[key] 
                          for key in self.reqpar+self.optpar}
         # Load supplied parameters
         self.burnin     = burnin
+        self.cachesize  = cachesize
         self.data       = data
         self.fbestp     = fbestp
+        self.fcache     = fcache
         self.fext       = fext
         self.flog       = flog
+        self.fresult    = fresult
         self.fsavefile  = fsavefile
         self.fsavemodel = fsavemodel
         self.model      = model
+        self.fsummary   = fsummary
         self.indparams  = indparams
+        self.invalidate = invalidate
         self.kll        = kll
+        self.modeldtype = modeldtype
+        self.modelper   = modelper
         self.nchains    = nchains
         self.niter      = niter
         self.outputdir  = outputdir
         self.pinit      = pinit
+        self.plotcpu    = plotcpu
+        self.plotmode   = plotmode
         self.pmax       = pmax
         self.pmin       = pmin
         self.pnames     = pnames
+        self.profile    = profile
         self.pstep      = pstep
         self.resume     = resume
+        self.reuse      = reuse
         self.thinning   = thinning
         self.truepars   = truepars
         self.uncert     = uncert
@@ -83,6 +100,8 @@ class Sampler(BaseSampler):
         self.prep_arr('pmax')
         self.prep_arr('pmin')
         self.prep_arr('pstep')
+        # Parameter transform, for use in user code
+        self.make_transform()
         self.prep_arr('uncert')
         # Check positive integers
         self.check_posint('nchains')
@@ -90,17 +109,24 @@ class Sampler(BaseSampler):
         self.check_posint('thinning')
         # Check non-negative integers
         self.check_nonnegint('burnin')
+        self.check_nonnegint('cachesize')
+        self.check_nonnegint('modelper')
         # Check that required arguments are not none
         self.check_none('model')
         # Make sure outputdir is an absolute path & exists
         if self.make_abspath('outputdir'):
             # Now update paths based on that, if needed
             self.update_path('fbestp')
+            self.update_path('fcache')
+            self.update_path('fresult')
             self.update_path('flog')
             self.update_path('fsavefile')
+            self.update_path('fsummary')
             self.update_path('fsavemodel')
         # Ensure proper pnames exist as numpy array
         self.check_pnames()
+        # Check mode of the posterior plots
+        self.check_plotmode()
         # Ready to run?
         if self.unprepared:
             print("Correct the", self.unprepared, 
@@ -115,7 +141,13 @@ class Sampler(BaseSampler):
         """
         Executes the inference
         """
-        if self.prepare():
+        self.start_profile()
+        with self.phase('prepare'):
+            ready = self.prepare()
+        if ready:
+            # Reuse the result of a completed run with the same inputs
+            if self.load_result():
+                return self.make_result()
             # Open the log file
             if self.flog is not None:
                 if self.resume:
@@ -125,35 +157,68 @@ class Sampler(BaseSampler):
                 logfile = open(self.flog, mode)
             else:
                 logfile = None
-            # Run the MCMC
-            self.outp, self.bestp = mc3.mc.mcmc(self.data, 
-                                                self.uncert, 
-                                    func      = self.model, 
-                                    indparams = self.indparams,
-                                    parnames  = self.pnames, 
-                                    params    = self.pinit, 
-                                    pmin      = self.pmin, 
-                                    pmax      = self.pmax, 
-                                    stepsize  = self.pstep,
-                                    numit     = self.niter, 
-                                    burnin    = self.burnin, 
-                                    thinning  = self.thinning, 
-                                    nchains   = self.nchains, 
-                                    walk      = self.alg, 
-                                    plots     = False, 
-                                    leastsq   = False, 
-                                    log       = logfile, 
-                                    savefile  = self.fsavefile,
-                                    savemodel = self.fsavemodel, 
-                                    resume    = self.resume)
+            # MC3 may evaluate all chains in one call
+            model = self.cached('model', self.timed('model', self.model), 
+                                self.indparams, vectorized=None)
+            # Record the evaluated models in a sharded store
+            if self.fsavemodel is not None:
+                if self.resume:
+                    mode = 'a'
+                else:
+                    mode = 'w'
+                # `modelper` iterations per shard, if set
+                shardsize = self.modelper * self.nchains or None
+                store = modelstore.ModelStore(self.fsavemodel, mode=mode, 
+                                              dtype=self.modeldtype, 
+                                              shardsize=shardsize)
+                func  = modelstore.ModelRecorder(model, store, 
+                                                 self.nchains)
+            else:
+                func  = model
+            # save_posterior() writes `fsavefile`; MC3 only needs it to 
+            # resume a previous run
+            if self.resume:
+                savefile = self.fsavefile
+            else:
+                savefile = None
+            with self.phase('sampling'):
+                # Run the MCMC
+                self.outp, self.bestp = mc3.mc.mcmc(self.data, 
+                                                    self.uncert, 
+                                        func      = func, 
+                                        indparams = self.indparams,
+                                        parnames  = self.pnames, 
+                                        params    = self.pinit, 
+                                        pmin      = self.pmin, 
+                                        pmax      = self.pmax, 
+                                        stepsize  = self.pstep,
+                                        numit     = self.niter, 
+                                        burnin    = self.burnin, 
+                                        thinning  = self.thinning, 
+                                        nchains   = self.nchains, 
+                                        walk      = self.alg, 
+                                        plots     = False, 
+                                        leastsq   = False, 
+                                        log       = logfile, 
+                                        savefile  = savefile, 
+                                        savemodel = None, 
+                                        resume    = self.resume)
+            if self.fsavemodel is not None:
+                store.close()
+            # Convergence diagnostics of the post-burn-in chains, which MC3 
+            # returns one after another
+            self.make_diagnostics()
             # Save posterior and bestfit params
-            if self.fsavefile is not None:
-                np.save(self.fsavefile, self.outp)
+            self.save_posterior()
             if self.fbestp is not None:
                 np.save(self.fbestp, self.bestp)
+            self.save_result()
+            self.save_profile()
+            self.flush_cache()
             # Close the log
             if self.flog is not None:
                 logfile.close()
+            return self.make_result()
         else:
             if self.verb:
                 print("Sampler is not fully prepared to run. " + \
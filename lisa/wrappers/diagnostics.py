@@ -0,0 +1,429 @@
+"""
+Convergence diagnostics of MCMC chains, following Vehtari et al. (2021),
+"Rank-normalization, folding, and localization: an improved R-hat for
+assessing convergence of MCMC".
+
+Each chain is split in half, so that trends within a chain show up as
+differences between chains.  Computed for each parameter:
+    rhat    : split-R-hat of the samples
+    rhat_rank: rank-normalized split-R-hat, the maximum of those of the
+               rank-normalized samples (bulk) and of their distance to the
+               median (tails)
+    ess_bulk: effective sample size of the rank-normalized samples
+    ess_tail: effective sample size of the 5% and 95% quantiles (minimum)
+The autocorrelation of every chain and parameter is computed at once with
+FFTs, and summed over lags following Geyer's initial monotone sequence.
+
+Chains are given as an array of shape (nchains, npar, niter) (e.g., as
+returned by chains.chain_view), or a posterior file in LISA's layout, which
+is memory-mapped.  Parameters are processed in blocks, so that only a block
+is held in memory at a time.
+
+During a run, a Monitor checks convergence without re-reading the chains:
+it keeps the mean and sum of squared deviations of each batch of
+consecutive samples of each chain, and merges adjacent batches when there
+are too many, so that its memory does not grow with the run.  From these,
+it computes the split-R-hat (with chains split at a batch boundary) and the
+batch-means ESS of each parameter.  Online diagnostics are not
+rank-normalized, as ranks need all samples.
+
+Classes
+-------
+Monitor: online convergence diagnostics, from running moments
+
+Functions
+---------
+rank_normalize: rank-normalizes samples
+autocov       : autocovariance of each chain, via FFT
+split_rhat    : split-R-hat of each parameter
+split_ess     : effective sample size of each parameter
+diagnose      : computes all the diagnostics of a set of chains
+report        : formats the diagnostics as a table
+"""
+
+import numpy as np
+
+from . import chains as _chains
+from . import storage
+
+# Bytes of samples processed at a time
+BLOCKSIZE  = 2**27
+# Quantiles whose effective sample size gives the tail ESS
+TAIL_PROBS = [0.05, 0.95]
+# Keys of the diagnostics holding one value per parameter
+KEYS       = ['rhat', 'rhat_rank', 'ess_bulk', 'ess_tail']
+# Batches kept per chain by a Monitor: between NBATCH and 2*NBATCH
+NBATCH     = 32
+
+# Coefficients of the rational approximations of the inverse normal CDF
+# (P. J. Acklam), with a relative error below 1.2e-9
+_A = [-3.969683028665376e+01,  2.209460984245205e+02, -2.759285104469687e+02,
+       1.383577518672690e+02, -3.066479806614716e+01,  2.506628277459239e+00]
+_B = [-5.447609879822406e+01,  1.615858368580409e+02, -1.556989798598866e+02,
+       6.680131188771972e+01, -1.328068155288572e+01]
+_C = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+      -2.549732539343734e+00,  4.374664141464968e+00,  2.938163982698783e+00]
+_D = [ 7.784695709041462e-03,  3.224671290700398e-01,  2.445134137142996e+00,
+       3.754408661907416e+00]
+_PLOW = 0.02425
+
+
+def _ndtri(p):
+    """
+    Inverse of the standard normal CDF, for `p` in (0, 1).
+    """
+    p   = np.asarray(p, dtype=np.float64)
+    out = np.empty_like(p)
+    low = p < _PLOW
+    mid = (p >= _PLOW) & (p <= 1 - _PLOW)
+    for mask, sign, pp in [(low, 1, p), (~low & ~mid, -1, 1 - p)]:
+        q = np.sqrt(-2 * np.log(pp[mask]))
+        out[mask] = sign * \
+                    (((((_C[0]*q + _C[1])*q + _C[2])*q + _C[3])*q + _C[4])*q
+                     + _C[5]) / \
+                    ((((_D[0]*q + _D[1])*q + _D[2])*q + _D[3])*q + 1)
+    q = p[mid] - 0.5
+    r = q * q
+    out[mid] = (((((_A[0]*r + _A[1])*r + _A[2])*r + _A[3])*r + _A[4])*r
+                + _A[5]) * q / \
+               (((((_B[0]*r + _B[1])*r + _B[2])*r + _B[3])*r + _B[4])*r + 1)
+    return out
+
+
+def _split(x):
+    """
+    Splits each chain of `x`, shape (nchains, ..., niter), in half, giving
+    shape (2*nchains, ..., niter//2).  The middle sample of chains of odd
+    length is dropped.
+    """
+    half = x.shape[-1] // 2
+    return np.concatenate([x[..., :half], x[..., -half:]], axis=0)
+
+
+def _ranks(x):
+    """
+    Ranks of the samples of each parameter over all chains, from 1, with
+    tied samples (e.g., repeated by rejected steps) given their average
+    rank.  `x` has shape (nchains, npar, niter).
+    """
+    nchains, npar, niter = x.shape
+    flat   = x.transpose(1, 0, 2).reshape(npar, -1)
+    nsamp  = flat.shape[1]
+    order  = np.argsort(flat, axis=1, kind='stable')
+    srt    = np.take_along_axis(flat, order, axis=1)
+    # Groups of equal samples, numbered over all parameters
+    new    = np.ones(srt.shape, dtype=bool)
+    new[:, 1:] = srt[:, 1:] != srt[:, :-1]
+    new    = new.ravel()
+    starts = np.flatnonzero(new)
+    sizes  = np.diff(np.append(starts, new.size))
+    avg    = (starts % nsamp) + (sizes + 1) / 2.
+    ranks  = np.empty(flat.shape)
+    np.put_along_axis(ranks, order,
+                      avg[np.cumsum(new) - 1].reshape(npar, nsamp), axis=1)
+    return ranks.reshape(npar, nchains, niter).transpose(1, 0, 2)
+
+
+def rank_normalize(x):
+    """
+    Rank-normalizes samples `x`, shape (nchains, npar, niter): replaces
+    each by the normal quantile of its (fractional) rank over all chains.
+    """
+    nsamp = x.shape[0] * x.shape[2]
+    return _ndtri((_ranks(x) - 0.375) / (nsamp + 0.25))
+
+
+def autocov(x):
+    """
+    Autocovariance of each chain of `x`, shape (..., niter), along the last
+    axis, for lags 0 to niter-1, computed via FFT.
+    """
+    niter = x.shape[-1]
+    nfft  = 1 << int(2 * niter - 1).bit_length()
+    dev   = x - x.mean(axis=-1, keepdims=True)
+    freq  = np.fft.rfft(dev, n=nfft, axis=-1)
+    acov  = np.fft.irfft(freq * np.conjugate(freq), n=nfft, axis=-1)
+    return acov[..., :niter] / niter
+
+
+def split_rhat(x):
+    """
+    Split-R-hat of each parameter of `x`, shape (nchains, npar, niter).
+    """
+    x     = _split(np.asarray(x, dtype=np.float64))
+    niter = x.shape[-1]
+    means = x.mean(axis=-1)
+    within  = x.var(axis=-1, ddof=1).mean(axis=0)
+    between = niter * means.var(axis=0, ddof=1)
+    varhat  = (niter - 1.) / niter * within + between / niter
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.sqrt(varhat / within)
+
+
+def split_ess(x):
+    """
+    Effective sample size of each parameter of `x`, shape
+    (nchains, npar, niter), from the autocorrelation of the split chains
+    summed over lags up to where Geyer's initial monotone sequence ends.
+    """
+    x       = _split(np.asarray(x, dtype=np.float64))
+    nchains, npar, niter = x.shape
+    acov    = autocov(x)
+    within  = acov[:, :, 0].mean(axis=0) * niter / (niter - 1.)
+    varplus = within * (niter - 1.) / niter + x.mean(axis=-1).var(axis=0,
+                                                                 ddof=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rho = 1 - (within[:, None] - acov.mean(axis=0)) / varplus[:, None]
+    # Sums of consecutive pairs of autocorrelations, truncated before the
+    # first negative one and made nonincreasing
+    npair = niter // 2
+    pairs = rho[:, 0:2*npair:2] + rho[:, 1:2*npair:2]
+    keep  = np.cumprod(pairs >= 0, axis=1).astype(bool)
+    keep[:, 0] = True
+    pairs = np.minimum.accumulate(np.where(keep, pairs, 0), axis=1)
+    tau   = -1 + 2 * np.where(keep, pairs, 0).sum(axis=1)
+    nsamp = nchains * niter
+    tau   = np.maximum(tau, 1 / np.log10(nsamp))
+    with np.errstate(invalid='ignore'):
+        ess = nsamp / tau
+    # Parameters with no spread have no meaningful sample size
+    ess[~(varplus > 0)] = np.nan
+    return ess
+
+
+def _block(x):
+    """
+    Diagnostics of the parameters of `x`, shape (nchains, npar, niter).
+    """
+    x      = np.asarray(x, dtype=np.float64)
+    z      = rank_normalize(x)
+    median = np.median(x, axis=(0, 2))
+    folded = rank_normalize(np.abs(x - median[None, :, None]))
+    qs     = np.quantile(x.transpose(1, 0, 2).reshape(x.shape[1], -1),
+                         TAIL_PROBS, axis=1)
+    tail   = np.min([split_ess((x <= q[None, :, None]).astype(np.float64))
+                     for q in qs], axis=0)
+    return {'rhat'      : split_rhat(x),
+            'rhat_rank' : np.maximum(split_rhat(z), split_rhat(folded)),
+            'ess_bulk'  : split_ess(z),
+            'ess_tail'  : tail}
+
+
+def diagnose(chains, nchains=None, blocksize=BLOCKSIZE):
+    """
+    Computes the convergence diagnostics of MCMC chains.
+
+    Inputs
+    ------
+    chains   : array, or string.  Chains, shape (nchains, npar, niter), or
+                                  path to a posterior file of `nchains`
+                                  chains, shape (npar, nchains*niter),
+                                  which is memory-mapped.
+    nchains  : int.  Number of chains, for a posterior file.
+    blocksize: int.  Bytes of samples processed at a time.  Parameters
+                     are processed in blocks of this size (at least one).
+
+    Outputs
+    -------
+    diag: dict. Split-R-hat (rhat), rank-normalized split-R-hat
+                (rhat_rank), bulk ESS (ess_bulk), and tail ESS (ess_tail)
+                of each parameter, and the number of chains and of
+                iterations per chain.
+    """
+    if isinstance(chains, str):
+        if nchains is None:
+            raise ValueError("The number of chains of " + chains + \
+                             " must be given.")
+        outp = storage.load_posterior(chains)
+        if outp.shape[1] % nchains:
+            raise ValueError(chains + " has " + str(outp.shape[1]) + \
+                             " samples, which cannot be divided into " + \
+                             str(nchains) + " chains.")
+        chains = _chains.chain_view(outp, nchains)
+    if np.ndim(chains) != 3:
+        raise ValueError("Chains must have shape (nchains, npar, niter).")
+    nchains, npar, niter = np.shape(chains)
+    if niter < 4:
+        raise ValueError("At least 4 iterations per chain are needed, " + \
+                         "but there are " + str(niter) + ".")
+    # Parameters per block; each takes several arrays the size of its
+    # samples, and FFTs of twice their length
+    nblock = max(1, blocksize // (8 * nchains * niter))
+    diag   = {key : np.empty(npar) for key in KEYS}
+    for i in range(0, npar, nblock):
+        for key, val in _block(chains[:, i:i+nblock]).items():
+            diag[key][i:i+nblock] = val
+    diag['nchains'] = int(nchains)
+    diag['niter']   = int(niter)
+    return diag
+
+
+def report(diag, pnames=None):
+    """
+    Formats diagnostics `diag`, as returned by diagnose, as a table with
+    one row per parameter.
+    """
+    npar   = len(diag['rhat'])
+    if pnames is None:
+        pnames = ['p' + str(i) for i in range(npar)]
+    pnames = [str(name) for name in pnames]
+    width  = max([len(name) for name in pnames] + [9])
+    lines  = ['Parameter'.ljust(width) + '      Rhat  rank Rhat  ' + \
+              'bulk ESS  tail ESS']
+    for i in range(npar):
+        lines.append(pnames[i].ljust(width) + \
+                     ''.join('%10.4f' % diag[key][i]
+                             for key in ['rhat', 'rhat_rank']) + \
+                     ''.join('%10.0f' % diag[key][i]
+                             for key in ['ess_bulk', 'ess_tail']))
+    return '\n'.join(lines)
+
+
+def _moments(x):
+    """
+    Number of samples, mean, and sum of squared deviations from the mean,
+    along the last axis of `x`.
+    """
+    mean = x.mean(axis=-1)
+    return x.shape[-1], mean, ((x - mean[..., None])**2).sum(axis=-1)
+
+
+def _merge(a, b):
+    """
+    Moments of the union of two sets of samples, from their moments
+    (Chan et al.).
+    """
+    n     = a[0] + b[0]
+    delta = b[1] - a[1]
+    return (n, a[1] + delta * b[0] / n,
+            a[2] + b[2] + delta**2 * a[0] * b[0] / n)
+
+
+class Monitor(object):
+    """
+    Online convergence diagnostics of MCMC chains, from running moments of
+    batches of consecutive samples.  Samples are added with update() as
+    the chains advance; diagnose() and converged() use the full batches.
+    """
+    def __init__(self, nchains, npar, nbatch=NBATCH):
+        """
+        Inputs
+        ------
+        nchains: int. Number of chains.
+        npar   : int. Number of parameters.
+        nbatch : int. Minimum number of batches kept per chain, once there
+                      are enough samples.  Adjacent batches are merged when
+                      there are 2*nbatch.
+        """
+        self.nchains = nchains
+        self.npar    = npar
+        self.nbatch  = nbatch
+        self.size    = 1 # samples per batch
+        self.n       = 0 # samples per chain
+        self.means   = np.empty((nchains, npar, 0))
+        self.m2      = np.empty((nchains, npar, 0))
+        self.partial = None # moments of the samples after the last batch
+
+    def _append(self, means, m2):
+        self.means = np.concatenate([self.means, means], axis=-1)
+        self.m2    = np.concatenate([self.m2,    m2],    axis=-1)
+
+    def _shrink(self):
+        """
+        Merges adjacent batches, doubling their size, until there are fewer
+        than 2*nbatch.
+        """
+        while self.means.shape[-1] >= 2 * self.nbatch:
+            if self.means.shape[-1] % 2:
+                # The last batch joins the samples after it
+                last = (self.size, self.means[..., -1], self.m2[..., -1])
+                self.partial = last if self.partial is None else \
+                               _merge(last, self.partial)
+                self.means   = self.means[..., :-1]
+                self.m2      = self.m2[..., :-1]
+            n, means, m2 = _merge((self.size, self.means[..., 0::2],
+                                   self.m2[..., 0::2]),
+                                  (self.size, self.means[..., 1::2],
+                                   self.m2[..., 1::2]))
+            self.size  = n
+            self.means = means
+            self.m2    = m2
+
+    def update(self, x):
+        """
+        Adds new samples `x`, shape (nchains, npar, nnew), of each chain.
+        """
+        x       = np.asarray(x, dtype=np.float64)
+        self.n += x.shape[-1]
+        if self.partial is not None:
+            # Complete the batch in progress
+            take = x[..., :self.size - self.partial[0]]
+            x    = x[..., take.shape[-1]:]
+            if take.shape[-1]:
+                self.partial = _merge(self.partial, _moments(take))
+            if self.partial[0] < self.size:
+                return
+            self._append(self.partial[1][..., None],
+                         self.partial[2][..., None])
+            self.partial = None
+        nfull = x.shape[-1] // self.size
+        if nfull:
+            blocks = x[..., :nfull*self.size].reshape(self.nchains, self.npar,
+                                                      nfull, self.size)
+            self._append(*_moments(blocks)[1:])
+        if x.shape[-1] > nfull * self.size:
+            self.partial = _moments(x[..., nfull*self.size:])
+        self._shrink()
+
+    def diagnose(self):
+        """
+        Returns the split-R-hat (rhat) and batch-means ESS (ess) of each
+        parameter, and the number of samples per chain they are based on
+        (nsamples), as a dict.  NaN while there are fewer than 4 batches
+        per chain.
+        """
+        nb   = self.means.shape[-1]
+        if nb < 4:
+            return {'rhat'     : np.full(self.npar, np.nan),
+                    'ess'      : np.full(self.npar, np.nan),
+                    'nsamples' : nb * self.size}
+        # Split chains: moments of the first and last halves of the batches
+        half   = nb // 2
+        halves = []
+        for sel in [slice(0, half), slice(nb - half, nb)]:
+            means = self.means[..., sel]
+            mean  = means.mean(axis=-1)
+            m2    = self.m2[..., sel].sum(axis=-1) + self.size * \
+                    ((means - mean[..., None])**2).sum(axis=-1)
+            halves.append((mean, m2))
+        mean    = np.concatenate([h[0] for h in halves], axis=0)
+        m2      = np.concatenate([h[1] for h in halves], axis=0)
+        nhalf   = half * self.size
+        within  = (m2 / (nhalf - 1)).mean(axis=0)
+        between = nhalf * mean.var(axis=0, ddof=1)
+        varhat  = (nhalf - 1.) / nhalf * within + between / nhalf
+        # Batch means of all chains, about their common mean
+        ntot    = self.nchains * nb * self.size
+        grand   = self.means.mean(axis=(0, 2))
+        dev     = self.means - grand[None, :, None]
+        var     = (self.m2.sum(axis=(0, 2)) + self.size * \
+                   (dev**2).sum(axis=(0, 2))) / (ntot - 1)
+        varbm   = (dev**2).sum(axis=(0, 2)) / (self.nchains * nb - 1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rhat = np.sqrt(varhat / within)
+            ess  = np.minimum(ntot * var / (self.size * varbm), ntot)
+        return {'rhat'     : rhat,
+                'ess'      : ess,
+                'nsamples' : nb * self.size}
+
+    def converged(self, rhat_max, min_ess):
+        """
+        Determines whether the split-R-hat of every parameter is below
+        `rhat_max`, and its ESS at least `min_ess` (if not None).  Returns
+        that, and the diagnostics.
+        """
+        diag = self.diagnose()
+        done = bool(np.all(diag['rhat'] < rhat_max))
+        if min_ess is not None:
+            done = done and bool(np.all(diag['ess'] >= min_ess))
+        return done, diag
@@ -1,17 +1,37 @@
 """
 Wrapper for DNest4 algorithm of Brewer & Foreman-Mackey (2018).
 
+uniform_prior: default prior, uniform between pmin and pmax
+
 DNest4_Model: class used as input for DNest4
 
+BinaryBackend: stores DNest4's particles in binary files
+
 Sampler: class to setup and run an inference
 """
 
 import sys, os
+import functools
 import numpy as np
-import matplotlib.pyplot as plt
 import dnest4
 
 from .helper import BaseSampler
+from . import resample as lisa_resample
+from . import storage
+
+# Storage of the particles, see BinaryBackend
+BACKENDS = ['csv', 'binary']
+
+
+def uniform_prior(transform):
+    """
+    Draws the free parameters uniformly between `pmin` and `pmax`.
+
+    Inputs
+    ------
+    transform: ParamTransform. Built by the Sampler from pmin, pmax, pstep.
+    """
+    return transform.unit_to_physical(np.random.uniform(size=transform.nfree))
 
 
 class DNest4_Model(object):
@@ -21,47 +41,174 @@ class DNest4_Model(object):
         self.from_prior     = prior
 
 
+def _as_text_table(arr):
+    """
+    Shapes `arr` as the CSVBackend reads it back from a text file: 1D arrays
+    as one column.
+    """
+    arr = np.asarray(arr)
+    return arr.reshape(-1, 1) if arr.ndim == 1 else np.atleast_2d(arr)
+
+
+class BinaryBackend(object):
+    """
+    DNest4 backend that stores the particles in NPY files in `basedir`,
+    sample.npy and sample_info.npy, appended to through memory maps (see 
+    storage.ArrayWriter), rather than formatting each particle as text as 
+    the CSVBackend does.  The levels are saved to levels.npy.  The results 
+    of postprocessing (weights, posterior samples, etc.) are kept in memory.
+
+    Particles are selected as by the CSVBackend, so that a run with the same 
+    seed gives the same samples.
+    """
+    INFO_DTYPE   = [("level_assignment", int), ("log_likelihood", float), 
+                    ("tiebreaker", float), ("ID", int)]
+    LEVELS_DTYPE = [("log_X", float), ("log_likelihood", float), 
+                    ("tiebreaker", float), ("accepts", int), 
+                    ("tries", int), ("exceeds", int), ("visits", int)]
+
+    def __init__(self, basedir):
+        try:
+            os.makedirs(basedir)
+        except os.error:
+            pass
+        self._samples_filename     = os.path.join(basedir, "sample.npy")
+        self._sample_info_filename = os.path.join(basedir, "sample_info.npy")
+        self._levels_filename      = os.path.join(basedir, "levels.npy")
+        self._samples              = None
+        self._sample_info          = None
+        self.levels                = np.empty(0, dtype=self.LEVELS_DTYPE)
+        self.sample_log_X          = None
+        self.weights               = None
+        self.posterior_samples     = None
+        self.stats                 = None
+
+    def reset(self):
+        self.close()
+        self._samples     = None
+        self._sample_info = storage.ArrayWriter(self._sample_info_filename, 
+                                                self.INFO_DTYPE)
+        self.levels       = np.empty(0, dtype=self.LEVELS_DTYPE)
+
+    def write_particles(self, samples, sample_info):
+        which = np.random.randint(len(samples))
+        if self._samples is None:
+            # The number of parameters is known from the first particles
+            self._samples = storage.ArrayWriter(self._samples_filename, 
+                                                np.float64, 
+                                                (len(samples[which]),))
+        self._samples.append(samples[which])
+        info = sample_info[which]
+        self._sample_info.append(np.array((info["level_assignment"], 
+                                           info["log_likelihood"], 
+                                           info["tiebreaker"], which), 
+                                          dtype=self.INFO_DTYPE))
+
+    def write_levels(self, levels):
+        self.levels = np.array([tuple(level[name] for name, _ in 
+                                      self.LEVELS_DTYPE) for level in levels], 
+                               dtype=self.LEVELS_DTYPE)
+        np.save(self._levels_filename, self.levels)
+
+    def write_sample_log_X(self, sample_log_X):
+        self.sample_log_X = _as_text_table(sample_log_X)
+
+    def write_weights(self, weights):
+        self.weights = _as_text_table(weights)
+
+    def write_posterior_samples(self, samples):
+        self.posterior_samples = np.atleast_2d(samples)
+
+    def write_stats(self, stats):
+        self.stats = {key : float(val) for key, val in stats.items()}
+
+    @property
+    def samples(self):
+        if self._samples is None:
+            return np.empty((0, 0))
+        return self._samples.array()
+
+    @property
+    def sample_info(self):
+        return self._sample_info.array()
+
+    def close(self):
+        """
+        Trims the files of the particles to their contents.
+        """
+        for writer in [self._samples, self._sample_info]:
+            if writer is not None:
+                writer.close()
+
+
 class Sampler(BaseSampler):
-    def __init__(self, beta=100, fbestp='bestp.npy', fext='.png', 
-                       fsavefile='output.npy', kll=None, lam=5, 
-                       loglike=None, model=None, niter=None, 
-                       nlevel=30, nlevelint=10000, nperstep=10000, 
-                       outputdir=None, perturb=None, pnames=None, 
-                       prior=None, pstep=None, resample=100, truepars=None, 
-                       verb=0):
+    def __init__(self, backend='csv', beta=100, cachesize=0, data=None, 
+                       fbestp='bestp.npy', fcache=None, fext='.png', 
+                       fresult=None, fsavefile='output.npy', 
+                       fsummary='summary.json', invalidate=False, kll=None, 
+                       kll_batch=1000, lam=5, loglike=None, model=None, ncpu=1, 
+                       niter=None, nlevel=30, nlevelint=10000, nperstep=10000, 
+                       outputdir=None, perturb=None, pinit=None, plotcpu=1, 
+                       plotmode='full', pmax=None, pmin=None, pnames=None, 
+                       prior=None, profile=False, pstep=None, resample=100, 
+                       resampler='repeat', reuse=False, seed=None, 
+                       truepars=None, uncert=None, verb=0):
         # Instantiate attributes from BaseSampler
         super(Sampler, self).__init__()
         # General info about the algorithm
         self.alg = 'dnest4' #name
-        self.reqpar = ['loglike', 'model', 'niter', 'nlevel', 'nlevelint', 
+        self.reqpar = ['model', 'niter', 'nlevel', 'nlevelint', 
                        'nperstep', 'outputdir', 'perturb', 
-                       'prior', 'pstep'] #required parameters
-        self.optpar = ['beta', 'fbestp', 'fext', 'fsavefile', 
-                       'kll', 'lam', 'pnames', 'resample', 
-                       'truepars', 'verb'] #optional parameters
+                       'pstep'] #required parameters
+        self.optpar = ['backend', 'beta', 'cachesize', 'data', 'fbestp', 
+                       'fcache', 'fext', 'fresult', 'fsavefile', 'fsummary', 
+                       'invalidate', 'kll', 'kll_batch', 'lam', 'loglike', 
+                       'ncpu', 'pinit', 'plotcpu', 'plotmode', 'pmax', 'pmin', 
+                       'pnames', 'prior', 'profile', 'resample', 'resampler', 
+                       'reuse', 'seed', 'truepars', 'uncert', 
+                       'verb'] #optional parameters
         # Only keep help entries relevant to this algorithm
         self.helpinfo = {key : self.helpinfo[key] 
                          for key in self.reqpar+self.optpar}
         # Load supplied parameters
+        self.backend     = backend
         self.beta        = beta
+        self.cachesize   = cachesize
+        self.data        = data
         self.fbestp      = fbestp
+        self.fcache      = fcache
         self.fext        = fext
+        self.fresult     = fresult
         self.fsavefile   = fsavefile
+        self.fsummary    = fsummary
+        self.invalidate  = invalidate
         self.kll         = kll
+        self.kll_batch   = kll_batch
         self.lam         = lam
         self.loglike     = loglike
         self.model       = model
+        self.ncpu        = ncpu
         self.niter       = niter
         self.nlevel      = nlevel
         self.nlevelint   = nlevelint
         self.nperstep    = nperstep
         self.outputdir   = outputdir
         self.perturb     = perturb
+        self.pinit       = pinit
+        self.plotcpu     = plotcpu
+        self.plotmode    = plotmode
+        self.pmax        = pmax
+        self.pmin        = pmin
         self.pnames      = pnames
         self.prior       = prior
+        self.profile     = profile
         self.pstep       = pstep
         self.resample    = resample
+        self.resampler   = resampler
+        self.reuse       = reuse
+        self.seed        = seed
         self.truepars    = truepars
+        self.uncert      = uncert
         self.verb        = verb
         if self.verb:
             print("DNest4 sampler initialized")
@@ -78,7 +225,16 @@ class Sampler(BaseSampler):
         self.unprepared = 0
         # Prepare inputs that may be arrays
         self.prep_arr('pstep')
+        for attr in ['data', 'pinit', 'pmax', 'pmin', 'uncert']:
+            if getattr(self, attr) is not None:
+                self.prep_arr(attr)
+        # Parameter transform, which defines the default prior
+        self.make_transform()
+        # Check non-negative int inputs
+        self.check_nonnegint('cachesize')
         # Check positive int inputs
+        self.check_posint('kll_batch')
+        self.check_posint('ncpu')
         self.check_posint('nlevel')
         self.check_posint('nlevelint')
         self.check_posint('nperstep')
@@ -86,19 +242,44 @@ class Sampler(BaseSampler):
         self.check_nonnegfloat('beta')
         self.check_nonnegfloat('lam')
         self.check_nonnegfloat('resample')
+        # Check storage of the particles
+        if self.backend not in BACKENDS:
+            print("backend must be one of:", ", ".join(BACKENDS))
+            self.unprepared += 1
         # Check that required arguments are not none
+        # Default to the built-in Gaussian log likelihood
+        if self.loglike is None:
+            self.loglike = self.make_loglike()
         self.check_none('loglike')
         self.check_none('model')
         self.check_none('niter')
         self.check_none('perturb')
+        # Default to a uniform prior between pmin and pmax
+        if self.prior is None and self.transform is not None:
+            self.prior = functools.partial(uniform_prior, self.transform)
         self.check_none('prior')
         # Make sure outputdir is an absolute path & exists
         if self.make_abspath('outputdir'):
             # Now update paths based on that, if needed
             self.update_path('fbestp')
+            self.update_path('fcache')
+            self.update_path('fresult')
             self.update_path('fsavefile')
+            self.update_path('fsummary')
         # Ensure proper pnames exist as numpy array
         self.check_pnames()
+        # Check mode of the posterior plots
+        self.check_plotmode()
+        # Check resampling method
+        if self.resampler not in lisa_resample.METHODS:
+            print("resampler must be one of:", 
+                  ", ".join(lisa_resample.METHODS))
+            self.unprepared += 1
+        # Calling conventions of the prior and log likelihood
+        if not self.unprepared:
+            self.make_adapters(prior=False, 
+                               points=np.array([self.prior(), 
+                                                self.prior()]))
         # Ready to run?
         if self.unprepared:
             print("Correct the", self.unprepared, 
@@ -113,58 +294,72 @@ class Sampler(BaseSampler):
         """
         Executes the inference
         """
-        if self.prepare():
+        self.start_profile()
+        with self.phase('prepare'):
+            ready = self.prepare()
+        if ready:
+            # Reuse the result of a completed run with the same inputs
+            if self.load_result():
+                return self.make_result()
             # Set up the inference
-            backend = dnest4.backends.CSVBackend(basedir=self.outputdir, 
-                                                 sep=" ")
-            dns = dnest4.DNest4Sampler(DNest4_Model(loglike=self.loglike, 
-                                                    perturb=self.perturb, 
-                                                    prior=self.prior), 
-                                       backend=backend)
-            # Run it
-            out = dns.sample(max_num_levels=self.nlevel, 
-                             num_steps=self.niter, 
-                             new_level_interval=self.nlevelint, 
-                             num_per_step=self.nperstep, lam=self.lam, 
-                             beta=self.beta)
-            for i, samp in enumerate(out):
-                if self.verb:
-                    print(''.join(['Iteration: ', str(i+1), '/', 
-                                   str(self.niter)]), end='\r')
-            print('')
-            # Best-fit parameters
-            ibest      = np.argmax(backend.sample_info["log_likelihood"])
-            self.bestp = backend.samples[ibest]
-            # Resample for posterior
-            stats = dns.postprocess(resample=self.resample)
-            self.outp = backend.posterior_samples.T
-            """
-            stats = dns.postprocess()
-            # Load the weights to properly estimate the posterior
-            #weights = np.loadtxt(os.path.join(self.outputdir, 'weights.txt'))
-            weights = np.squeeze(backend.weights)
-            wsh     = weights.shape[0]
-            # Remove cases w/ 0 weight
-            samps   = backend.samples
-            samps   = samps  [weights!=0]
-            weights = weights[weights!=0]
-            # As in MultiNest, resample to equal weights by considering 
-            # int(nsamples*weight) repetitions
-            self.outp = []
-            for i in range(len(weights)):
-                self.outp.extend([samps[i] 
-                                  for j in range(int(wsh * weights[i]))])
-            self.outp = np.asarray(self.outp).T
-            """
-            # Quantiles
-            if self.kll is not None:
-                for i in range(self.outp.shape[-1]):
-                    self.kll.update(self.model(self.outp[:,i], fullout=True))
+            if self.backend == 'binary':
+                backend = BinaryBackend(basedir=self.outputdir)
+            else:
+                backend = dnest4.backends.CSVBackend(basedir=self.outputdir, 
+                                                     sep=" ")
+            with self.phase('sampling'):
+                prior   = self.timed('prior', self.prior)
+                dnmodel = DNest4_Model(loglike=self.loglike_adapter.single, 
+                                       perturb=self.perturb, prior=prior)
+                dns     = dnest4.DNest4Sampler(dnmodel, backend=backend)
+                # Run it
+                out = dns.sample(max_num_levels=self.nlevel, 
+                                 num_steps=self.niter, 
+                                 new_level_interval=self.nlevelint, 
+                                 num_per_step=self.nperstep, lam=self.lam, 
+                                 beta=self.beta)
+                for i, samp in enumerate(out):
+                    if self.verb:
+                        print(''.join(['Iteration: ', str(i+1), '/', 
+                                       str(self.niter)]), end='\r')
+                print('')
+            with self.phase('postprocessing'):
+                # Best-fit parameters
+                ibest      = np.argmax(backend.sample_info["log_likelihood"])
+                self.bestp = backend.samples[ibest]
+                # Resample for posterior
+                stats = dns.postprocess(resample=self.resample)
+                self.logz    = stats['log_Z']
+                self.logzerr = stats['log_Z_std']
+                if self.resample:
+                    self.outp = backend.posterior_samples.T
+                else:
+                    # Resample the weighted samples to equal weights, 
+                    # directly into `fsavefile` if set
+                    samps     = backend.samples
+                    weights   = np.squeeze(backend.weights)
+                    index     = lisa_resample.resample_index(weights, 
+                                                method=self.resampler, 
+                                                seed=self.seed)
+                    self.outp = self.alloc_posterior(samps.shape[1], 
+                                                     index.size, 
+                                                     samps.dtype)
+                    lisa_resample.resample_equal(samps, index=index, 
+                                                 out=self.outp)
+                # Copy the best parameters out of the memory map
+                self.bestp = np.array(self.bestp)
+                if self.backend == 'binary':
+                    backend.close()
+            # Model quantiles
+            self.model_quantiles()
             # Save posterior and bestfit params
-            if self.fsavefile is not None:
-                np.save(self.fsavefile, self.outp)
+            self.save_posterior()
             if self.fbestp is not None:
                 np.save(self.fbestp, self.bestp)
+            self.save_result()
+            self.save_profile()
+            self.flush_cache()
+            return self.make_result()
         else:
             if self.verb:
                 print("Sampler is not fully prepared to run. " + \
@@ -5,27 +5,29 @@ as implemented in PyDREAM (https://github.com/LoLab-VU/PyDREAM)
 Sampler: class to setup and run the inference
 """
 
-import sys, os
 import numpy as np
 
 import scipy.stats as ss
 
 from .helper import BaseSampler
+from . import chains
+from . import diagnostics
 from pydream.parameters import SampledParam
 from pydream.core import run_dream
-#for Gelman et al convergence tests
-mc3dir = os.path.join(os.path.dirname(__file__), '..', 'modules', 'MCcubed')
-sys.path.append(mc3dir)
-import MCcubed as mc3
 
 
 
 class Sampler(BaseSampler):
-    def __init__(self, burnin=None, fbestp='output_bestp.npy', fext='.png', 
-                       fprefix='model', fsavefile='output_posterior.npy', 
-                       loglike=None, multitry=5, nchains=3, niter=None, 
-                       outputdir=None, pmax=None, pmin=None, pnames=None, 
-                       pstep=None, resume=False, thinning=1, truepars=None, verb=0):
+    def __init__(self, burnin=None, cachesize=0, checkiter=None, 
+                       fbestp='output_bestp.npy', fcache=None, fext='.png', 
+                       fprefix='model', fresult=None, 
+                       fsavefile='output_posterior.npy', 
+                       fsummary='summary.json', invalidate=False, loglike=None, 
+                       min_ess=500, multitry=5, nchains=3, niter=None, 
+                       outputdir=None, plotcpu=1, plotmode='full', pmax=None, 
+                       pmin=None, pnames=None, profile=False, pstep=None, 
+                       resume=False, reuse=False, rhat_max=1.01, thinning=1, 
+                       truepars=None, verb=0):
         """
         For details on the inputs, instantiate an object `obj` and call 
         obj.help('parameter'), or see the description in the user manual.
@@ -34,11 +36,16 @@ class Sampler(BaseSampler):
         super(Sampler, self).__init__()
         # General info about the algorithm
         self.alg = 'dream' #name
+        # The chains are thinned when they are stacked into the posterior
+        self.outp_thinned = True
         self.reqpar = ['loglike', 'nchains', 'niter', 'outputdir', 
                        'pmax', 'pmin'] # required parameters
-        self.optpar = ['burnin', 'fbestp', 'fext', 'fprefix', 'fsavefile', 
-                       'multitry', 'pnames', 'pstep', 'resume', 'thinning', 
-                       'truepars', 'verb'] #optional
+        self.optpar = ['burnin', 'cachesize', 'checkiter', 'fbestp', 'fcache', 
+                       'fext', 'fprefix', 'fresult', 'fsavefile', 'fsummary', 
+                       'invalidate', 'min_ess', 'multitry', 'plotcpu', 
+                       'plotmode', 'pnames', 'profile', 'pstep', 'resume', 
+                       'reuse', 'rhat_max', 'thinning', 'truepars', 
+                       'verb'] #optional
         # Only keep help entries relevant to this algorithm
         self.helpinfo = {key : self.helpinfo[key] 
                          for key in self.reqpar+self.optpar}
@@ -47,23 +54,35 @@ class Sampler(BaseSampler):
             self.burnin = niter // 2
         else:
             self.burnin = burnin
+        self.cachesize  = cachesize
+        self.checkiter  = checkiter
         self.fbestp     = fbestp
+        self.fcache     = fcache
         self.fext       = fext
+        self.fresult    = fresult
         self.fsavefile  = fsavefile
+        self.fsummary   = fsummary
+        self.invalidate = invalidate
         self.loglike    = loglike
         self.fprefix    = fprefix
+        self.min_ess    = min_ess
         self.multitry   = multitry
         self.nchains    = nchains
         self.niter      = niter
         self.outputdir  = outputdir
+        self.plotcpu    = plotcpu
+        self.plotmode   = plotmode
         self.pmax       = pmax
         self.pmin       = pmin
         self.pnames     = pnames
+        self.profile   = profile
         if pstep is None:
             self.pstep  = np.ones(pmax.size)
         else:
             self.pstep  = pstep
         self.resume     = resume
+        self.reuse      = reuse
+        self.rhat_max   = rhat_max
         self.thinning   = thinning
         self.truepars   = truepars
         self.verb       = verb
@@ -84,22 +103,32 @@ class Sampler(BaseSampler):
         self.prep_arr('pmax')
         self.prep_arr('pmin')
         self.prep_arr('pstep')
+        # Parameter transform, for use in user code
+        self.make_transform()
         # Check positive integers
         self.check_posint('nchains')
         self.check_posint('niter')
         self.check_posint('thinning')
         # Check non-negative integers
         self.check_nonnegint('burnin')
+        self.check_nonnegint('cachesize')
         # Check that required arguments are not none
         self.check_none('loglike')
         # Make sure outputdir is an absolute path & exists
         if self.make_abspath('outputdir'):
             # Now update paths based on that, if needed
             self.update_path('fbestp')
+            self.update_path('fcache')
+            self.update_path('fresult')
             self.update_path('fprefix')
             self.update_path('fsavefile')
+            self.update_path('fsummary')
         # Ensure proper pnames exist as numpy array
         self.check_pnames()
+        # Check mode of the posterior plots
+        self.check_plotmode()
+        # Check the targets of the convergence checks
+        self.check_monitor()
         # Ready to run?
         if self.unprepared:
             print("Correct the", self.unprepared, 
@@ -114,50 +143,97 @@ class Sampler(BaseSampler):
         """
         Executes the inference
         """
-        if self.prepare():
+        self.start_profile()
+        with self.phase('prepare'):
+            ready = self.prepare()
+        if ready:
+            # Reuse the result of a completed run with the same inputs
+            if self.load_result():
+                return self.make_result()
             if self.resume:
                 history_file = self.fprefix + '_DREAM_chain_history.npy'
             else:
                 history_file = False
-            # Run the MCMC
-            history, log_ps = run_dream([SampledParam(ss.uniform, 
-                                                      loc=self.pmin, scale=self.pmax-self.pmin)], 
-                                        self.loglike, niterations=self.niter, nchains=self.nchains, 
-                                        start_random=True, save_history=True, 
-                                        history_file=history_file, 
-                                        multitry=self.multitry, model_name=self.fprefix, 
-                                        verbose=self.verb)
-            history    = np.asarray(history).swapaxes(1,2)
-            log_ps     = np.asarray(log_ps)
-            ibest      = np.where(log_ps == log_ps.max())
-            self.bestp = history[ibest[0][0], :, ibest[1][0]]
-            # Convergence criteria
-            try:
-                convergence = mc3.mc.convergetest(history)
-                print("Rhat convergence metric:")
-                print(convergence)
-            except Exception as e:
-                print("Unable to determine Rhat convergence metric:")
-                print(e)
-            # Sample size
-            try:
-                speis, ess = mc3.mc.ess(history)
-                print("Steps per effective independent sample:")
-                print(speis)
-                print("Effective sample size:")
-                print(ess)
-            except Exception as e:
-                print("Unable to determine effective sample size:")
-                print(e)
-            # Stack the posterior
-            self.outp = history[0, :, self.burnin:]
-            for i in range(1, self.nchains):
-                self.outp = np.hstack((self.outp, history[i, :, self.burnin:]))
+            loglike = self.cached('loglike', 
+                                  self.timed('loglike', self.loglike))
+            prior   = SampledParam(ss.uniform, loc=self.pmin, 
+                                   scale=self.pmax-self.pmin)
+            # Convergence monitor of the post-burn-in chains, if `checkiter` 
+            # is set.  The run is then made of segments, each restarting 
+            # the chains where the previous one left them
+            if self.checkiter is not None:
+                monitor = diagnostics.Monitor(self.nchains, self.pmin.size)
+            segs  = []
+            ndone = 0 # iterations run
+            for nseg in self.segments(self.burnin):
+                with self.phase('sampling'):
+                    # Run the MCMC
+                    if not segs:
+                        history, log_ps = run_dream([prior], loglike, 
+                                                    niterations=nseg, 
+                                                    nchains=self.nchains, 
+                                                    start_random=True, 
+                                                    save_history=True, 
+                                                    history_file=history_file, 
+                                                    multitry=self.multitry, 
+                                                    model_name=self.fprefix, 
+                                                    verbose=self.verb)
+                    else:
+                        start = [hist[-1] for hist in segs[-1][0]]
+                        history, log_ps = run_dream([prior], loglike, 
+                                                    niterations=nseg, 
+                                                    nchains=self.nchains, 
+                                                    start=start, 
+                                                    restart=True, 
+                                                    save_history=True, 
+                                                    multitry=self.multitry, 
+                                                    model_name=self.fprefix, 
+                                                    verbose=self.verb)
+                segs.append((history, log_ps))
+                if self.checkiter is not None:
+                    # Iterations of this segment after the burn-in
+                    skip   = max(self.burnin - ndone, 0)
+                    update = np.array([np.asarray(hist)[skip:].T 
+                                       for hist in history])
+                    monitor.update(update)
+                    self.check_convergence(monitor, ndone + nseg)
+                ndone += nseg
+            if len(segs) > 1:
+                history = [np.concatenate([seg[0][c] for seg in segs]) 
+                           for c in range(self.nchains)]
+                log_ps  = [np.concatenate([np.ravel(seg[1][c]) 
+                                           for seg in segs]) 
+                           for c in range(self.nchains)]
+            with self.phase('postprocessing'):
+                # Best-fit parameters, found without converting the full 
+                # history
+                log_ps     = [np.ravel(log_p) for log_p in log_ps]
+                ichain     = np.argmax([log_p.max() for log_p in log_ps])
+                ibest      = np.argmax(log_ps[ichain])
+                self.bestp = np.array(history[ichain][ibest])
+                # Discard burn-in, thin, and stack the chains in a single pass, 
+                # directly into `fsavefile` if set.  Otherwise, the history is 
+                # not used afterwards, so a view of it suffices
+                out = None
+                if self.fsavefile is not None:
+                    niter, npar = np.shape(history[0])
+                    nkeep       = chains.nkeep(niter, self.burnin, 
+                                               self.thinning)
+                    out         = self.alloc_posterior(npar, 
+                                                       self.nchains * nkeep)
+                self.outp  = chains.stack_chains(history, burnin=self.burnin, 
+                                                 thinning=self.thinning, 
+                                                 out=out, copy=False)
+            # Convergence diagnostics of the post-burn-in chains
+            self.make_diagnostics()
             # Save posterior and bestfit params
-            if self.fsavefile is not None:
-                np.save(self.fsavefile, self.outp)
+            self.save_posterior()
             if self.fbestp is not None:
                 np.save(self.fbestp, self.bestp)
+            self.save_result()
+            self.save_profile()
+            self.flush_cache()
+            return self.make_result()
         else:
             if self.verb:
                 print("Sampler is not fully prepared to run. " + \
@@ -5,25 +5,29 @@ Sampler: class to setup and run an inference
 """
 
 import sys, os
-import multiprocess as mp
 import numpy as np
-import matplotlib.pyplot as plt
 import pickle
 
 import dynesty
 
 from .helper import BaseSampler
+from . import resample
 
 
 class Sampler(BaseSampler):
-    def __init__(self, bound='multi', dlogz=0.1, fbestp='bestp.npy', 
-                       fext='.png', fsavefile='output.npy', kll=None, 
-                       loglike=None, min_ess=500, model=None, nchains=1, 
-                       niter=None, nlive=500, nlive_batch=500, outputdir=None, 
-                       pnames=None, prior=None, pstep=None, 
-                       periodic=None, reflective=None, sample='auto', 
-                       truepars=None, fcheckpoint='dynesty.save', fresults='results.pkl',
-                       resume=False, verb=0):
+    def __init__(self, bound='multi', cachesize=0, data=None, dlogz=0.1, 
+                       fbestp='bestp.npy', fcache=None, fext='.png', 
+                       fresult=None, fsavefile='output.npy', 
+                       fsummary='summary.json', invalidate=False, kll=None, 
+                       kll_batch=1000, loglike=None, min_ess=500, model=None, 
+                       nchains=1, ncpu=1, niter=None, nlive=500, 
+                       nlive_batch=500, outputdir=None, pinit=None, plotcpu=1, 
+                       plotmode='full', pmax=None, pmin=None, pnames=None, 
+                       prior=None, profile=False, pstep=None, periodic=None, 
+                       reflective=None, resampler='repeat', reuse=False, 
+                       sample='auto', seed=None, truepars=None, 
+                       fcheckpoint='dynesty.save', fresults='results.pkl', 
+                       resume=False, uncert=None, verb=0):
         """
         For details on the inputs, instantiate an object `obj` and call 
         obj.help('parameter'), or see the description in the user manual.
@@ -32,40 +36,62 @@ class Sampler(BaseSampler):
         super(Sampler, self).__init__()
         # General info about the algorithm
         self.alg = 'dynesty' #name
-        self.reqpar = ['loglike', 'model', 'nlive', 'nlive_batch', 'outputdir', 
-                       'prior', 'pstep'] #required parameters
-        self.optpar = ['bound', 'dlogz', 'fbestp', 'fext', 'fsavefile', 
-                       'kll', 'min_ess', 'niter', 'pnames', 
-                       'periodic', 'reflective', 'sample', 
-                       'truepars', 'fcheckpoint', 'resume', 'verb'] #optional parameters
+        self.reqpar = ['model', 'nlive', 'nlive_batch', 'outputdir', 
+                       'pstep'] #required parameters
+        self.optpar = ['bound', 'cachesize', 'data', 'dlogz', 'fbestp', 
+                       'fcache', 'fext', 'fresult', 'fsavefile', 'fsummary', 
+                       'invalidate', 'kll', 'kll_batch', 'loglike', 'min_ess', 
+                       'ncpu', 'niter', 'pinit', 'plotcpu', 'plotmode', 'pmax', 
+                       'pmin', 'pnames', 'prior', 'profile', 'periodic', 
+                       'reflective', 'resampler', 'reuse', 'sample', 'seed', 
+                       'truepars', 'fcheckpoint', 'resume', 'uncert', 
+                       'verb'] #optional parameters
         # Only keep help entries relevant to this algorithm
         self.helpinfo = {key : self.helpinfo[key] 
                          for key in self.reqpar+self.optpar}
         # Load supplied parameters
         self.bound       = bound
+        self.cachesize   = cachesize
+        self.data        = data
         self.dlogz       = dlogz
         self.fbestp      = fbestp
+        self.fcache      = fcache
         self.fext        = fext
+        self.fresult     = fresult
         self.fsavefile   = fsavefile
+        self.fsummary    = fsummary
+        self.invalidate  = invalidate
         self.kll         = kll
+        self.kll_batch   = kll_batch
         self.loglike     = loglike
         self.min_ess     = min_ess
         self.model       = model
         self.nchains     = nchains
+        self.ncpu        = ncpu
         self.niter       = niter
         self.nlive       = nlive
         self.nlive_batch = nlive_batch
         self.outputdir   = outputdir
+        self.pinit       = pinit
+        self.plotcpu     = plotcpu
+        self.plotmode    = plotmode
+        self.pmax        = pmax
+        self.pmin        = pmin
         self.pnames      = pnames
         self.prior       = prior
+        self.profile     = profile
         self.pstep       = pstep
         self.periodic    = periodic
         self.reflective  = reflective
+        self.resampler   = resampler
+        self.reuse       = reuse
         self.sample      = sample
+        self.seed        = seed
         self.truepars    = truepars
         self.fcheckpoint = fcheckpoint
         self.fresults    = fresults
         self.resume      = resume
+        self.uncert      = uncert
         self.verb        = verb
         if self.verb:
             print("dynesty sampler initialized")
@@ -82,22 +108,40 @@ class Sampler(BaseSampler):
         self.unprepared = 0
         # Prepare inputs that may be arrays
         self.prep_arr('pstep')
+        for attr in ['data', 'pinit', 'pmax', 'pmin', 'uncert']:
+            if getattr(self, attr) is not None:
+                self.prep_arr(attr)
+        # Parameter transform, which defines the default prior
+        self.make_transform()
         # Check non-negative float inputs
         self.check_nonnegfloat('dlogz')
+        # Check non-negative int inputs
+        self.check_nonnegint('cachesize')
         # Check positive int inputs
+        self.check_posint('kll_batch')
         self.check_posint('min_ess')
         self.check_posint('nchains')
+        self.check_posint('ncpu')
         self.check_posint('nlive')
         self.check_posint('nlive_batch')
         # Check that required arguments are not none
+        # Default to the built-in Gaussian log likelihood
+        if self.loglike is None:
+            self.loglike = self.make_loglike()
         self.check_none('loglike')
         self.check_none('model')
+        # Default to a uniform prior between pmin and pmax
+        if self.prior is None and self.transform is not None:
+            self.prior = self.transform.unit_to_physical
         self.check_none('prior')
         # Make sure outputdir is an absolute path & exists
         if self.make_abspath('outputdir'):
             # Now update paths based on that, if needed
             self.update_path('fbestp')
+            self.update_path('fcache')
+            self.update_path('fresult')
             self.update_path('fsavefile')
+            self.update_path('fsummary')
             self.update_path('fcheckpoint')
             self.update_path('fresults')
             if not self.resume and os.path.exists(self.fcheckpoint):
@@ -105,6 +149,12 @@ class Sampler(BaseSampler):
                 self.unprepared += 1
         # Ensure proper pnames exist as numpy array
         self.check_pnames()
+        # Check mode of the posterior plots
+        self.check_plotmode()
+        # Check resampling method
+        if self.resampler not in resample.METHODS:
+            print("resampler must be one of:", ", ".join(resample.METHODS))
+            self.unprepared += 1
         # Check periodic/reflective are valid
         for attr_name in ["periodic", "reflective"]:
             attr_value = getattr(self, attr_name)
@@ -125,6 +175,9 @@ class Sampler(BaseSampler):
                     print(f"{attr_name} must be indices < the number of parameters. "
                           f"Received maximum of {maxp}, but there are {len(self.pnames)} parameters.")
                     self.unprepared += 1
+        # Calling conventions of the prior and log likelihood
+        if not self.unprepared:
+            self.make_adapters()
         # Ready to run?
         if self.unprepared:
             print("Correct the", self.unprepared, 
@@ -139,72 +192,87 @@ class Sampler(BaseSampler):
         """
         Executes the inference
         """
-        if self.prepare():
+        self.start_profile()
+        with self.phase('prepare'):
+            ready = self.prepare()
+        if ready:
+            # Reuse the result of a completed run with the same inputs
+            if self.load_result():
+                return self.make_result()
             # Setup the inference
             ndim = np.sum(self.pstep > 0)
+            # Evaluate the prior and log likelihood per point
+            loglike = self.loglike_adapter.single
+            prior   = self.prior_adapter.single
             if self.nchains > 1:
-                p = mp.Pool(self.nchains)
+                # Workers are reused across runs, and receive large arrays 
+                # (e.g., data) through shared memory rather than pickles
+                pool       = self.worker_pool(self.nchains)
+                loglike    = pool.share(loglike)
+                prior      = pool.share(prior)
+                p          = pool.pool
                 queue_size = self.nchains
             else:
                 p = None
                 queue_size = 1
-            if not self.resume:
-                dy = dynesty.DynamicNestedSampler(self.loglike, 
-                                                  self.prior, 
-                                                  ndim, 
-                                                  bound=self.bound, 
-                                                  sample=self.sample, 
-                                                  periodic=self.periodic,
-                                                  reflective=self.reflective,
-                                                  queue_size=self.nchains, 
-                                                  pool=p)
-            else:
-                dy = dynesty.NestedSampler.restore(self.fcheckpoint, pool=p)
+            with self.phase('sampling'):
+                if not self.resume:
+                    dy = dynesty.DynamicNestedSampler(loglike, prior, ndim, 
+                                                bound=self.bound, 
+                                                sample=self.sample, 
+                                                periodic=self.periodic,
+                                                reflective=self.reflective,
+                                                queue_size=self.nchains, 
+                                                pool=p)
+                else:
+                    dy = dynesty.NestedSampler.restore(self.fcheckpoint, 
+                                                       pool=p)
 
-            # Run it
-            dy.run_nested(nlive_init=self.nlive, 
-                          nlive_batch=self.nlive_batch, 
-                          maxiter=self.niter, dlogz_init=self.dlogz, 
-                          n_effective=self.min_ess, 
-                          checkpoint_file=self.fcheckpoint, 
-                          resume=self.resume)
-            results = dy.results
-            with open(self.fresults, "wb") as f:
-                pickle.dump(results, f)
-            print(results.summary())
+                # Run it
+                dy.run_nested(nlive_init=self.nlive, 
+                              nlive_batch=self.nlive_batch, 
+                              maxiter=self.niter, dlogz_init=self.dlogz, 
+                              n_effective=self.min_ess, 
+                              checkpoint_file=self.fcheckpoint, 
+                              resume=self.resume)
+                results = dy.results
+                with open(self.fresults, "wb") as f:
+                    pickle.dump(results, f)
+                print(results.summary())
+                self.logz    = results['logz'][-1]
+                self.logzerr = results['logzerr'][-1]
 
             # Posterior and best parameters
-            self.bestp = results["samples"][np.argmax(results["logl"])]
-            samps      = results["samples"]
-            nsamp      = samps.shape[0]
-            # From cornerplot in dynesty/plotting.py 
-            try:
-                weights = np.exp(results['logwt'] - results['logz'][-1])
-            except:
-                weights = results['weights']
-            # Remove cases w/ 0 weight
-            samps   = samps  [weights!=0]
-            weights = weights[weights!=0]
+            with self.phase('postprocessing'):
+                self.bestp = results["samples"][np.argmax(results["logl"])]
+                samps      = results["samples"]
+                nsamp      = samps.shape[0]
+                # From cornerplot in dynesty/plotting.py 
+                try:
+                    weights = np.exp(results['logwt'] - results['logz'][-1])
+                except:
+                    weights = results['weights']
 
-            # As in MultiNest, resample to equal weights by considering 
-            # int(nsamples*weight) repetitions
-            self.outp = []
-            for i in range(len(weights)):
-                self.outp.extend([samps[i] 
-                                  for j in range(int(nsamp * weights[i]))])
-            self.outp = np.asarray(self.outp)
+                # Resample to equal weights, directly into `fsavefile`
+                index     = resample.resample_index(weights, nsamp=nsamp, 
+                                                    method=self.resampler, 
+                                                    seed=self.seed)
+                self.outp = self.alloc_posterior(samps.shape[1], index.size, 
+                                                 samps.dtype)
+                resample.resample_equal(samps, index=index, out=self.outp)
+                self.logl = results['logl'][index]
 
-            if self.kll is not None:
-                for i in range(self.outp.shape[0]):
-                    self.kll.update(self.model(self.outp[i], fullout=True))
-            self.outp = self.outp.T
+            # Model quantiles
+            self.model_quantiles()
 
             # Save posterior and bestfit params
-            if self.fsavefile is not None:
-                np.save(self.fsavefile, self.outp)
+            self.save_posterior()
             if self.fbestp is not None:
                 np.save(self.fbestp, self.bestp)
-            return self.outp, self.bestp
+            self.save_result()
+            self.save_profile()
+            self.flush_cache()
+            return self.make_result()
         else:
             if self.verb:
                 print("Sampler is not fully prepared to run. " + \
@@ -0,0 +1,267 @@
+"""
+Fingerprints of a sampler's inputs, and records of completed runs by
+fingerprint, so that a run with identical inputs can reuse the result of a
+previous one instead of sampling again.
+
+The fingerprint is a blake2b hash of the sampler's settings and input
+arrays, and of the functions it is given: their code, default arguments,
+closures, the global variables they refer to, and the state of callable
+objects (e.g., GaussianLogLike, via __getstate__).  Results of a run are
+recorded in `outputdir` as result_<fingerprint>.json, which holds the best
+parameters and log evidence, and points to the posterior file (fsavefile,
+or result_<fingerprint>.npy if that is None).
+
+Functions whose results depend on state that is not visible from the
+function itself (e.g., files they read, or attributes of imported modules)
+may change without changing the fingerprint; remove the records, or run
+with invalidate=True, when that happens.
+
+Functions
+---------
+fingerprint: hash of an object, including the code of functions
+record     : records a completed run
+lookup     : loads the result of a recorded run
+forget     : removes the record of a run
+"""
+
+import os
+import json
+import types
+import pickle
+import hashlib
+import functools
+import numpy as np
+
+from . import storage
+
+# Prefix of the files recording completed runs
+PREFIX = 'result_'
+# Sampler parameters that do not affect the result, and so are left out
+# of its fingerprint
+IGNORED = ['algplots', 'backend', 'cachesize', 'fcache', 'fext', 'fresult',
+           'fsummary', 'invalidate', 'kll', 'kll_batch', 'maptype', 'ncpu',
+           'plotcpu', 'plotmode', 'profile', 'resume', 'reuse', 'truepars',
+           'verb']
+
+
+class _Hasher(object):
+    """
+    Feeds objects into a blake2b hash.  Objects already fed are referred to
+    by their order, so that shared and self-referencing objects are handled.
+    """
+    def __init__(self):
+        self.h    = hashlib.blake2b(digest_size=16)
+        self.memo = {}
+        self.keep = [] # keeps objects alive, so that their ids are unique
+
+    def tag(self, *parts):
+        self.h.update('|'.join(str(part) for part in parts).encode())
+
+    def feed(self, obj):
+        if obj is None or isinstance(obj, (bool, int, float, complex, str)):
+            self.tag(type(obj).__name__, repr(obj))
+            return
+        if isinstance(obj, bytes):
+            self.tag('bytes', len(obj))
+            self.h.update(obj)
+            return
+        if id(obj) in self.memo:
+            self.tag('ref', self.memo[id(obj)])
+            return
+        self.memo[id(obj)] = len(self.memo)
+        self.keep.append(obj)
+        if isinstance(obj, np.generic):
+            obj = np.asarray(obj)
+        if isinstance(obj, np.ndarray):
+            self.tag('ndarray', obj.dtype.str, obj.shape)
+            if obj.dtype.hasobject:
+                self.feed(obj.tolist())
+            else:
+                self.h.update(np.ascontiguousarray(obj).data)
+        elif isinstance(obj, (list, tuple)):
+            self.tag(type(obj).__name__, len(obj))
+            for item in obj:
+                self.feed(item)
+        elif isinstance(obj, dict):
+            self.tag('dict', len(obj))
+            for key in sorted(obj, key=repr):
+                self.feed(key)
+                self.feed(obj[key])
+        elif isinstance(obj, (set, frozenset)):
+            self.tag('set', len(obj))
+            for item in sorted(obj, key=repr):
+                self.feed(item)
+        elif isinstance(obj, functools.partial):
+            self.tag('partial')
+            self.feed(obj.func)
+            self.feed(obj.args)
+            self.feed(obj.keywords)
+        elif isinstance(obj, types.MethodType):
+            self.tag('method')
+            self.feed(obj.__func__)
+            self.feed(obj.__self__)
+        elif isinstance(obj, types.FunctionType):
+            self._feed_function(obj)
+        elif isinstance(obj, types.CodeType):
+            self._feed_code(obj)
+        elif isinstance(obj, types.ModuleType):
+            self.tag('module', obj.__name__)
+        elif isinstance(obj, (types.BuiltinFunctionType, np.ufunc, type)):
+            self._feed_named(obj)
+        elif hasattr(obj, '__dict__') or hasattr(obj, '__getstate__'):
+            self.tag('object')
+            self._feed_named(type(obj))
+            try:
+                state = obj.__getstate__() if hasattr(obj, '__getstate__') \
+                        else vars(obj)
+            except TypeError:
+                raise ValueError("Unable to fingerprint an object of type " + \
+                                 type(obj).__name__ + ".")
+            self.feed(state)
+        else:
+            try:
+                data = pickle.dumps(obj, protocol=4)
+            except Exception:
+                raise ValueError("Unable to fingerprint an object of type " + \
+                                 type(obj).__name__ + ".")
+            self.tag('pickle')
+            self.h.update(data)
+
+    def _feed_named(self, obj):
+        module = getattr(obj, '__module__', None)
+        self.tag('named', module, getattr(obj, '__qualname__',
+                                          getattr(obj, '__name__', '')))
+        # Classes defined outside of installed packages may change between
+        # runs, so their methods are fingerprinted too
+        if isinstance(obj, type) and module not in (None, 'builtins') and \
+           module.split('.')[0] not in ('numpy', 'scipy'):
+            for name, attr in sorted(vars(obj).items()):
+                if isinstance(attr, (types.FunctionType, staticmethod,
+                                     classmethod)):
+                    self.feed(name)
+                    self.feed(getattr(attr, '__func__', attr))
+
+    def _feed_code(self, code):
+        self.tag('code', code.co_name, code.co_argcount, code.co_names,
+                 code.co_varnames)
+        self.h.update(code.co_code)
+        self.feed(code.co_consts)
+
+    def _feed_function(self, func):
+        self.tag('function', func.__module__, func.__qualname__)
+        self._feed_code(func.__code__)
+        self.feed(func.__defaults__)
+        self.feed(func.__kwdefaults__)
+        if func.__closure__:
+            self.feed([cell.cell_contents for cell in func.__closure__])
+        # Global variables that the function refers to
+        refs = {name : func.__globals__[name]
+                for name in _global_names(func.__code__)
+                if name in func.__globals__}
+        self.feed(refs)
+
+
+def _global_names(code):
+    """
+    Names of the global variables (or attributes) that `code` and the code
+    nested within it refer to.
+    """
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _global_names(const)
+    return names
+
+
+def fingerprint(obj):
+    """
+    Returns the fingerprint of `obj` as a hexadecimal string.  Raises a
+    ValueError if some part of `obj` cannot be fingerprinted.
+    """
+    hasher = _Hasher()
+    hasher.feed(obj)
+    return hasher.h.hexdigest()
+
+
+def _fname(outputdir, fprint):
+    return os.path.join(outputdir, PREFIX + fprint + '.json')
+
+
+def _stat(fname):
+    stat = os.stat(fname)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def record(outputdir, fprint, outp, bestp, fsavefile=None, logz=None,
+           logzerr=None):
+    """
+    Records a completed run.
+
+    Inputs
+    ------
+    outputdir: string. Directory of the record.
+    fprint   : string. Fingerprint of the run's inputs.
+    outp     : array.  Posterior, shape (npar, nsamples).
+    bestp    : array.  Best parameters.
+    fsavefile: string. File where `outp` is saved.  If None, it is saved
+                       alongside the record.
+    logz     : float.  Log evidence, if any.
+    logzerr  : float.  Uncertainty of `logz`, if any.
+    """
+    if fsavefile is None:
+        fsavefile = os.path.join(outputdir, PREFIX + fprint)
+        with storage.PosteriorWriter(fsavefile, outp.shape[0],
+                                     outp.dtype) as writer:
+            writer.write(outp)
+    fsavefile = storage.npy_name(fsavefile)
+    rec = {'fingerprint' : fprint,
+           'fsavefile'   : fsavefile,
+           'stat'        : _stat(fsavefile),
+           'bestp'       : np.asarray(bestp, dtype=float).tolist(),
+           'logz'        : None if logz    is None else float(logz),
+           'logzerr'     : None if logzerr is None else float(logzerr)}
+    # Written to a temporary file first, so that an interrupted write does
+    # not leave a partial record
+    fname = _fname(outputdir, fprint)
+    with open(fname + '.tmp', 'w') as f:
+        json.dump(rec, f, indent=1)
+    os.replace(fname + '.tmp', fname)
+
+
+def lookup(outputdir, fprint):
+    """
+    Loads the result of the run recorded for `fprint` in `outputdir`.
+
+    Outputs
+    -------
+    result: dict. outp (read-only memory map), bestp, logz, and logzerr.
+                  None if there is no record, or if the posterior file was
+                  changed since it was recorded.
+    """
+    fname = _fname(outputdir, fprint)
+    if not os.path.exists(fname):
+        return None
+    try:
+        with open(fname, 'r') as f:
+            rec = json.load(f)
+        if rec['fingerprint'] != fprint or \
+           _stat(rec['fsavefile']) != rec['stat']:
+            return None
+        outp = storage.load_posterior(rec['fsavefile'])
+    except (OSError, ValueError, KeyError):
+        return None
+    return {'outp'    : outp,
+            'bestp'   : np.array(rec['bestp']),
+            'logz'    : rec['logz'],
+            'logzerr' : rec['logzerr']}
+
+
+def forget(outputdir, fprint):
+    """
+    Removes the record of the run for `fprint` in `outputdir`, and its
+    posterior file if it was saved alongside the record.
+    """
+    for fname in [_fname(outputdir, fprint),
+                  os.path.join(outputdir, PREFIX + fprint + '.npy')]:
+        if os.path.exists(fname):
+            os.remove(fname)
@@ -1,12 +1,42 @@
 import sys, os
+import copy
+import time
+import functools
+import contextlib
 import six
 import numpy as np
 
-mcpdir = os.path.join(os.path.dirname(__file__), '..', 'modules', 'MCcubed', 
-                                                       'MCcubed', 'plots')
-sys.path.append(mcpdir)
-sys.path.append(os.path.join(mcpdir, '..', 'lib')) # so that mcplots finds binarray
-import mcplots as mcp
+from . import adapter
+from . import cache
+from . import chains
+from . import diagnostics
+from . import fingerprint
+from . import plotting
+from . import profiling
+from . import quantiles
+from . import result
+from . import sharedmem
+from . import storage
+from . import streamplots
+from . import summary
+from .likelihood import GaussianLogLike
+from .transform import ParamTransform
+from .._version import __version__
+
+
+def import_mcplots():
+    """
+    Imports MC3's plotting module.  It pulls in Matplotlib, so it is only 
+    imported when plots are requested.
+    """
+    mcpdir = os.path.join(os.path.dirname(__file__), '..', 'modules', 
+                          'MCcubed', 'MCcubed', 'plots')
+    # so that mcplots finds binarray
+    for path in [mcpdir, os.path.join(mcpdir, '..', 'lib')]:
+        if path not in sys.path:
+            sys.path.append(path)
+    import mcplots
+    return mcplots
 
 
 class BaseSampler(object):
@@ -17,19 +47,87 @@ class BaseSampler(object):
     descriptions of each parameter.  The help(param) method returns the 
     dictionary entry for `param`.
 
-    Contains helper methods common to samplers: make_dir, check_none, 
-    check_nonnegfloat, check_nonnegint, check_pnames, check_posint, 
-    make_abspath, prep_arr, and update_path.  These are used when checking 
-    that the user has supplied proper inputs before attempting to run the 
-    sampler.
+    Contains helper methods common to samplers: make_dir, check_monitor, 
+    check_none, check_nonnegfloat, check_nonnegint, check_plotmode, 
+    check_pnames, check_posint, make_abspath, make_adapters, make_loglike, 
+    make_transform, prep_arr, and update_path.  These are used when 
+    checking that the user has supplied proper inputs before attempting to 
+    run the sampler.
+
+    Contains post-processing methods common to samplers: alloc_posterior, 
+    save_posterior, model_quantiles, make_diagnostics (MCMCs), 
+    make_summary, make_result, and make_plots.  run() returns the Result 
+    of make_result, which is also saved to `fresult`, if set.  make_result 
+    first summarizes the posterior in one streaming pass (see 
+    make_summary).
+
+    Samplers that run worker processes get them from worker_pool(), which 
+    reuses them across runs.  Call close(), or use the sampler as a context 
+    manager, to shut them down.
+
+    Contains profiling methods: start_profile, phase, timed, and 
+    save_profile.  If `profile` is set, they time each phase of a run and 
+    the calls to the user's functions.
+
+    If `cachesize` or `fcache` is set, cached() memoizes the log likelihood 
+    (or model) by parameter vector, and flush_cache() commits its disk tier 
+    at the end of a run.
+
+    If `checkiter` is set, DREAM runs in segments of `checkiter` 
+    iterations (see segments), and stops early once check_convergence 
+    finds that its chains have converged.
+
+    If `reuse` is set, load_result() loads the result of a completed run 
+    with the same inputs, if any, and save_result() records the result of 
+    this run.
+
+    make_plots() produces the posterior plots after a run and, if 
+    `algplots` is set, the plots of the sampling package (see 
+    make_alg_plots), which are not drawn by run().
     """
     def __init__(self):
         # Default values
         self.nchains  = 1 # some samplers do not use these params, 
         self.thinning = 1 # but they are required for posterior plots
         self.burnin   = 0 # or when re-loading output posterior
+        self.outp_thinned = False # whether the posterior is already thinned, 
+                                  # so that the plots do not thin it again
+        self.writer   = None # writer of the posterior allocated in 
+                             # `fsavefile` by alloc_posterior()
+        self.pool     = None # worker processes, reused across runs
+        self.logz     = None # log evidence and its uncertainty, 
+        self.logzerr  = None # set by the nested samplers
+        self.profile  = False
+        self.profiler = None # profile of the last run, if `profile` is set
+        self.cache    = None # cached loglike/model results, see cached()
+        self.fprint   = None # fingerprint of the inputs, if `reuse` is set
+        self.logl     = None # log likelihood of each posterior sample, 
+                             # set by some nested samplers
+        self.result   = None # Result of the last run, see make_result()
+        self.tstart   = None # start time of the last run
+        self.plotdata = None # inputs of the sampler's own plots, if they 
+                             # are not read from its output files
+        self.summary  = None # summary statistics of the posterior, see 
+                             # make_summary()
+        self.diagnostics = None # convergence diagnostics of the MCMCs, see 
+                                # make_diagnostics()
+        self.convergence = None # convergence checks of DREAM during the 
+                                # run, if `checkiter` is set
+        self.ncpu      = 1    # number of processes, if an option
+        self.kll       = None # sketch of the model quantiles, and batch 
+        self.kll_batch = None # size, if options, see model_quantiles()
         # Dictionary of parameters and their descriptions
         self.helpinfo = {
+        'algplots' : 'bool. MultiNest and UltraNest only. Determines ' + \
+                          'whether make_plots() also produces the plots ' + \
+                          'of the sampling package, drawn by `plotcpu` ' + \
+                          'processes.  They may also be produced later ' + \
+                          'by make_alg_plots().  Default: True', 
+        'backend' : 'str. DNest4 only. Storage of the particles: csv (text ' + \
+                       'files, as written by DNest4) or binary (NPY files ' + \
+                       'of sample.npy, sample_info.npy, and levels.npy, ' + \
+                       'written through memory maps).  The posterior is ' + \
+                       'the same for both.  Default: csv', 
         'beta' : 'float. DNest 4 only. From their docs: strength of effect ' + \
                         'to force histogram to equal push.  Default: 100.0', 
         'bound' : 'str. Dynesty only. Option to bound the target ' + \
@@ -40,6 +138,22 @@ class BaseSampler(object):
                        'cubes (overlapping cubes centered on each live ' + \
                        'point).  Default: multi', 
         'burnin' : 'int. Number of initial iterations to be discarded.', 
+        'cachesize' : 'int. Number of loglike (or model, for DEMC and ' + \
+                           'snooker) results kept in memory, to reuse ' + \
+                           'when the sampler revisits a point; the least ' + \
+                           'recently used are evicted.  If 0 and `fcache` ' + \
+                           'is None, results are not cached.  Default: 0', 
+        'checkiter' : 'int. DREAM only. Number of iterations between ' + \
+                           'convergence checks (as `niter` counts them), ' + \
+                           'after the burn-in.  The run stops before ' + \
+                           '`niter` iterations once the split-R-hat of ' + \
+                           'every parameter is below `rhat_max` and its ' + \
+                           'effective sample size is at least `min_ess`, ' + \
+                           'computed from running moments of the ' + \
+                           'chains.  The iteration at which they ' + \
+                           'converged is recorded in the `convergence` ' + \
+                           'attribute.  If None, runs `niter` iterations.  ' + \
+                           'Default: None', 
         'data' : 'array, Numpy binary. Measured data for inference. ' + \
                         'Must be Numpy array, list, or a path to a NPY file.', 
         'dlogz' : 'float. Target evidence uncertainty (stops when below ' + \
@@ -48,6 +162,14 @@ class BaseSampler(object):
                             'during the inference.  Default: None', 
         'fbestp' : 'str. Filename for array of best-fit parameters. ' + \
                    'Must be NPY file.', 
+        'fcache' : 'str. /path/to/SQLite file in which to cache the ' + \
+                          'loglike (or model) results on disk, without ' + \
+                          'size limit, for reuse across runs (e.g., with ' + \
+                          '`resume`).  Results are only reused by runs ' + \
+                          'with the same model, loglike, data, and ' + \
+                          'uncertainties.  If relative path, it is ' + \
+                          'considered with respect to `outputdir`.  ' + \
+                          'Default: None', 
         'fcheckpoint' : 'str. Dynesty only.  Path to save checkpoint file ' + \
                         'to allow for resuming the run.  If a relative path, ' + \
                         'assumes it is relative to `outputdir`.', 
@@ -61,38 +183,89 @@ class BaseSampler(object):
                          'subdirectory within `outputdir`. ' + \
                          'Default: pmn/ for multinest, ' + \
                          '         run1 for polychord.', 
+        'fresult' : 'str. Filename to save the Result of the run: the ' + \
+                         'posterior, best parameters, log likelihood of ' + \
+                         'each sample (if known), log evidence, timing, ' + \
+                         'and metadata, in a single binary file whose ' + \
+                         'arrays are only read when accessed (load it ' + \
+                         'with lisa.wrappers.result.load).  If relative ' + \
+                         'path, it is considered with respect to ' + \
+                         '`outputdir`.  Default: None (not saved)', 
         'fsavefile' : 'str. Filename to store parameters explored. ' + \
                             'If relative path, it is considered with ' + \
-                            'respect to `outputdir`.  ' + \
+                            'respect to `outputdir`.  The posterior is ' + \
+                            'written in chunks, and later read from this ' + \
+                            'file as a memory map.  ' + \
                             'Default: `outputdir`/output.npy', 
-        'fsavemodel' : 'str. Filename to store models, corresponding to ' + \
-                            'the parameters. If relative path, it is ' + \
-                            'considered with respect to `outputdir`.  ' + \
-                            'If None, file is not saved.  ' + \
-                            'Beware: the file may be extremely large ' + \
-                            'if the model output has high dimensionality.' + \
+        'fsavemodel' : 'str. MCMCs only (currently). Directory to store ' + \
+                            'the models evaluated during the run, in ' + \
+                            'fixed-size shards with an index of the ' + \
+                            'iteration and chain of each model (a .npy ' + \
+                            'extension is removed).  If relative path, it ' + \
+                            'is considered with respect to `outputdir`.  ' + \
+                            'Read it with ' + \
+                            'lisa.wrappers.modelstore.ModelStore.  ' + \
+                            'If None, models are not saved.  ' + \
                             'Default: None', 
+        'fsummary' : 'str. Filename to save the summary statistics of ' + \
+                          'the posterior, computed in one pass over its ' + \
+                          'chunks after the run: mean, standard ' + \
+                          'deviation, median, minimum, maximum, best ' + \
+                          'value, credible intervals (68.27, 95.45, and ' + \
+                          '99.73%), and correlations of the parameters.  ' + \
+                          'Saved as JSON, or as a Numpy archive if it ' + \
+                          'ends in .npz (load it with ' + \
+                          'lisa.wrappers.summary.load).  If relative ' + \
+                          'path, it is considered with respect to ' + \
+                          '`outputdir`.  If None, not computed.  ' + \
+                          'Default: summary.json', 
         'frac_remain' : 'float. UltraNest only. Sets the fraction ' + \
                                'remainder when integrating the posterior.', 
         'hsize' : 'int. Snooker only.  Number of samples per chain to seed ' + \
                        'the phase space.  Default: nchains+1', 
         'indparams' : 'list. Additional parameters needed by `func`.', 
+        'invalidate' : 'bool. If True and `reuse` is set, discards any ' + \
+                            'recorded result for the same inputs, and ' + \
+                            'samples again.  Default: False', 
         'kll' : 'object.  Datasketches KLL object, for model quantiles. ' + \
                          'Use None if not desired or if Datasketches is ' + \
                          'not installed.  Default: None', 
+        'kll_batch' : 'int. Number of posterior samples per batch of ' + \
+                           'model evaluations when updating `kll`.  If ' + \
+                           'the model accepts a 2D array of parameters, ' + \
+                           'each batch is evaluated in a single call.  ' + \
+                           'Default: 1000', 
         'lam' : 'float. DNest 4 only. From their docs: backtracking scale ' + \
                        'length.  Default: 5.0', 
         'Lepsilon' : 'float. UltraNest only. From their docs: "Terminate ' + \
                             'when live point likelihoods are all the same, ' + \
                             'within Lepsilon tolerance."', 
-        'loglike' : 'object. Function defining the log likelihood.', 
-        'min_ess' : 'int. Minimum effective sample size (ESS). Default: 500', 
-        'model' : 'object. Function defining the forward model.', 
-        'modelper' : 'int. Sets how to split `fsavemodel` into subfiles.  ' + \
-                          'If 0, does not split.  If >0, saves out every ' + \
-                          '`modelper` iterations.  E.g., if nchains=10 and ' + \
-                          'modelper=5, splits every 50 model evaluations.  ' + \
-                          'Default: 0', 
+        'loglike' : 'object. Function defining the log likelihood.  If ' + \
+                           'None, and `data`, `uncert`, and `model` are ' + \
+                           'set, uses the built-in Gaussian log ' + \
+                           'likelihood (vectorized when the sampler and ' + \
+                           'model allow it).  Except for DREAM, ' + \
+                           'MultiNest, and PolyChord, may accept either a ' + \
+                           'single point or a batch of points, shape ' + \
+                           '(nbatch, ndim).', 
+        'min_ess' : 'int. Minimum effective sample size (ESS).  For ' + \
+                         'DREAM, a target of the convergence checks ' + \
+                         '(see `checkiter`); if None, only `rhat_max` ' + \
+                         'is checked.  Default: 500', 
+        'model' : 'object. Function defining the forward model.  It ' + \
+                       'receives the full parameter vector, including ' + \
+                       'fixed and shared parameters (`pstep` <= 0), ' + \
+                       'both in the built-in log likelihood and when ' + \
+                       'updating `kll`.', 
+        'modeldtype' : 'str. Data type of the models stored in ' + \
+                            '`fsavemodel`, e.g. \'float32\' to halve its ' + \
+                            'size.  If None, uses that of the model.  ' + \
+                            'Default: None', 
+        'modelper' : 'int. Sets the size of the shards of `fsavemodel`.  ' + \
+                          'If 0, shards are about 256 MB.  If >0, each ' + \
+                          'shard holds `modelper` iterations.  E.g., if ' + \
+                          'nchains=10 and modelper=5, each shard holds 50 ' + \
+                          'models.  Default: 0', 
         'multitry' : 'int. DREAM only. Determines whether to use multi-try ' + \
                           'sampling. Default: 5', 
         'nchains' : 'int. Number of parallel samplers. Default: 1', 
@@ -103,6 +276,14 @@ class BaseSampler(object):
                             'live points used when adding additional ' + \
                             'samples from a nested sampling run within ' + \
                             'each batch."  Default: 500.', 
+        'maptype' : "str. UltraNest only.  Type of workers used to " + \
+                         "evaluate batches of points with a `loglike` or " + \
+                         "`prior` that only accepts single points.  " + \
+                         "Options: thread, process  Default: thread", 
+        'ncpu' : 'int. Number of processes used by LISA to evaluate the ' + \
+                      'model for `kll`.  For UltraNest, also the number ' + \
+                      'of workers used to evaluate batches of points ' + \
+                      'with single-point functions.  Default: 1', 
         'nlevel' : 'int. DNest4 only. From their docs: Maximum number of ' + \
                         'levels to create.  Default: 30', 
         'nlevelint' : 'int. DNest4 only. Number of moves before creating ' + \
@@ -123,14 +304,43 @@ class BaseSampler(object):
                             'values are used for parameters that are held ' + \
                             'constant, if any.' + \
                         'Must be Numpy array, list, or a path to a NPY file.',
-        'pmax' : 'array, Numpy binary. Maximum value for each parameter.' + \
+        'plotcpu' : 'int. Number of processes used by make_plots() to ' + \
+                         'compute the histograms of the posterior plots ' + \
+                         '(for plotmode stream or kde), and to draw the ' + \
+                         'plots of the sampling package (see ' + \
+                         '`algplots`).  Default: 1', 
+        'plotmode' : 'str. Method of the posterior plots of make_plots(). ' + \
+                          'Choices: full (MC3\'s plots, of every ' + \
+                          'sample), stream (histograms accumulated over ' + \
+                          'chunks of the posterior, which is not loaded ' + \
+                          'into memory, and decimated traces), kde (as ' + \
+                          'stream, with kernel density estimates instead ' + \
+                          'of histograms).  stream and kde suit long ' + \
+                          'chains.  Default: full', 
+        'pmax' : 'array, Numpy binary. Maximum value for each parameter.  ' + \
+                        'Optional for nested sampling algorithms, where ' + \
+                        'it defines the default prior.  ' + \
                         'Must be Numpy array, list, or a path to a NPY file.',
-        'pmin' : 'array, Numpy binary. Minimum value for each parameter.' + \
+        'pmin' : 'array, Numpy binary. Minimum value for each parameter.  ' + \
+                        'Optional for nested sampling algorithms, where ' + \
+                        'it defines the default prior.  ' + \
                         'Must be Numpy array, list, or a path to a NPY file.',
         'pnames' : 'array. Name of each parameter (can use some LaTeX if ' + \
                           'desired).' + \
                           'Must be Numpy array or list.', 
-        'prior' : 'object. Function defining the prior.', 
+        'prior' : 'object. Function defining the prior.  If None, uses a ' + \
+                         'uniform prior between `pmin` and `pmax` for the ' + \
+                         'free parameters (see obj.transform).  Except ' + \
+                         'for MultiNest and DNest4, may accept either a ' + \
+                         'single point or a batch of points, shape ' + \
+                         '(nbatch, ndim).', 
+        'profile' : 'bool. Determines whether to profile the run: the ' + \
+                           'time of each phase (prepare, sampling, ' + \
+                           'postprocessing, kll, saving, plotting), and ' + \
+                           'the calls to loglike, model, and prior (count, ' + \
+                           'total time, latency percentiles, batch ' + \
+                           'sizes).  Stored in obj.profiler, and saved as ' + \
+                           'JSON next to `fsavefile`.  Default: False', 
         'pstep' : 'array. Step size for each parameter.  For MCMCs, only ' + \
                          'matters for the initial samples and determining ' + \
                          'constant parameters, as step size is ' + \
@@ -141,10 +351,28 @@ class BaseSampler(object):
                                      'reflect off boundaries.',
         'resample' : 'float. DNest4 only. Must be non-negative.  ' + \
                          'If >0, corresponds to a factor affecting the ' + \
-                         'number of draws from the posterior.  If 0, no ' + \
-                         'resampling is performed.  Default: 100', 
+                         'number of draws from the posterior.  If 0, the ' + \
+                         'weighted samples are instead resampled by LISA ' + \
+                         'according to `resampler`.  Default: 100', 
+        'resampler' : 'str. Dynesty and DNest4 only. Method to resample ' + \
+                           'the weighted samples into an equal-weight ' + \
+                           'posterior (for DNest4, only if resample=0).  ' + \
+                           'Choices: repeat (each sample is repeated ' + \
+                           'int(nsamples*weight) times, as in MultiNest), ' + \
+                           'stratified (stratified resampling), ' + \
+                           'systematic (systematic resampling).  ' + \
+                           'Default: repeat', 
         'resume' : 'bool. Determines whether to resume a previous run, if ' + \
                          'possible. Default: False', 
+        'rhat_max' : 'float. DREAM only. Split-R-hat below which the ' + \
+                          'chains are considered converged by the ' + \
+                          'convergence checks (see `checkiter`).  ' + \
+                          'Default: 1.01', 
+        'reuse' : 'bool. Determines whether to reuse the result of a ' + \
+                       'completed run with the same inputs (settings, ' + \
+                       'arrays, and functions) in `outputdir`, instead ' + \
+                       'of sampling again, and to record the result of ' + \
+                       'this run for reuse.  Default: False', 
         'sample' : 'str. Dynesty only. Sampling method. Choices ' + \
                         '(descriptions from their docs): unif (uniform ' + \
                         'sampling), rwalk (random walks from current live ' + \
@@ -154,6 +382,9 @@ class BaseSampler(object):
                         '("Hamiltonian" slice sampling), auto ' + \
                         '(automatically selected based on problem ' + \
                         'dimensionality).  Default: auto', 
+        'seed' : 'int. Seed for the random number generator used by LISA ' + \
+                      'when post-processing the samples (e.g., ' + \
+                      'resampling).  Default: None', 
         'thinning' : 'int. Thinning factor for the posterior ' + \
                           '(keep every N iterations). ' + \
                           'Example: a thinning factor of 3 will keep every ' + \
@@ -206,6 +437,20 @@ class BaseSampler(object):
             sys.exit()
         return
 
+    def check_monitor(self):
+        """
+        Checks the targets of the convergence monitor, if `checkiter` is set.
+        """
+        if self.checkiter is None:
+            return
+        self.check_posint('checkiter')
+        if self.min_ess is not None:
+            self.check_posint('min_ess')
+        self.check_nonnegfloat('rhat_max')
+        if type(self.rhat_max) == float and self.rhat_max <= 1:
+            print("rhat_max must be greater than 1.  Given:", self.rhat_max)
+            self.unprepared += 1
+
     def check_none(self, attr):
         """
         Checks attributes that must be specified.
@@ -255,6 +500,16 @@ class BaseSampler(object):
                 print("Converting pnames list into Numpy array")
             self.pnames = np.asarray(self.pnames)
 
+    def check_plotmode(self):
+        """
+        Checks the mode of the posterior plots, and their number of 
+        processes.
+        """
+        if self.plotmode not in streamplots.MODES:
+            print("plotmode must be one of:", ", ".join(streamplots.MODES))
+            self.unprepared += 1
+        self.check_posint('plotcpu')
+
     def check_posint(self, attr):
         """
         Checks attributes that must be a positive integer.
@@ -282,6 +537,73 @@ class BaseSampler(object):
             self.unprepared += 1
             return False
 
+    def make_adapters(self, prior=True, loglike=True, points=None):
+        """
+        Probes `prior` and `loglike` once, and sets the `prior_adapter` and 
+        `loglike_adapter` attributes (None if not requested), Adapters that 
+        call them on single points or batches, whichever the sampler needs.  
+        `prior` is probed on points in the unit hypercube, and `loglike` on 
+        `points`, or the prior of those if not given.
+        """
+        ncpu    = self.ncpu
+        maptype = getattr(self, 'maptype', 'thread')
+        ndim    = int(np.sum(np.asarray(self.pstep) > 0))
+        # Fixed seed, to not disturb the user's random state
+        cube    = np.random.RandomState(0).uniform(size=(2, ndim))
+        self.prior_adapter   = None
+        self.loglike_adapter = None
+        try:
+            if prior:
+                prior = self.timed('prior', self.prior)
+                self.prior_adapter = adapter.Adapter(prior, cube, ncpu, 
+                                                     maptype)
+                if points is None:
+                    points = self.prior_adapter.batch(cube)
+            if loglike:
+                loglike = self.cached('loglike', 
+                                      self.timed('loglike', self.loglike))
+                self.loglike_adapter = adapter.Adapter(loglike, points, ncpu, 
+                                                       maptype)
+                if isinstance(loglike, cache.Memoized):
+                    # Batches are only cached once known to be supported
+                    loglike.vectorized = self.loglike_adapter.vectorized
+        except ValueError as e:
+            print(e)
+            self.unprepared += 1
+
+    def make_loglike(self):
+        """
+        Returns the built-in Gaussian log likelihood of `data` given `model`, 
+        if `data`, `uncert`, and `model` are set.  Otherwise, returns None.
+        """
+        for attr in ['data', 'uncert', 'model']:
+            if getattr(self, attr, None) is None:
+                return None
+        try:
+            return GaussianLogLike(self.data, self.uncert, self.model, 
+                                   transform=getattr(self, 'transform', None))
+        except ValueError as e:
+            print(e)
+            self.unprepared += 1
+
+    def make_transform(self):
+        """
+        Builds the `transform` attribute, a ParamTransform between the unit 
+        hypercube, free, and full parameters, if `pmin` and `pmax` are set.  
+        Otherwise, `transform` is None.
+        """
+        self.transform = None
+        if getattr(self, 'pmin', None) is None or \
+           getattr(self, 'pmax', None) is None:
+            return
+        try:
+            self.transform = ParamTransform(self.pmin, self.pmax, 
+                                            getattr(self, 'pstep', None), 
+                                            getattr(self, 'pinit', None))
+        except ValueError as e:
+            print(e)
+            self.unprepared += 1
+
     def prep_arr(self, attr):
         """
         Prepares attributes that may be an array.
@@ -310,28 +632,447 @@ class BaseSampler(object):
                 setattr(self, attr, os.path.join(getattr(self, 'outputdir'), 
                                                  getattr(self, attr)))
 
+    def worker_pool(self, nproc):
+        """
+        Returns the SharedPool of `nproc` worker processes, creating it if 
+        needed.  It is reused across runs, until close() is called.
+        """
+        if self.pool is not None and self.pool.nproc != nproc:
+            self.pool.close()
+            self.pool = None
+        if self.pool is None:
+            self.pool = sharedmem.SharedPool(nproc)
+        return self.pool
+
+    def close(self):
+        """
+        Shuts down the worker processes, and releases their shared memory.  
+        Closes the disk tier of the cache, if any.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start_profile(self):
+        """
+        Starts the clock of the run, and a new profile of the run in 
+        `profiler`, if `profile` is set.  Otherwise, `profiler` is None.
+        """
+        self.tstart   = time.time()
+        self.profiler = None
+        if self.profile:
+            self.profiler = profiling.Profile()
+
+    def phase(self, name):
+        """
+        Returns a context manager that times phase `name` of the run, if 
+        profiling.
+        """
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.phase(name)
+
+    def timed(self, name, func):
+        """
+        Returns `func` wrapped to record its calls under `name`, if 
+        profiling.  The model called by the built-in log likelihood is 
+        recorded under 'model'.
+        """
+        if self.profiler is None or func is None:
+            return func
+        if isinstance(func, functools.partial) and \
+           isinstance(func.keywords.get('loglike'), GaussianLogLike):
+            # Built-in log likelihood, adapted to the sampler
+            keywords            = dict(func.keywords)
+            keywords['loglike'] = self.timed(None, keywords['loglike'])
+            func = functools.partial(func.func, *func.args, **keywords)
+        elif isinstance(func, GaussianLogLike):
+            func       = copy.copy(func)
+            func.model = self.profiler.wrap('model', func.model)
+        if name is None:
+            return func
+        return self.profiler.wrap(name, func)
+
+    def save_profile(self):
+        """
+        Saves the profile as JSON next to `fsavefile` (with a '_profile.json' 
+        suffix), or as profile.json in `outputdir` if `fsavefile` is None.
+        """
+        if self.profiler is None:
+            return
+        if self.fsavefile is not None:
+            fname = os.path.splitext(storage.npy_name(self.fsavefile))[0] + \
+                    '_profile.json'
+        else:
+            fname = os.path.join(self.outputdir, 'profile.json')
+        self.profiler.save(fname, cache=self.cache)
+
+    def cached(self, name, func, args=(), vectorized=False):
+        """
+        Returns `func` wrapped to reuse its results, stored under `name` in 
+        the `cache` attribute, if `cachesize` or `fcache` is set.  `args` are 
+        the fixed arguments `func` is called with after the parameters.  
+        If `vectorized`, calls on a 2D array of parameters are cached point 
+        by point; if None, whether `func` evaluates such batches is probed 
+        (see batched).  The built-in log likelihood, adapted to MultiNest, 
+        is cached within the adaptation.
+
+        Results are keyed by `name`, the parameters, and the fingerprint of 
+        the model, log likelihood, data, uncertainties, and `args`, so that 
+        results cached with other inputs (e.g., in `fcache`) are not reused.
+        """
+        cachesize = getattr(self, 'cachesize', 0)
+        fcache    = getattr(self, 'fcache',    None)
+        if func is None or (not cachesize and fcache is None):
+            return func
+        # Reuse the cache across runs, unless its settings changed
+        if self.cache is None or self.cache.maxsize != cachesize or \
+           self.cache.fname != fcache:
+            if self.cache is not None:
+                self.cache.close()
+            self.cache = cache.Cache(cachesize, fcache)
+        name = name + ':' + self.cache_fingerprint(args)
+        if vectorized is None:
+            vectorized = self.batched(func, args)
+        if isinstance(func, functools.partial) and \
+           isinstance(func.keywords.get('loglike'), GaussianLogLike):
+            keywords            = dict(func.keywords)
+            keywords['loglike'] = cache.Memoized(keywords['loglike'], 
+                                                 self.cache, name)
+            return functools.partial(func.func, *func.args, **keywords)
+        return cache.Memoized(func, self.cache, name, args, vectorized)
+
+    def cache_fingerprint(self, args=()):
+        """
+        Returns the fingerprint of the inputs that cached results depend 
+        on: the model, log likelihood, data, uncertainties, and `args`.  If 
+        they cannot be fingerprinted, returns a random string, so that 
+        results are only reused within this run.
+        """
+        inputs = [getattr(self, name, None) 
+                  for name in ['model', 'loglike', 'data', 'uncert']]
+        try:
+            return fingerprint.fingerprint(inputs + [list(args)])
+        except ValueError as e:
+            print(e)
+            print("Cached results will not be reused by later runs.")
+            return os.urandom(16).hex()
+
+    def batched(self, func, args=()):
+        """
+        Returns whether `func` evaluates a batch of parameter sets, shape 
+        (nbatch, npars), in a single call, probed on 2 points drawn 
+        uniformly between `pmin` and `pmax` (see adapter.probe).
+        """
+        pinit  = np.asarray(self.pinit, dtype=float)
+        points = np.random.RandomState(0).uniform(self.pmin, self.pmax, 
+                                                  size=(2, pinit.size))
+        # Fixed parameters keep their value
+        fixed  = np.asarray(self.pstep) == 0
+        points[:, fixed] = pinit[fixed]
+        return adapter.probe(lambda p: func(p, *args), points)[0]
+
+    def input_fingerprint(self):
+        """
+        Returns the fingerprint of the algorithm, LISA's version, and the 
+        parameters that determine the result (see fingerprint.py).
+        """
+        names  = [name for name in sorted(set(self.reqpar + self.optpar)) 
+                  if name not in fingerprint.IGNORED]
+        inputs = {name : getattr(self, name, None) for name in names}
+        return fingerprint.fingerprint([self.alg, __version__, inputs])
+
+    def load_result(self):
+        """
+        If `reuse` is set, fingerprints the inputs and loads the result of a 
+        completed run with the same fingerprint in `outputdir`, if any, 
+        unless `invalidate` is set.  Returns True if a result was loaded.
+        """
+        self.fprint = None
+        if not getattr(self, 'reuse', False):
+            return False
+        try:
+            self.fprint = self.input_fingerprint()
+        except ValueError as e:
+            print(e, "The result will not be reused.")
+            return False
+        if getattr(self, 'invalidate', False):
+            fingerprint.forget(self.outputdir, self.fprint)
+            return False
+        result = fingerprint.lookup(self.outputdir, self.fprint)
+        if result is None:
+            return False
+        if self.verb:
+            print("Reusing the result of a completed run with the same " + \
+                  "inputs.")
+        self.outp    = result['outp']
+        self.bestp   = result['bestp']
+        self.logz    = result['logz']
+        self.logzerr = result['logzerr']
+        self.logl    = None
+        # The user's `kll` is updated as if the run was performed
+        self.model_quantiles()
+        return True
+
+    def save_result(self):
+        """
+        Records the result of the run in `outputdir` for reuse, if `reuse` 
+        is set.
+        """
+        if self.fprint is None:
+            return
+        with self.phase('saving'):
+            fingerprint.record(self.outputdir, self.fprint, self.outp, 
+                               self.bestp, self.fsavefile, self.logz, 
+                               self.logzerr)
+
+    def flush_cache(self):
+        """
+        Commits the results cached on disk, if any, so that later runs reuse 
+        them.
+        """
+        if self.cache is not None:
+            self.cache.flush()
+
+    def alloc_posterior(self, npar, nsamp, dtype=np.float64):
+        """
+        Allocates the posterior, shape (npar, nsamp).  If `fsavefile` is set, 
+        it is a writable memory map of a temporary file, so that it is 
+        written to disk as it is filled rather than held in memory; 
+        save_posterior() then moves that file to `fsavefile`.  Otherwise, it 
+        is an in-memory array.
+        """
+        if self.fsavefile is None:
+            return np.empty((npar, nsamp), dtype=dtype)
+        # A posterior allocated by a run that failed is dropped
+        if self.writer is not None:
+            self.writer.discard()
+        self.writer = storage.PosteriorWriter(self.fsavefile, npar, dtype)
+        return self.writer.reserve(nsamp)
+
+    def save_posterior(self):
+        """
+        Saves the posterior to `fsavefile` in chunks, unless it was allocated 
+        by alloc_posterior or is already stored there, and replaces `outp` 
+        with a read-only memory map of the file.  The file is replaced 
+        rather than overwritten, so that memory maps of an earlier posterior 
+        in `fsavefile` remain valid.
+        """
+        if self.fsavefile is None:
+            return
+        with self.phase('saving'):
+            if self.writer is not None:
+                if isinstance(self.outp, np.memmap):
+                    self.outp.flush()
+                self.writer.close()
+                self.writer = None
+            elif storage.is_stored(self.outp, self.fsavefile):
+                self.outp.flush()
+            else:
+                with storage.PosteriorWriter(self.fsavefile, 
+                                             self.outp.shape[0], 
+                                             self.outp.dtype) as writer:
+                    writer.write(self.outp)
+            self.outp = storage.load_posterior(self.fsavefile)
+
+    def model_quantiles(self):
+        """
+        Updates the `kll` sketch with the model evaluated on each sample of 
+        the posterior, in batches of `kll_batch` samples over `ncpu` 
+        processes.  As in the built-in log likelihood, the model receives 
+        the full parameter vector.  Samplers without a `kll_batch` option 
+        (the MCMCs) do not update `kll`.
+        """
+        if self.kll is not None and self.kll_batch is not None:
+            with self.phase('kll'):
+                quantiles.update_kll(self.kll, self.model, self.outp, 
+                                     batchsize=self.kll_batch, 
+                                     ncpu=self.ncpu, 
+                                     transform=getattr(self, 'transform', 
+                                                       None), 
+                                     verb=self.verb)
+
+    def segments(self, first):
+        """
+        Yields the number of iterations of each segment of an MCMC run.  If 
+        `checkiter` is None, a single segment of `niter` iterations.  
+        Otherwise, a first segment of `first` + `checkiter` iterations (e.g., 
+        the burn-in and a first stretch to check), then segments of 
+        `checkiter`, up to `niter` in total, until check_convergence 
+        records that the chains converged.
+        """
+        if self.checkiter is None:
+            yield self.niter
+            return
+        self.convergence = {'niter' : None, 'checks' : []}
+        ndone = 0
+        nseg  = first + self.checkiter
+        while ndone < self.niter and self.convergence['niter'] is None:
+            nseg   = min(nseg, self.niter - ndone)
+            yield nseg
+            ndone += nseg
+            nseg   = self.checkiter
+
+    def check_convergence(self, monitor, niter):
+        """
+        Checks whether the chains of `monitor`, a diagnostics.Monitor, have 
+        converged after `niter` iterations: whether the split-R-hat of each 
+        parameter is below `rhat_max` and its ESS at least `min_ess`.  The 
+        check is recorded in `convergence`, along with the iteration at 
+        which the chains converged.  Returns True if they did.
+        """
+        with self.phase('diagnostics'):
+            done, diag = monitor.converged(self.rhat_max, self.min_ess)
+        rhat = float(np.max(diag['rhat']))
+        ess  = float(np.min(diag['ess']))
+        self.convergence['checks'].append({'niter' : int(niter), 
+                                           'rhat'  : rhat, 
+                                           'ess'   : ess})
+        if self.verb:
+            print("Iteration", niter, "-- maximum R-hat:", rhat, 
+                  " minimum ESS:", ess)
+        if done:
+            self.convergence['niter'] = int(niter)
+            if self.verb:
+                print("The chains converged after", niter, "iterations.")
+        return done
+
+    def make_diagnostics(self):
+        """
+        Computes the convergence diagnostics of the chains of the posterior 
+        (split-R-hat, rank-normalized split-R-hat, and bulk and tail ESS of 
+        each parameter; see diagnostics.py), stores them in `diagnostics`, 
+        and prints them.
+        """
+        with self.phase('diagnostics'):
+            try:
+                chainview        = chains.chain_view(self.outp, self.nchains)
+                self.diagnostics = diagnostics.diagnose(chainview)
+            except ValueError as e:
+                print("Unable to compute the convergence diagnostics:")
+                print(e)
+                return
+        pnames = None if self.pnames is None else \
+                 np.asarray(self.pnames)[self.pstep>0]
+        print("Convergence diagnostics (split chains):")
+        print(diagnostics.report(self.diagnostics, pnames))
+
+    def make_summary(self):
+        """
+        Computes the summary statistics of the posterior (mean, standard 
+        deviation, median, credible intervals, and correlations of the 
+        parameters) in one pass over its chunks, stores them in `summary`, 
+        and saves them to `fsummary`, if set.
+        """
+        fsummary = getattr(self, 'fsummary', None)
+        if fsummary is None or self.outp.shape[-1] == 0:
+            return
+        pnames = None if self.pnames is None else \
+                 np.asarray(self.pnames)[self.pstep>0]
+        with self.phase('summary'):
+            self.summary = summary.summarize(self.outp, bestp=self.bestp, 
+                                             pnames=pnames)
+            summary.save(self.summary, fsummary)
+
+    def make_result(self):
+        """
+        Gathers the outputs of the run into a Result, stored in `result`, 
+        and saves it to `fresult`, if set.  Returns the Result.  The 
+        posterior is summarized first (see make_summary).
+        """
+        self.make_summary()
+        nsamp  = self.outp.shape[-1]
+        logl   = self.logl if self.logl is not None and \
+                              len(self.logl) == nsamp else None
+        timing = {'start' : self.tstart, 
+                  'total' : None if self.tstart is None else 
+                            time.time() - self.tstart}
+        if self.profiler is not None:
+            timing['phases'] = dict(self.profiler.phases)
+        pnames = None if self.pnames is None else \
+                 [str(name) for name in np.asarray(self.pnames)[self.pstep>0]]
+        meta   = {'alg'         : self.alg, 
+                  'version'     : __version__, 
+                  'pnames'      : pnames, 
+                  'fingerprint' : self.fprint}
+        self.result = result.Result(self.outp, self.bestp, logl=logl, 
+                                    logz=self.logz, logzerr=self.logzerr, 
+                                    timing=timing, meta=meta)
+        if getattr(self, 'fresult', None) is not None:
+            with self.phase('saving'):
+                self.result.save(self.fresult)
+        return self.result
+
+    def alg_plot_tasks(self):
+        """
+        Returns the plots of the sampling package, as tasks for 
+        plotting.render: tuples (function, arg1, arg2, ...).  Empty by 
+        default; overridden by samplers that produce their own plots.
+        """
+        return []
+
+    def make_alg_plots(self):
+        """
+        Produces the plots of the sampling package, in `plotcpu` worker 
+        processes
+        """
+        tasks = self.alg_plot_tasks()
+        if tasks:
+            with self.phase('plotting'):
+                plotting.render(tasks, nproc=self.plotcpu)
+
     def make_plots(self):
         """
         Produces posterior plots
         """
-        if hasattr(self, 'outp') or os.path.exists(self.fsavefile):
+        if hasattr(self, 'outp') or \
+           os.path.exists(storage.npy_name(self.fsavefile)):
             if not hasattr(self, 'outp'):
-                self.outp = np.load(self.fsavefile)
-            mcp.trace(self.outp, parname=self.pnames[self.pstep>0], 
-                      thinning=self.thinning, 
-                      sep=np.size(self.outp[0]//self.nchains), 
-                      savefile=os.path.join(self.outputdir, "trace"+self.fext),
-                      truepars=self.truepars)
-            mcp.histogram(self.outp, parname=self.pnames[self.pstep>0], 
-                          thinning=self.thinning, 
+                self.outp = storage.load_posterior(self.fsavefile)
+            if self.outp_thinned:
+                thinning = 1
+            else:
+                thinning = self.thinning
+            with self.phase('plotting'):
+                if self.plotmode == 'full':
+                    mcp   = import_mcplots()
+                    extra = {}
+                else:
+                    # Streamed from the posterior, which may be a memory map, 
+                    # with the histograms computed by the worker processes
+                    mcp   = streamplots
+                    extra = {'kde'  : self.plotmode == 'kde', 
+                             'pool' : self.worker_pool(self.plotcpu) 
+                                      if self.plotcpu > 1 else None}
+                mcp.trace(self.outp, parname=self.pnames[self.pstep>0], 
+                          thinning=thinning, 
+                          sep=self.outp.shape[1], 
                           savefile=os.path.join(self.outputdir, 
-                                                "posterior"+self.fext),
-                          truepars=self.truepars, density=True)
-            mcp.pairwise(self.outp, parname=self.pnames[self.pstep>0], 
-                         thinning=self.thinning, 
-                         savefile=os.path.join(self.outputdir, 
-                                               "pairwise"+self.fext),
-                         truepars=self.truepars)
+                                                "trace"+self.fext),
+                          truepars=self.truepars)
+                mcp.histogram(self.outp, parname=self.pnames[self.pstep>0], 
+                              thinning=thinning, 
+                              savefile=os.path.join(self.outputdir, 
+                                                    "posterior"+self.fext),
+                              truepars=self.truepars, density=True, 
+                              **extra)
+                mcp.pairwise(self.outp, parname=self.pnames[self.pstep>0], 
+                             thinning=thinning, 
+                             savefile=os.path.join(self.outputdir, 
+                                                   "pairwise"+self.fext),
+                             truepars=self.truepars, **extra)
+            if getattr(self, 'algplots', False):
+                self.make_alg_plots()
+            # Include the plots in the saved profile
+            self.save_profile()
         else:
             print("Attempted to produce posterior plots, but the " + \
                   "inference has not yet successfully executed.")
@@ -0,0 +1,139 @@
+"""
+Built-in log likelihoods.
+
+GaussianLogLike evaluates the usual
+
+    -0.5 * sum(((model(params) - data) / uncert)**2)
+
+with the inverse variance precomputed, the residuals written into a reused
+buffer, and the weighted sum of squares reduced by np.einsum, so that no
+temporary arrays are created per evaluation.  Batches of points are
+evaluated with a single call to the model if it accepts 2D inputs.
+
+Classes
+-------
+GaussianLogLike: Gaussian log likelihood of the data given a model
+"""
+
+import copy
+import numpy as np
+
+
+class GaussianLogLike(object):
+    """
+    Gaussian log likelihood of the data given a model.  Call it on a single
+    point, shape (nfree,), to get a float, or use batch() on an array of
+    points, shape (nbatch, nfree), to get an array of shape (nbatch,).
+    """
+    def __init__(self, data, uncert, model, transform=None, vectorized=None):
+        """
+        Inputs
+        ------
+        data      : array.  Measured data.
+        uncert    : array.  Uncertainty of each data point.
+        model     : object. Function defining the forward model.  Called as
+                            model(params).
+        transform : ParamTransform.  If given, and some parameters are fixed
+                            or shared, the model receives the full parameter
+                            vector instead of the free parameters.
+        vectorized: bool.   Whether the model accepts a 2D array of points,
+                            shape (nbatch, npar), returning shape
+                            (nbatch, ndata).  If None, determined on the
+                            first call to batch().
+        """
+        self.data       = np.ravel(np.asarray(data, dtype=float))
+        uncert          = np.ravel(np.asarray(uncert, dtype=float))
+        if uncert.size != self.data.size:
+            raise ValueError("data and uncert must have the same size.")
+        if np.any(uncert <= 0):
+            raise ValueError("uncert must be positive.")
+        self.ivar       = uncert**-2
+        self.model      = model
+        if transform is not None and transform.nfree == transform.npar:
+            # The free parameters are the full parameter vector
+            transform   = None
+        self.transform  = transform
+        self.vectorized = vectorized
+        self._res       = np.empty(self.data.size)
+        self._buf       = np.empty((0, self.data.size))
+
+    def __getstate__(self):
+        # The scratch buffers are recreated rather than pickled
+        state = self.__dict__.copy()
+        del state['_res'], state['_buf']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._res = np.empty(self.data.size)
+        self._buf = np.empty((0, self.data.size))
+
+    def share_arrays(self, pool):
+        """
+        Returns a copy whose data, inverse variance, and model arrays are in
+        the shared memory of `pool`, a SharedPool.
+        """
+        new       = copy.copy(self)
+        new.data  = pool.share(self.data)
+        new.ivar  = pool.share(self.ivar)
+        new.model = pool.share(self.model)
+        return new
+
+    def _params(self, params):
+        """
+        Returns the parameters to be passed to the model.
+        """
+        if self.transform is None:
+            return params
+        return self.transform.free_to_full(params)
+
+    def __call__(self, params):
+        """
+        Evaluates the log likelihood of a single point.
+        """
+        model = np.ravel(self.model(self._params(params)))
+        np.subtract(model, self.data, out=self._res)
+        return -0.5 * np.einsum('i,i,i->', self._res, self._res, self.ivar)
+
+    def _probe(self, params):
+        """
+        Evaluates the model on a batch, and determines whether the model is
+        vectorized by comparing the first result with a single evaluation.
+        Returns the batch of models, or None if the model is not vectorized.
+        """
+        try:
+            models = np.asarray(self.model(self._params(params)))
+        except Exception:
+            return None
+        if models.ndim < 2 or models.shape[0] != params.shape[0] or \
+           models[0].size != self.data.size:
+            return None
+        try:
+            single = np.ravel(self.model(self._params(params[0])))
+        except Exception:
+            # The model only accepts batches
+            return models
+        if not np.allclose(single, np.ravel(models[0])):
+            return None
+        return models
+
+    def batch(self, params):
+        """
+        Evaluates the log likelihood of a batch of points, shape
+        (nbatch, nfree).  Returns an array of shape (nbatch,).
+        """
+        params = np.asarray(params)
+        nbatch = params.shape[0]
+        models = None
+        if self.vectorized is None:
+            models          = self._probe(params)
+            self.vectorized = models is not None
+        if not self.vectorized:
+            return np.array([self(p) for p in params])
+        if models is None:
+            models = np.asarray(self.model(self._params(params)))
+        if self._buf.shape[0] < nbatch:
+            self._buf = np.empty((nbatch, self.data.size))
+        res = self._buf[:nbatch]
+        np.subtract(models.reshape(nbatch, -1), self.data, out=res)
+        return -0.5 * np.einsum('ij,ij,j->i', res, res, self.ivar)
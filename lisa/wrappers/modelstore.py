@@ -0,0 +1,277 @@
+"""
+Sharded on-disk storage for the models evaluated during an MCMC run.
+
+A store is a directory holding fixed-size shards (NPY files of shape
+(shardsize, nmodel)), an index (index.npy) with the iteration, chain, shard,
+and offset of each stored model, and a manifest (manifest.json) describing
+the store.  Shards are read as memory maps, so slices of the models can be
+accessed without loading the full store.  Models may be downcast (e.g., to
+float32) when stored.
+
+Classes
+-------
+ModelStore   : writes and reads a sharded model store
+ModelRecorder: wraps a model function to record each evaluated model
+"""
+
+import os
+import glob
+import json
+import warnings
+import numpy as np
+
+MANIFEST    = 'manifest.json'
+INDEX       = 'index.npy'
+SHARD       = 'shard_{:05d}.npy'
+# Approximate size of each shard in bytes, when the shard size is not given
+SHARD_BYTES = 2**28
+# Columns of the index
+ITERATION, CHAIN, SHARD_NUM, OFFSET = range(4)
+
+
+def store_dir(fname):
+    """
+    Returns the directory of the store for `fname`, stripping any '.npy'
+    extension (the single-file format of earlier versions).
+    """
+    if fname.endswith('.npy'):
+        return fname[:-4]
+    return fname
+
+
+class ModelStore(object):
+    """
+    Writes and reads a sharded model store.  Use as a context manager, or
+    call close() when done writing, so that the index and manifest reflect
+    all stored models.
+    """
+    def __init__(self, fname, mode='r', dtype=None, shardsize=None):
+        """
+        Inputs
+        ------
+        fname    : string. Path to the store directory.  A '.npy' extension
+                           is removed.
+        mode     : string. 'r' to read, 'w' to create (removing any existing
+                           store), or 'a' to append to an existing store.
+        dtype    : dtype.  New stores only.  Data type of the stored models.
+                           If None, uses that of the first model.
+        shardsize: int.    New stores only.  Number of models per shard.  If
+                           None, chosen so that shards are about
+                           SHARD_BYTES in size.
+        """
+        if mode not in ['r', 'w', 'a']:
+            raise ValueError("`mode` must be 'r', 'w', or 'a'.  " + \
+                             "Received: " + str(mode))
+        self.path    = store_dir(fname)
+        self.mode    = mode
+        self._shards = {}
+        if mode == 'a' and not os.path.exists(os.path.join(self.path,
+                                                           MANIFEST)):
+            mode = 'w'
+        if mode == 'w':
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            for f in glob.glob(os.path.join(self.path, 'shard_*.npy')) + \
+                     [os.path.join(self.path, INDEX),
+                      os.path.join(self.path, MANIFEST)]:
+                if os.path.exists(f):
+                    os.remove(f)
+            self.dtype     = None if dtype is None else np.dtype(dtype)
+            self.nmodel    = None
+            self.shardsize = shardsize
+            self.count     = 0
+            self._index    = np.zeros((0, 4), dtype=np.int64)
+        else:
+            with open(os.path.join(self.path, MANIFEST), 'r') as f:
+                manifest = json.load(f)
+            self.dtype     = np.dtype(manifest['dtype'])
+            self.nmodel    = manifest['nmodel']
+            self.shardsize = manifest['shardsize']
+            self.count     = manifest['count']
+            self._index    = np.load(os.path.join(self.path, INDEX))
+            if self._index.shape[0] < self.count:
+                raise ValueError("The index of " + self.path + \
+                                 " is incomplete.")
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def index(self):
+        """
+        Array of shape (nstored, 4), with the iteration, chain, shard, and
+        offset within the shard of each stored model.
+        """
+        return self._index[:self.count]
+
+    @property
+    def nshards(self):
+        if self.count == 0:
+            return 0
+        return (self.count - 1) // self.shardsize + 1
+
+    def shard(self, i):
+        """
+        Returns a memory map of shard `i`, shape (shardsize, nmodel).
+        """
+        if i not in self._shards:
+            fname = os.path.join(self.path, SHARD.format(i))
+            if os.path.exists(fname):
+                self._shards[i] = np.load(fname,
+                                  mmap_mode='r' if self.mode == 'r' else 'r+')
+            else:
+                self._shards[i] = np.lib.format.open_memmap(fname,
+                                  mode='w+', dtype=self.dtype,
+                                  shape=(self.shardsize, self.nmodel))
+        return self._shards[i]
+
+    def append(self, model, iteration, chain=0):
+        """
+        Stores a model evaluated at `iteration` for `chain`.
+        """
+        if self.mode == 'r':
+            raise ValueError("The store was opened read-only.")
+        model = np.ravel(model)
+        if self.nmodel is None:
+            self.nmodel = model.size
+            if self.dtype is None:
+                self.dtype = model.dtype
+            if self.shardsize is None:
+                self.shardsize = max(1, SHARD_BYTES //
+                                        (self.nmodel * self.dtype.itemsize))
+        elif model.size != self.nmodel:
+            raise ValueError("Models must have " + str(self.nmodel) + \
+                             " values, but received " + str(model.size) + \
+                             ".")
+        ishard, offset = divmod(self.count, self.shardsize)
+        self.shard(ishard)[offset] = model
+        if self.count == self._index.shape[0]:
+            # Grow the index geometrically
+            grow        = max(1024, self._index.shape[0])
+            self._index = np.concatenate((self._index,
+                                  np.zeros((grow, 4), dtype=np.int64)))
+        self._index[self.count] = iteration, chain, ishard, offset
+        self.count += 1
+        # Keep full shards consistent on disk, in case the run is interrupted
+        if offset == self.shardsize - 1:
+            self.flush()
+            del self._shards[ishard]
+
+    def __getitem__(self, key):
+        """
+        Returns the stored models at positions `key` (an int, slice, or
+        array of ints) in storage order.
+        """
+        if np.ndim(key) == 0 and not isinstance(key, slice):
+            ishard, offset = divmod(range(self.count)[key], self.shardsize)
+            return np.array(self.shard(ishard)[offset])
+        pos    = np.arange(self.count)[key]
+        out    = np.empty((pos.size, self.nmodel), dtype=self.dtype)
+        ishard = pos // self.shardsize
+        for i in np.unique(ishard):
+            mask      = ishard == i
+            out[mask] = self.shard(i)[pos[mask] % self.shardsize]
+        return out
+
+    def find(self, iteration, chain=None):
+        """
+        Returns the positions of the models stored for `iteration` and, if
+        given, `chain`.
+        """
+        mask = self.index[:, ITERATION] == iteration
+        if chain is not None:
+            mask &= self.index[:, CHAIN] == chain
+        return np.flatnonzero(mask)
+
+    def get(self, iteration, chain=None):
+        """
+        Returns the models stored for `iteration` and, if given, `chain`,
+        shape (nfound, nmodel).
+        """
+        return self[self.find(iteration, chain)]
+
+    def flush(self):
+        """
+        Flushes the shards, and writes the index and manifest.
+        """
+        if self.mode == 'r':
+            return
+        for shard in self._shards.values():
+            shard.flush()
+        np.save(os.path.join(self.path, INDEX), self.index)
+        manifest = {'dtype'     : None if self.dtype is None else
+                                  np.lib.format.dtype_to_descr(self.dtype),
+                    'nmodel'    : self.nmodel,
+                    'shardsize' : self.shardsize,
+                    'nshards'   : self.nshards,
+                    'count'     : self.count,
+                    'shard'     : SHARD}
+        with open(os.path.join(self.path, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=1)
+
+    def close(self):
+        """
+        Flushes the store, and releases the shard memory maps.
+        """
+        self.flush()
+        self._shards = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ModelRecorder(object):
+    """
+    Wraps a model function so that each model it evaluates is stored in a
+    ModelStore.  The model may be called with one sample, or with a 2D
+    array of samples, shape (nbatch, npar) (e.g., MC3 evaluates all chains
+    in one call), in which case each row of its output is one model.  The
+    samplers evaluate one model per chain per iteration, in chain order, so
+    the iteration and chain of each model are inferred from the number of
+    models evaluated.  Evaluations made while initializing the chains are
+    recorded as the first iteration.
+
+    Only calls made in the process that created the recorder are recorded;
+    calls made in other processes (which would write to copies of the
+    store) are evaluated but not stored, with a warning.
+    """
+    def __init__(self, model, store, nchains=1):
+        """
+        Inputs
+        ------
+        model  : object.     Function defining the forward model.
+        store  : ModelStore. Store opened for writing.
+        nchains: int.        Number of chains of the sampler.
+        """
+        self.model   = model
+        self.store   = store
+        self.nchains = nchains
+        self.nmodels = 0
+        self.pid     = os.getpid()
+        self.warned  = False
+        # Continue the iteration count of a resumed store
+        self.start   = 0
+        if len(store):
+            self.start = int(store.index[-1, ITERATION]) + 1
+
+    def __call__(self, params, *args, **kwargs):
+        model = self.model(params, *args, **kwargs)
+        if os.getpid() != self.pid:
+            if not self.warned:
+                warnings.warn("Models evaluated in worker processes are " + \
+                              "not recorded in the model store.")
+                self.warned = True
+            return model
+        if np.ndim(params) == 2:
+            # One model per row of `params`
+            rows = np.asarray(model).reshape(np.shape(params)[0], -1)
+        else:
+            rows = [model]
+        for row in rows:
+            iteration, chain = divmod(self.nmodels, self.nchains)
+            self.store.append(row, self.start + iteration, chain)
+            self.nmodels += 1
+        return model
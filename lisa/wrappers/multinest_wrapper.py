@@ -1,23 +1,150 @@
 """
 Wrapper for PyMultiNest algorithm of Buchner (2014).
 
+uniform_prior     : default prior, uniform between pmin and pmax
+gaussian_loglike  : adapts the built-in Gaussian log likelihood to MultiNest
+analyzer          : pymultinest's Analyzer, with tables read by textio
+plot_marginals    : plots the marginal and conditional posteriors in a grid
+plot_mode_marginal: plots the marginal posterior of each mode
+
 Sampler: class to setup and run an inference
 """
 
 import sys, os
+import functools
 import numpy as np
-import matplotlib.pyplot as plt
 import pymultinest
+from pymultinest import analyse
 
 from .helper import BaseSampler
+from . import textio
+
+
+def uniform_prior(cube, ndim, nparams, transform=None):
+    """
+    Maps MultiNest's unit hypercube, in place, uniformly between `pmin` and 
+    `pmax` of the free parameters.
+
+    Inputs
+    ------
+    cube     : ctypes array. Point in the unit hypercube.
+    ndim     : int.          Number of free parameters.
+    nparams  : int.          Number of parameters, including derived ones.
+    transform: ParamTransform. Built by the Sampler from pmin, pmax, pstep.
+    """
+    cube = np.ctypeslib.as_array(cube, shape=(ndim,))
+    transform.unit_to_physical(cube, out=cube)
+
+
+def gaussian_loglike(cube, ndim, nparams, loglike=None):
+    """
+    Evaluates the built-in Gaussian log likelihood on MultiNest's cube.
+
+    Inputs
+    ------
+    cube   : ctypes array. Point in parameter space.
+    ndim   : int.          Number of free parameters.
+    nparams: int.          Number of parameters, including derived ones.
+    loglike: GaussianLogLike. Built by the Sampler from data, uncert, model.
+    """
+    return loglike(np.ctypeslib.as_array(cube, shape=(ndim,)))
+
+
+def analyzer(n_params, basename):
+    """
+    Returns pymultinest's Analyzer of the output files with prefix 
+    `basename`, whose tables (the .txt file and post_equal_weights.dat) are 
+    read by textio, in chunks and via an NPY cache, rather than by 
+    np.loadtxt.
+
+    Inputs
+    ------
+    n_params: int.    Number of parameters.
+    basename: string. Prefix of MultiNest's output files.
+    """
+    # The Analyzer parses the .txt table when created, via loadtxt2d
+    loadtxt2d = analyse.loadtxt2d
+    analyse.loadtxt2d = textio.load_table
+    try:
+        a = pymultinest.Analyzer(n_params=n_params, 
+                                 outputfiles_basename=basename)
+    finally:
+        analyse.loadtxt2d = loadtxt2d
+    a.equal_weighted_posterior = textio.load_table(basename + 
+                                                   'post_equal_weights.dat')
+    return a
+
+
+def plot_marginals(n_params, basename, parameters, fname):
+    """
+    Plots the marginal posterior of each free parameter, and the 
+    conditional posterior of each pair, in a grid, with PyMultiNest.
+
+    Inputs
+    ------
+    n_params  : int.    Number of parameters.
+    basename  : string. Prefix of MultiNest's output files.
+    parameters: array.  Names of the free parameters.
+    fname     : string. Path to the saved figure.
+    """
+    import matplotlib.pyplot as plt
+    nfree = len(parameters)
+    p = pymultinest.PlotMarginalModes(analyzer(n_params, basename))
+    plt.figure(figsize=(5*nfree, 5*nfree))
+    for i in range(nfree):
+        plt.subplot(nfree, nfree, nfree * i + i + 1)
+        p.plot_marginal(i, with_ellipses = True, 
+                        with_points = False, grid_points=50)
+        plt.ylabel("Probability")
+        plt.xlabel(parameters[i])
+
+        for j in range(i):
+            plt.subplot(nfree, nfree, nfree * j + i + 1)
+            p.plot_conditional(i, j, with_ellipses = False, 
+                               with_points = True, grid_points=30)
+            plt.xlabel(parameters[i])
+            plt.ylabel(parameters[j])
+
+    plt.savefig(fname, bbox_inches='tight')
+    plt.close()
+
+
+def plot_mode_marginal(n_params, basename, parameters, i, cumulative, fname):
+    """
+    Plots the marginal posterior of free parameter `i`, for each mode, with 
+    PyMultiNest.
+
+    Inputs
+    ------
+    n_params  : int.    Number of parameters.
+    basename  : string. Prefix of MultiNest's output files.
+    parameters: array.  Names of the free parameters.
+    i         : int.    Index of the free parameter.
+    cumulative: bool.   Determines whether to plot the cumulative 
+                        distribution.
+    fname     : string. Path to the saved figure.
+    """
+    import matplotlib.pyplot as plt
+    p = pymultinest.PlotMarginalModes(analyzer(n_params, basename))
+    p.plot_modes_marginal(i, cumulative = cumulative, with_ellipses = True, 
+                          with_points = False)
+    plt.ylabel("Cumulative probability" if cumulative else "Probability")
+    plt.xlabel(parameters[i])
+    plt.savefig(fname, bbox_inches='tight')
+    plt.close()
 
 
 class Sampler(BaseSampler):
-    def __init__(self, dlogz=0.1, fbestp='bestp.npy', fext='.png', fprefix='pmn/', 
-                       fsavefile='output.npy', kll=None, 
-                       loglike=None, model=None, niter=0, nlive=500, 
-                       outputdir=None, pnames=None, prior=None, pstep=None, 
-                       resume=False, truepars=None, verb=0):
+    def __init__(self, algplots=True, cachesize=0, data=None, dlogz=0.1, 
+                       fbestp='bestp.npy', fcache=None, fext='.png', 
+                       fprefix='pmn/', fresult=None, fsavefile='output.npy', 
+                       fsummary='summary.json', invalidate=False, kll=None, 
+                       kll_batch=1000, loglike=None, model=None, ncpu=1, 
+                       niter=0, nlive=500, outputdir=None, pinit=None, 
+                       plotcpu=1, plotmode='full', pmax=None, pmin=None, 
+                       pnames=None, prior=None, profile=False, pstep=None, 
+                       resume=False, reuse=False, truepars=None, uncert=None, 
+                       verb=0):
         """
         For details on the inputs, instantiate an object `obj` and call 
         obj.help('parameter'), or see the description in the user manual.
@@ -26,31 +153,51 @@ class Sampler(BaseSampler):
         super(Sampler, self).__init__()
         # General info about the algorithm
         self.alg = 'multinest' #name
-        self.reqpar = ['loglike', 'model', 'nlive', 'outputdir', 
-                       'prior', 'pstep'] #required parameters
-        self.optpar = ['dlogz', 'fbestp', 'fext', 'fprefix', 'fsavefile', 
-                       'kll', 'niter', 'pnames', 'resume', 'truepars', 
-                       'verb'] #optional parameters
+        self.reqpar = ['model', 'nlive', 'outputdir', 
+                       'pstep'] #required parameters
+        self.optpar = ['algplots', 'cachesize', 'data', 'dlogz', 'fbestp', 
+                       'fcache', 'fext', 'fprefix', 'fresult', 'fsavefile', 
+                       'fsummary', 'invalidate', 'kll', 'kll_batch', 'loglike', 
+                       'ncpu', 'niter', 'pinit', 'plotcpu', 'plotmode', 'pmax', 
+                       'pmin', 'pnames', 'prior', 'profile', 'resume', 'reuse', 
+                       'truepars', 'uncert', 'verb'] #optional parameters
         # Only keep help entries relevant to this algorithm
         self.helpinfo = {key : self.helpinfo[key] 
                          for key in self.reqpar+self.optpar}
         # Load supplied parameters
+        self.algplots   = algplots
+        self.cachesize  = cachesize
+        self.data       = data
         self.dlogz      = dlogz
         self.fbestp     = fbestp
+        self.fcache     = fcache
         self.fext       = fext
         self.fprefix    = fprefix
+        self.fresult    = fresult
         self.fsavefile  = fsavefile
+        self.fsummary   = fsummary
+        self.invalidate = invalidate
         self.kll        = kll
+        self.kll_batch  = kll_batch
         self.loglike    = loglike
         self.model      = model
+        self.ncpu       = ncpu
         self.niter      = niter
         self.nlive      = nlive
         self.outputdir  = outputdir
+        self.pinit      = pinit
+        self.plotcpu    = plotcpu
+        self.plotmode   = plotmode
+        self.pmax       = pmax
+        self.pmin       = pmin
         self.pnames     = pnames
         self.prior      = prior
+        self.profile    = profile
         self.pstep      = pstep
         self.resume     = resume
+        self.reuse      = reuse
         self.truepars   = truepars
+        self.uncert     = uncert
         self.verb       = verb
         if self.verb:
             print("PyMultiNest sampler initialized")
@@ -67,16 +214,34 @@ class Sampler(BaseSampler):
         self.unprepared = 0
         # Prepare inputs that may be arrays
         self.prep_arr('pstep')
+        for attr in ['data', 'pinit', 'pmax', 'pmin', 'uncert']:
+            if getattr(self, attr) is not None:
+                self.prep_arr(attr)
+        # Parameter transform, which defines the default prior
+        self.make_transform()
         # Check non-negative float inputs
         self.check_nonnegfloat('dlogz')
         # Check non-negative int inputs
+        self.check_nonnegint('cachesize')
         self.check_nonnegint('niter')
         # Check positive int inputs
+        self.check_posint('kll_batch')
+        self.check_posint('ncpu')
         self.check_posint('nlive')
         # Check arguments that cannot be none
         self.check_none('fprefix')
+        # Default to the built-in Gaussian log likelihood
+        if self.loglike is None:
+            loglike = self.make_loglike()
+            if loglike is not None:
+                self.loglike = functools.partial(gaussian_loglike, 
+                                                 loglike=loglike)
         self.check_none('loglike')
         self.check_none('model')
+        # Default to a uniform prior between pmin and pmax
+        if self.prior is None and self.transform is not None:
+            self.prior = functools.partial(uniform_prior, 
+                                           transform=self.transform)
         self.check_none('prior')
         # Make sure outputdir is an absolute path & exists
         if self.make_abspath('outputdir'):
@@ -84,9 +249,14 @@ class Sampler(BaseSampler):
                 self.make_dir(os.path.join(self.outputdir, self.fprefix))
             # Now update paths based on that, if needed
             self.update_path('fbestp')
+            self.update_path('fcache')
+            self.update_path('fresult')
             self.update_path('fsavefile')
+            self.update_path('fsummary')
         # Ensure proper pnames exist as numpy array
         self.check_pnames()
+        # Check mode of the posterior plots
+        self.check_plotmode()
         # Ready to run?
         if self.unprepared:
             print("Correct the", self.unprepared, 
@@ -101,81 +271,75 @@ class Sampler(BaseSampler):
         """
         Executes the inference
         """
-        if self.prepare():
-            # Run the inference
-            pmn = pymultinest.run(self.loglike, self.prior, 
-                              n_dims=sum(self.pstep > 0), 
-                              outputfiles_basename=os.path.join(self.outputdir, 
-                                                                self.fprefix), 
-                              n_live_points=self.nlive, max_iter=self.niter, 
-                              evidence_tolerance=self.dlogz, 
-                              resume=self.resume)
-            # Analyze the output
-            a = pymultinest.Analyzer(n_params=len(self.pstep), 
-                            outputfiles_basename=os.path.join(self.outputdir, 
-                                                              self.fprefix))
-            s = a.get_stats()
-            self.bestp = a.get_best_fit()['parameters']
-            self.outp  = a.get_equal_weighted_posterior()[:, :-1].T
-            # Update quantiles
-            if self.kll is not None:
-                for i in range(self.outp.shape[-1]):
-                    self.kll.update(self.model(self.outp[:,i], fullout=True))
+        self.start_profile()
+        with self.phase('prepare'):
+            ready = self.prepare()
+        if ready:
+            # Reuse the result of a completed run with the same inputs
+            if self.load_result():
+                return self.make_result()
+            basename = os.path.join(self.outputdir, self.fprefix)
+            with self.phase('sampling'):
+                # Run the inference
+                loglike = self.timed('loglike', 
+                                     self.cached('loglike', self.loglike))
+                prior   = self.timed('prior',   self.prior)
+                pmn = pymultinest.run(loglike, prior, 
+                                      n_dims=sum(self.pstep > 0), 
+                                      outputfiles_basename=basename, 
+                                      n_live_points=self.nlive, 
+                                      max_iter=self.niter, 
+                                      evidence_tolerance=self.dlogz, 
+                                      resume=self.resume)
+            with self.phase('postprocessing'):
+                # Analyze the output
+                a = analyzer(len(self.pstep), basename)
+                s = a.get_stats()
+                self.logz    = s['nested sampling global log-evidence']
+                self.logzerr = s['nested sampling global log-evidence error']
+                self.bestp = a.get_best_fit()['parameters']
+                post       = a.get_equal_weighted_posterior()
+                self.outp  = post[:, :-1].T
+                self.logl  = post[:, -1]
+            # Model quantiles
+            self.model_quantiles()
 
             if self.verb:
                 print("Global Evidence:\n\t%.15e +- %.15e" % \
                       (s['nested sampling global log-evidence'], 
                        s['nested sampling global log-evidence error']))
 
-            # PyMultiNest plots 
-            n_params = self.outp.shape[0]
-            if self.pnames is not None:
-                parameters = self.pnames[self.pstep>0]
-            p = pymultinest.PlotMarginalModes(a)
-            plt.figure(figsize=(5*n_params, 5*n_params))
-            for i in range(n_params):
-                plt.subplot(n_params, n_params, n_params * i + i + 1)
-                p.plot_marginal(i, with_ellipses = True, with_points = False, 
-                                grid_points=50)
-                plt.ylabel("Probability")
-                plt.xlabel(parameters[i])
-                
-                for j in range(i):
-	                plt.subplot(n_params, n_params, n_params * j + i + 1)
-	                p.plot_conditional(i, j, with_ellipses = False, 
-                                       with_points = True, grid_points=30)
-	                plt.xlabel(parameters[i])
-	                plt.ylabel(parameters[j])
-
-            plt.savefig(os.path.join(self.outputdir, ''.join(['marginals_multinest', 
-                                     self.fext])), bbox_inches='tight')
-            plt.close()
-
-            # These are optional since the above contains the same info
-            for i in range(n_params):
-                p.plot_modes_marginal(i, with_ellipses = True, with_points = False)
-                plt.ylabel("Probability")
-                plt.xlabel(parameters[i])
-                plt.savefig(''.join([a.outputfiles_basename, 'mode-marginal-', 
-                            str(i), self.fext]), bbox_inches='tight')
-                plt.close()
-                
-                p.plot_modes_marginal(i, cumulative = True, with_ellipses = True, with_points = False)
-                plt.ylabel("Cumulative probability")
-                plt.xlabel(parameters[i])
-                plt.savefig(''.join([a.outputfiles_basename, 'mode-marginal-cumulative-', 
-                            str(i), self.fext]), bbox_inches='tight')
-                plt.close()
-
-
             # Save posterior and bestfit params
-            if self.fsavefile is not None:
-                np.save(self.fsavefile, self.outp)
+            self.save_posterior()
             if self.fbestp is not None:
                 np.save(self.fbestp, self.bestp)
+            self.save_result()
+            self.save_profile()
+            self.flush_cache()
+            return self.make_result()
         else:
             if self.verb:
                 print("Sampler is not fully prepared to run. " + \
                       "Correct the above errors and try again.")
 
-
+    def alg_plot_tasks(self):
+        """
+        Returns PyMultiNest's plots, drawn from the output files, as tasks 
+        for plotting.render
+        """
+        basename   = os.path.join(self.outputdir, self.fprefix)
+        parameters = self.pnames[self.pstep>0]
+        tasks = [(plot_marginals, len(self.pstep), basename, parameters, 
+                  os.path.join(self.outputdir, 
+                               ''.join(['marginals_multinest', self.fext])))]
+        # These are optional since the above contains the same info
+        for i in range(len(parameters)):
+            tasks.append((plot_mode_marginal, len(self.pstep), basename, 
+                          parameters, i, False, 
+                          ''.join([basename, 'mode-marginal-', str(i), 
+                                   self.fext])))
+            tasks.append((plot_mode_marginal, len(self.pstep), basename, 
+                          parameters, i, True, 
+                          ''.join([basename, 'mode-marginal-cumulative-', 
+                                   str(i), self.fext])))
+        return tasks
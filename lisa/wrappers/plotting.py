@@ -0,0 +1,71 @@
+"""
+Renders independent figures in worker processes.
+
+The sampling packages' own plots (e.g., MultiNest's marginals, UltraNest's
+corner, run, and trace plots) do not depend on each other, and each takes
+a while for many parameters.  They are described as tasks, a function and
+its arguments, and drawn by a pool of worker processes with Matplotlib's
+non-interactive Agg backend, so that plotting scales with the number of
+cores and does not hold up the inference.  Each function saves its figure.
+
+Functions
+---------
+render: draws the figures of a list of tasks
+"""
+
+import traceback
+
+# Matplotlib backend of the worker processes
+BACKEND = 'Agg'
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use(BACKEND, force=True)
+
+
+def _draw(task):
+    """
+    Draws the figure of `task`, and returns None, or the error message if
+    it failed.
+    """
+    func, args = task[0], task[1:]
+    try:
+        func(*args)
+    except Exception as e:
+        return getattr(func, '__name__', str(func)) + ': ' + \
+               ''.join(traceback.format_exception_only(type(e), e)).strip()
+    finally:
+        import matplotlib.pyplot as plt
+        plt.close('all')
+    return None
+
+
+def render(tasks, nproc=1):
+    """
+    Draws figures, in `nproc` worker processes.  Figures that fail are
+    reported, without stopping the others.
+
+    Inputs
+    ------
+    tasks: list. Figures to draw, as tuples (function, arg1, arg2, ...).
+                 Each function saves its figure.  With several processes,
+                 functions and arguments must be picklable (by dill).
+    nproc: int.  Number of worker processes.  If 1, the figures are drawn
+                 in this process, with the current Matplotlib backend.
+
+    Outputs
+    -------
+    errors: list. Error message of each figure that failed.
+    """
+    nproc = min(nproc, len(tasks))
+    if nproc <= 1:
+        out = [_draw(task) for task in tasks]
+    else:
+        import multiprocess as mp
+        with mp.Pool(nproc, initializer=_init_worker) as pool:
+            out = pool.map(_draw, tasks, chunksize=1)
+    errors = [msg for msg in out if msg is not None]
+    for msg in errors:
+        print("Unable to produce a plot:", msg)
+    return errors
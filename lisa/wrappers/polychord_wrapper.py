@@ -1,24 +1,45 @@
 """
 Wrapper for the polychord algorithm of Handley et al. (2015a, 2015b).
 
+gaussian_loglike: adapts the built-in Gaussian log likelihood to PolyChord
+
 Sampler: class to setup and run an inference
 """
 
 import sys, os
+import functools
 import numpy as np
-import matplotlib.pyplot as plt
 import pypolychord
 from pypolychord.settings import PolyChordSettings
 
 from .helper import BaseSampler
+from . import textio
+
+
+def gaussian_loglike(theta, loglike=None):
+    """
+    Evaluates the built-in Gaussian log likelihood, returning it with the 
+    (empty) list of derived parameters, as PolyChord expects.
+
+    Inputs
+    ------
+    theta  : array. Point in parameter space.
+    loglike: GaussianLogLike. Built by the Sampler from data, uncert, model.
+    """
+    return loglike(theta), []
 
 
 class Sampler(BaseSampler):
-    def __init__(self, dlogz=0.1, dumper=None, fbestp='bestp.npy', 
-                       fext='.png', fprefix='run1', fsavefile='output.npy', 
-                       kll=None, loglike=None, model=None, nlive=500, 
-                       nrepeat=None, outputdir=None, pnames=None, prior=None, 
-                       pstep=None, resume=False, truepars=None, verb=0):
+    def __init__(self, cachesize=0, data=None, dlogz=0.1, dumper=None, 
+                       fbestp='bestp.npy', fcache=None, fext='.png', 
+                       fprefix='run1', fresult=None, fsavefile='output.npy', 
+                       fsummary='summary.json', invalidate=False, kll=None, 
+                       kll_batch=1000, loglike=None, model=None, ncpu=1, 
+                       nlive=500, nrepeat=None, outputdir=None, pinit=None, 
+                       plotcpu=1, plotmode='full', pmax=None, pmin=None, 
+                       pnames=None, prior=None, profile=False, pstep=None, 
+                       resume=False, reuse=False, truepars=None, uncert=None, 
+                       verb=0):
         """
         For details on the inputs, instantiate an object `obj` and call 
         obj.help('parameter'), or see the description in the user manual.
@@ -27,32 +48,52 @@ class Sampler(BaseSampler):
         super(Sampler, self).__init__()
         # General info about the algorithm
         self.alg = 'polychord' #name
-        self.reqpar = ['loglike', 'model', 'nlive', 'outputdir', 
-                       'prior', 'pstep'] #required parameters
-        self.optpar = ['dlogz', 'dumper', 'fbestp', 'fext', 'fprefix', 
-                       'fsavefile', 'kll', 'nrepeat', 'pnames', 'resume', 
-                       'truepars', 'verb'] #optional parameters
+        self.reqpar = ['model', 'nlive', 'outputdir', 
+                       'pstep'] #required parameters
+        self.optpar = ['cachesize', 'data', 'dlogz', 'dumper', 'fbestp', 
+                       'fcache', 'fext', 'fprefix', 'fresult', 'fsavefile', 
+                       'fsummary', 'invalidate', 'kll', 'kll_batch', 'loglike', 
+                       'ncpu', 'nrepeat', 'pinit', 'plotcpu', 'plotmode', 
+                       'pmax', 'pmin', 'pnames', 'prior', 'profile', 'resume', 
+                       'reuse', 'truepars', 'uncert', 
+                       'verb'] #optional parameters
         # Only keep help entries relevant to this algorithm
         self.helpinfo = {key : self.helpinfo[key] 
                          for key in self.reqpar+self.optpar}
         # Load supplied parameters
+        self.cachesize   = cachesize
+        self.data        = data
         self.dlogz       = dlogz
         self.dumper      = dumper
         self.fbestp      = fbestp
+        self.fcache      = fcache
         self.fext        = fext
         self.fprefix     = fprefix
+        self.fresult     = fresult
         self.fsavefile   = fsavefile
+        self.fsummary    = fsummary
+        self.invalidate  = invalidate
         self.kll         = kll
+        self.kll_batch   = kll_batch
         self.loglike     = loglike
         self.model       = model
+        self.ncpu        = ncpu
         self.nlive       = nlive
         self.nrepeat     = nrepeat
         self.outputdir   = outputdir
+        self.pinit       = pinit
+        self.plotcpu     = plotcpu
+        self.plotmode    = plotmode
+        self.pmax        = pmax
+        self.pmin        = pmin
         self.pnames      = pnames
         self.prior       = prior
+        self.profile     = profile
         self.pstep       = pstep
         self.resume      = resume
+        self.reuse       = reuse
         self.truepars    = truepars
+        self.uncert      = uncert
         self.verb        = verb
         if self.verb:
             print("polychord sampler initialized")
@@ -69,13 +110,31 @@ class Sampler(BaseSampler):
         self.unprepared = 0
         # Prepare inputs that may be arrays
         self.prep_arr('pstep')
+        for attr in ['data', 'pinit', 'pmax', 'pmin', 'uncert']:
+            if getattr(self, attr) is not None:
+                self.prep_arr(attr)
+        # Parameter transform, which defines the default prior
+        self.make_transform()
         # Check non-negative float inputs
         self.check_nonnegfloat('dlogz')
+        # Check non-negative int inputs
+        self.check_nonnegint('cachesize')
         # Check positive int inputs
+        self.check_posint('kll_batch')
+        self.check_posint('ncpu')
         self.check_posint('nlive')
         # Check that required arguments are not none
+        # Default to the built-in Gaussian log likelihood
+        if self.loglike is None:
+            loglike = self.make_loglike()
+            if loglike is not None:
+                self.loglike = functools.partial(gaussian_loglike, 
+                                                 loglike=loglike)
         self.check_none('loglike')
         self.check_none('model')
+        # Default to a uniform prior between pmin and pmax
+        if self.prior is None and self.transform is not None:
+            self.prior = self.transform.unit_to_physical
         self.check_none('prior')
         # Make sure outputdir is an absolute path & exists
         if self.make_abspath('outputdir'):
@@ -84,9 +143,17 @@ class Sampler(BaseSampler):
                                            self.fprefix.rsplit(os.sep, 1)[0]))
             # Now update paths based on that, if needed
             self.update_path('fbestp')
+            self.update_path('fcache')
+            self.update_path('fresult')
             self.update_path('fsavefile')
+            self.update_path('fsummary')
         # Ensure proper pnames exist as numpy array
         self.check_pnames()
+        # Check mode of the posterior plots
+        self.check_plotmode()
+        # Calling conventions of the prior and log likelihood
+        if not self.unprepared:
+            self.make_adapters(loglike=False)
         # Ready to run?
         if self.unprepared:
             print("Correct the", self.unprepared, 
@@ -101,7 +168,13 @@ class Sampler(BaseSampler):
         """
         Executes the inference
         """
-        if self.prepare():
+        self.start_profile()
+        with self.phase('prepare'):
+            ready = self.prepare()
+        if ready:
+            # Reuse the result of a completed run with the same inputs
+            if self.load_result():
+                return self.make_result()
             # Setup the inference
             ndim = np.sum(self.pstep > 0)
             settings = PolyChordSettings(ndim, 0)
@@ -116,25 +189,40 @@ class Sampler(BaseSampler):
             settings.read_resume = False
             settings.feedback    = self.verb
             # Run it
-            if self.dumper is not None:
-                out = pypolychord.run_polychord(self.loglike, ndim, 0, 
-                                                settings, self.prior, 
-                                                self.dumper)
-            else:
-                out = pypolychord.run_polychord(self.loglike, ndim, 0, 
-                                                settings, self.prior)
+            loglike = self.cached('loglike', 
+                                  self.timed('loglike', self.loglike))
+            with self.phase('sampling'):
+                if self.dumper is not None:
+                    out = pypolychord.run_polychord(loglike, ndim, 0, 
+                                                    settings, 
+                                                    self.prior_adapter.single, 
+                                                    self.dumper)
+                else:
+                    out = pypolychord.run_polychord(loglike, ndim, 0, 
+                                                    settings, 
+                                                    self.prior_adapter.single)
 
-            outp = np.loadtxt(os.path.join(self.outputdir, self.fprefix) +\
-                                   '_equal_weights.txt')
-            self.outp  = outp[:, 2:].T
-            ibest      = np.argmin(outp[:,1])
-            self.bestp = self.outp[:,ibest]
+            with self.phase('postprocessing'):
+                self.logz    = out.logZ
+                self.logzerr = out.logZerr
+                outp = textio.load_table(os.path.join(self.outputdir, 
+                                                      self.fprefix) + \
+                                         '_equal_weights.txt')
+                self.outp  = outp[:, 2:].T
+                # The second column holds -2 log(likelihood)
+                self.logl  = -0.5 * outp[:, 1]
+                ibest      = np.argmin(outp[:,1])
+                self.bestp = self.outp[:,ibest]
+            # Model quantiles
+            self.model_quantiles()
             # Save posterior and bestfit params
-            if self.fsavefile is not None:
-                np.save(self.fsavefile, self.outp)
+            self.save_posterior()
             if self.fbestp is not None:
                 np.save(self.fbestp, self.bestp)
-            return self.outp, self.bestp
+            self.save_result()
+            self.save_profile()
+            self.flush_cache()
+            return self.make_result()
         else:
             if self.verb:
                 print("Sampler is not fully prepared to run. " + \
@@ -0,0 +1,192 @@
+"""
+Profiling of sampler runs: how much time is spent in the user's functions
+(log likelihood, model, prior) versus the sampler, post-processing, saving,
+and plotting.
+
+Each user function is wrapped by a Timed object, which records the number of
+calls, the number of points evaluated (batch sizes), and the latency of
+each call.  Latencies are kept in a fixed-size reservoir (a uniform random
+subset of all calls), so that memory does not grow with the length of the
+run, and percentiles are computed from it.  Each phase of a run is timed
+with Profile.phase().
+
+Only calls made in the sampler's own process are recorded; calls made in
+worker processes (e.g., dynesty with nchains > 1) are not.
+
+Classes
+-------
+CallStats: statistics of the calls to a function
+Timed    : wraps a function to record its CallStats
+Profile  : timings of the phases and functions of a run
+"""
+
+import copy
+import time
+import json
+import random
+import contextlib
+import numpy as np
+
+# Number of latencies kept per function, for percentiles
+RESERVOIR   = 10000
+# Percentiles of the latency reported
+PERCENTILES = [50, 90, 99]
+
+
+class CallStats(object):
+    """
+    Statistics of the calls to a function.
+    """
+    def __init__(self, name, reservoir=RESERVOIR):
+        """
+        Inputs
+        ------
+        name     : string. Name of the function.
+        reservoir: int.    Number of latencies kept for percentiles.
+        """
+        self.name      = name
+        self.ncalls    = 0
+        self.npoints   = 0
+        self.total     = 0.
+        self.minbatch  = None
+        self.maxbatch  = 0
+        self.reservoir = reservoir
+        self._lat      = []
+        self._rng      = random.Random(0)
+
+    def add(self, elapsed, npoints=1):
+        """
+        Records a call that took `elapsed` seconds to evaluate `npoints`
+        points.
+        """
+        self.ncalls  += 1
+        self.npoints += npoints
+        self.total   += elapsed
+        if self.minbatch is None or npoints < self.minbatch:
+            self.minbatch = npoints
+        if npoints > self.maxbatch:
+            self.maxbatch = npoints
+        # Reservoir sampling: each call is kept with equal probability
+        if len(self._lat) < self.reservoir:
+            self._lat.append(elapsed)
+        else:
+            i = self._rng.randrange(self.ncalls)
+            if i < self.reservoir:
+                self._lat[i] = elapsed
+
+    def to_dict(self):
+        """
+        Returns the statistics as a dictionary: ncalls, npoints, total and
+        mean time (s), latency percentiles (s), and batch sizes.
+        """
+        out = {'ncalls'  : self.ncalls,
+               'npoints' : self.npoints,
+               'total'   : self.total,
+               'mean'    : self.total / self.ncalls if self.ncalls else None,
+               'latency' : {},
+               'batch'   : {'min'  : self.minbatch,
+                            'max'  : self.maxbatch,
+                            'mean' : self.npoints / self.ncalls
+                                     if self.ncalls else None}}
+        if self._lat:
+            pcts = np.percentile(self._lat, PERCENTILES)
+            out['latency'] = {'p' + str(p) : float(val)
+                              for p, val in zip(PERCENTILES, pcts)}
+        return out
+
+
+class Timed(object):
+    """
+    Wraps a function to record the time and batch size of each call in a
+    CallStats.  Calls on 2D arrays count as batches of len(array) points.
+    If the function has a `batch` method (e.g., GaussianLogLike), so does
+    the wrapper.
+    """
+    def __init__(self, func, stats):
+        self.func  = func
+        self.stats = stats
+        if hasattr(func, 'batch'):
+            self.batch = Timed(func.batch, stats)
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        out   = self.func(*args, **kwargs)
+        npts  = len(args[0]) if args and np.ndim(args[0]) > 1 else 1
+        self.stats.add(time.perf_counter() - start, npts)
+        return out
+
+    def share_arrays(self, pool):
+        """
+        Returns a copy whose function has its large arrays in the shared
+        memory of `pool`, a SharedPool.
+        """
+        new      = copy.copy(self)
+        new.func = pool.share(self.func)
+        if hasattr(self, 'batch'):
+            new.batch = self.batch.share_arrays(pool)
+        return new
+
+
+class Profile(object):
+    """
+    Timings of the phases of a run, and statistics of the calls to the
+    functions wrapped by wrap().
+    """
+    def __init__(self):
+        self.phases = {}
+        self.calls  = {}
+        self.start  = time.perf_counter()
+
+    def wrap(self, name, func):
+        """
+        Returns `func` wrapped to record its calls under `name`.  If `func`
+        is already wrapped, it is rewrapped for this profile.
+        """
+        if isinstance(func, Timed):
+            func = func.func
+        if name not in self.calls:
+            self.calls[name] = CallStats(name)
+        return Timed(func, self.calls[name])
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Context manager that adds the time spent within it to phase `name`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.) + \
+                                time.perf_counter() - start
+
+    def to_dict(self):
+        """
+        Returns the profile as a dictionary: the time of each phase, the
+        statistics of each function, the total time since the profile was
+        created, and the time spent sampling outside of the user's
+        functions (`sampler_overhead`).
+        """
+        calls = {name : stats.to_dict() for name, stats in self.calls.items()}
+        out   = {'total'  : time.perf_counter() - self.start,
+                 'phases' : dict(self.phases),
+                 'calls'  : calls}
+        if 'sampling' in self.phases:
+            # The log likelihood calls the model, if both are profiled
+            funcs = ['loglike', 'prior'] if 'loglike' in calls else \
+                    ['model', 'prior']
+            out['sampler_overhead'] = self.phases['sampling'] - \
+                                      sum(calls[f]['total'] for f in funcs
+                                          if f in calls)
+        return out
+
+    def save(self, fname, cache=None):
+        """
+        Saves the profile to `fname` as JSON, with the statistics of `cache`
+        (a cache.Cache), if given.
+        """
+        out = self.to_dict()
+        if cache is not None:
+            out['cache'] = cache.stats()
+        with open(fname, 'w') as f:
+            json.dump(out, f, indent=1)
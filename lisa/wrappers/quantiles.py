@@ -0,0 +1,246 @@
+"""
+Evaluates the forward model over the posterior to build quantile sketches.
+
+The model is evaluated in batches, either with a single vectorized call per
+batch (if the model accepts 2D inputs) or one call per sample.  The work may
+be spread over several processes; each keeps its own sketch, and the
+sketches are merged into the user's sketch at the end.
+
+Sketches must follow the interface of the Datasketches KLL objects:
+update(), merge(), serialize(), deserialize(), and the `k` (and, for vector
+sketches, `d`) attributes.
+
+As for the built-in log likelihood, the model receives the full parameter
+vector: if some parameters are fixed or shared, the posterior samples (of
+the free parameters) are expanded by the sampler's ParamTransform.
+
+Functions
+---------
+probe_vectorized: determines whether the model accepts 2D inputs
+update_kll      : updates a sketch with the model evaluated on the posterior
+"""
+
+import sys
+import time
+import traceback
+from queue import Empty
+import numpy as np
+
+# Seconds between checks that the worker processes are alive
+POLL = 1.
+
+
+class _FullModel(object):
+    """
+    Calls a model on the full parameter vector of free parameters.
+    """
+    def __init__(self, model, transform):
+        self.model     = model
+        self.transform = transform
+
+    def __call__(self, params, **kwargs):
+        return self.model(self.transform.free_to_full(params), **kwargs)
+
+
+def probe_vectorized(model, samples):
+    """
+    Determines whether `model` can be evaluated on a batch of samples in a
+    single call.
+
+    Inputs
+    ------
+    model  : object. Function defining the forward model.  Called as
+                     model(params, fullout=True).
+    samples: array.  At least 2 samples, shape (nsamples, npar).
+
+    Outputs
+    -------
+    True if evaluating `model` on the 2D array of samples gives the same
+    result as evaluating each sample separately, False otherwise.
+    """
+    try:
+        batch = np.asarray(model(samples[:2], fullout=True))
+    except Exception:
+        return False
+    if batch.ndim < 2 or batch.shape[0] != 2:
+        return False
+    single = np.asarray(model(samples[0], fullout=True))
+    return single.shape == batch.shape[1:] and np.allclose(single, batch[0])
+
+
+def _sketch_spec(kll):
+    """
+    Returns the class and arguments needed to create an empty sketch with
+    the same configuration as `kll`.  Sketches themselves are generally not
+    picklable, so this is what gets sent to worker processes.
+    """
+    if hasattr(kll, 'd'):
+        return type(kll), (kll.k, kll.d)
+    return type(kll), (kll.k,)
+
+
+def _deserialize(spec, data):
+    """
+    Rebuilds a sketch from the output of its serialize() method.  Vector
+    sketches serialize to a list with one entry per dimension.
+    """
+    if isinstance(data, list):
+        sketch = spec[0](*spec[1])
+        for i, item in enumerate(data):
+            sketch.deserialize(item, i)
+        return sketch
+    return spec[0].deserialize(data)
+
+
+def _ingest(kll, models):
+    """
+    Adds a batch of models, shape (nbatch, ...), to `kll` in one call: as
+    rows of d values for vector sketches, and as values otherwise.  The
+    form is chosen up front, so that a batch is never partly added twice.
+    """
+    if hasattr(kll, 'd'):
+        kll.update(models.reshape(models.shape[0], -1))
+    else:
+        kll.update(models.ravel())
+
+
+def _update_batches(kll, model, samples, batchsize, vectorized, report=None):
+    """
+    Updates `kll` with the model evaluated on `samples` in batches.
+
+    Inputs
+    ------
+    kll       : object. Sketch to be updated.
+    model     : object. Function defining the forward model.
+    samples   : array.  Samples, shape (nsamples, npar).
+    batchsize : int.    Number of samples per batch.
+    vectorized: bool.   Whether to evaluate each batch in a single call.
+    report    : object. Function called with the number of samples
+                        processed after each batch.  Default: None
+    """
+    for i in range(0, samples.shape[0], batchsize):
+        batch = samples[i:i+batchsize]
+        if vectorized:
+            models = np.asarray(model(batch, fullout=True))
+        else:
+            models = np.asarray([model(samp, fullout=True) for samp in batch])
+        _ingest(kll, models)
+        if report is not None:
+            report(batch.shape[0])
+
+
+def _worker(spec, model, samples, batchsize, vectorized, queue):
+    """
+    Process target: fills a new sketch and sends it back through `queue`.
+    Progress is reported through the same queue as ints.  If the model
+    raises, the traceback is sent instead.
+    """
+    try:
+        sketch = spec[0](*spec[1])
+        _update_batches(sketch, model, samples, batchsize, vectorized,
+                        queue.put)
+        queue.put(('sketch', sketch.serialize()))
+    except Exception:
+        queue.put(('error', traceback.format_exc()))
+
+
+def _report(done, total, start, verb):
+    """
+    Prints the progress and throughput of the model evaluations.
+    """
+    if verb:
+        rate = done / max(time.time() - start, 1e-12)
+        print("Model quantiles: {:d}/{:d} samples ({:.1f} samples/s)".format(
+              done, total, rate), end='\r')
+        sys.stdout.flush()
+
+
+def update_kll(kll, model, outp, batchsize=1000, ncpu=1, vectorized=None,
+               transform=None, verb=0):
+    """
+    Updates a quantile sketch with the model evaluated on each posterior
+    sample.
+
+    Inputs
+    ------
+    kll       : object. Sketch to be updated (e.g., a Datasketches
+                        vector_of_kll_floats_sketches).
+    model     : object. Function defining the forward model.  Called as
+                        model(params, fullout=True).
+    outp      : array.  Posterior, shape (npar, nsamples).
+    batchsize : int.    Number of samples evaluated per batch.
+    ncpu      : int.    Number of processes to use.  If 1, evaluates in
+                        the current process.
+    vectorized: bool.   Whether the model accepts a 2D array of samples,
+                        shape (nbatch, npar).  If None, it is determined
+                        by probe_vectorized().
+    transform : ParamTransform.  If given, and some parameters are fixed
+                        or shared, the model receives the full parameter
+                        vector instead of the free parameters in `outp`.
+    verb      : int.    If >0, reports progress and throughput.
+
+    Outputs
+    -------
+    None.  `kll` is updated in place.
+    """
+    if transform is not None and transform.nfree < transform.npar:
+        model = _FullModel(model, transform)
+    samples = np.asarray(outp).T
+    nsamp   = samples.shape[0]
+    if nsamp == 0:
+        return
+    if vectorized is None:
+        vectorized = nsamp > 1 and probe_vectorized(model, samples)
+    if verb:
+        print("Evaluating the model for", nsamp, "posterior samples",
+              "(vectorized)" if vectorized else "")
+    start = time.time()
+    done  = [0]
+    def report(n):
+        done[0] += n
+        _report(done[0], nsamp, start, verb)
+    ncpu  = min(ncpu, int(np.ceil(nsamp / batchsize)))
+    if ncpu <= 1:
+        _update_batches(kll, model, samples, batchsize, vectorized, report)
+    else:
+        import multiprocess as mp
+        spec  = _sketch_spec(kll)
+        queue = mp.Queue()
+        procs = [mp.Process(target=_worker,
+                            args=(spec, model, chunk, batchsize,
+                                  vectorized, queue))
+                 for chunk in np.array_split(samples, ncpu)]
+        for proc in procs:
+            proc.start()
+        # Each worker reports progress as ints, then sends its sketch, or
+        # the traceback of its error
+        sketches = []
+        try:
+            while len(sketches) < ncpu:
+                try:
+                    item = queue.get(timeout=POLL)
+                except Empty:
+                    # A worker that died without a word (e.g., killed)
+                    if any(proc.exitcode not in (None, 0) for proc in procs):
+                        raise RuntimeError("A model evaluation process " + \
+                                           "exited unexpectedly.")
+                    continue
+                if isinstance(item, tuple) and item[0] == 'error':
+                    raise RuntimeError("The model raised an error in a " + \
+                                       "worker process:\n" + item[1])
+                if isinstance(item, tuple):
+                    sketches.append(item[1])
+                else:
+                    report(item)
+        except BaseException:
+            for proc in procs:
+                proc.terminate()
+            raise
+        finally:
+            for proc in procs:
+                proc.join()
+        for sketch in sketches:
+            kll.merge(_deserialize(spec, sketch))
+    if verb:
+        print('')
+        print("Model quantiles computed in {:.2f} s".format(time.time()-start))
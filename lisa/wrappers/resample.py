@@ -0,0 +1,126 @@
+"""
+Converts weighted samples into an equal-weight posterior.
+
+Samplers such as dynesty return a set of samples with associated importance
+weights.  The functions here resample those into an equally-weighted
+posterior using vectorized NumPy operations, writing directly into a
+preallocated array in LISA's (npar, nsamples) posterior layout.
+
+Functions
+---------
+resample_counts: number of times each weighted sample is repeated
+resample_index : indices of the weighted samples forming the posterior
+resample_equal : equal-weight posterior from weighted samples
+"""
+
+import numpy as np
+
+METHODS = ['repeat', 'stratified', 'systematic']
+
+
+def resample_counts(weights, nsamp=None, method='repeat', seed=None):
+    """
+    Computes the number of times each weighted sample is repeated in the
+    equal-weight posterior.
+
+    Inputs
+    ------
+    weights: array. Weights of each sample.  Normalized internally.
+    nsamp  : int.   Size of the resampled posterior.  For the 'repeat' method,
+                    this sets the scaling of the weights, and the returned
+                    posterior may have fewer samples.
+                    Default: number of weights.
+    method : str.   Resampling method.  Options:
+                    repeat    : deterministic; each sample is repeated
+                                int(nsamp * weight) times, as in MultiNest.
+                    stratified: one uniform draw within each of `nsamp`
+                                equal strata of the cumulative weights.
+                    systematic: a single uniform offset shared by all
+                                `nsamp` equally spaced positions.
+    seed   : int, or np.random.Generator.  Seed for the random draws of the
+                    stratified and systematic methods.  Default: None
+
+    Outputs
+    -------
+    counts: array of ints.  Number of repetitions for each sample.
+    """
+    weights = np.asarray(weights, dtype=float)
+    if nsamp is None:
+        nsamp = weights.size
+    if method not in METHODS:
+        raise ValueError("Unknown resampling method: " + str(method) + \
+                         "\nOptions: " + ", ".join(METHODS))
+    if method == 'repeat':
+        return (nsamp * weights / weights.sum()).astype(int)
+    cdf  = np.cumsum(weights)
+    cdf /= cdf[-1]
+    rng = np.random.default_rng(seed)
+    if method == 'systematic':
+        pos = (rng.random() + np.arange(nsamp)) / nsamp
+    else:
+        pos = (rng.random(nsamp) + np.arange(nsamp)) / nsamp
+    # Positions are sorted, so the counts follow from the CDF crossings
+    edges = np.searchsorted(pos, cdf, side='left')
+    edges[-1] = nsamp
+    return np.diff(edges, prepend=0)
+
+
+def resample_index(weights, nsamp=None, method='repeat', seed=None):
+    """
+    Computes the indices of the weighted samples that form the equal-weight
+    posterior, in order.
+
+    Inputs
+    ------
+    See resample_counts().
+
+    Outputs
+    -------
+    index: array of ints.  Index into the weighted samples for each
+                           posterior sample.
+    """
+    counts = resample_counts(weights, nsamp, method, seed)
+    return np.repeat(np.arange(counts.size), counts)
+
+
+def resample_equal(samples, weights=None, nsamp=None, method='repeat',
+                   seed=None, index=None, out=None, return_index=False):
+    """
+    Resamples weighted samples into an equal-weight posterior.
+
+    Inputs
+    ------
+    samples     : array. Weighted samples, shape (nweighted, npar).
+    weights     : array. Weights of each sample, shape (nweighted,).
+    nsamp       : int.   Target size of the posterior.
+                         Default: number of weighted samples.
+    method      : str.   Resampling method.  See resample_counts().
+    seed        : int, or np.random.Generator.  Seed for random methods.
+    index       : array. Output of resample_index(), if already computed
+                         (e.g., to size `out`).  Overrides `weights`,
+                         `nsamp`, `method`, and `seed`.
+    out         : array. Preallocated array of shape (npar, N) to hold the
+                         posterior, where N is the number of resampled
+                         points.  If None, a new array is allocated.
+    return_index: bool.  If True, also returns the index of each posterior
+                         sample into `samples`.
+
+    Outputs
+    -------
+    outp : array. Equal-weight posterior, shape (npar, N).
+    index: array. Only if `return_index`.  Index into `samples` of each
+                  posterior sample.
+    """
+    samples = np.asarray(samples)
+    if index is None:
+        index = resample_index(weights, nsamp, method, seed)
+    if out is None:
+        out = np.empty((samples.shape[1], index.size), dtype=samples.dtype)
+    elif out.shape != (samples.shape[1], index.size):
+        raise ValueError("`out` has shape " + str(out.shape) + \
+                         ", but the posterior has shape " + \
+                         str((samples.shape[1], index.size)) + ".")
+    np.take(samples.T, index, axis=1, out=out)
+    if return_index:
+        return out, index
+    return out
@@ -0,0 +1,210 @@
+"""
+Result of a sampler run, common to all samplers, and its storage in a single
+binary file.
+
+A Result holds the posterior samples, in LISA's (npar, nsamples) layout, the
+best parameters, the weight and log likelihood of each sample (if known),
+the log evidence and its uncertainty (for nested samplers), the timing of
+the run, and metadata (sampler, parameter names, LISA version).  It unpacks
+as (outp, bestp), as returned by run() in earlier versions of LISA:
+    outp, bestp = sampler.run()
+
+Results are saved as one file: a magic string, the length of a JSON header,
+the header (scalars, metadata, and the type, shape, and offset of each
+array), and the arrays, each aligned to ALIGN bytes.  When a Result is
+loaded, only the header is read; each array is memory-mapped when first
+accessed, so that reading the evidence of a run does not load its samples.
+The samples are stored in Fortran order, as in posterior files (see
+storage.py), and written in chunks, so that posteriors that are memory maps
+are not read into memory at once.
+
+Classes
+-------
+Result: result of a sampler run
+
+Functions
+---------
+load: loads a Result saved by Result.save
+"""
+
+import os
+import json
+import struct
+import numpy as np
+
+from . import storage
+
+# First bytes of a result file
+MAGIC   = b'\x93LISARES'
+VERSION = 1
+# Alignment of the arrays in the file, in bytes
+ALIGN   = 64
+# Arrays of a Result, in the order they are stored
+ARRAYS  = ['samples', 'bestp', 'weights', 'logl']
+
+
+def _field(name, doc):
+    """
+    Property of array `name`, memory-mapped from the file when first
+    accessed, for Results that were loaded.
+    """
+    def get(self):
+        if name not in self._arrays and name in self._index:
+            self._arrays[name] = self._map(name)
+        return self._arrays.get(name)
+
+    def set(self, value):
+        self._arrays[name] = None if value is None else np.asarray(value)
+
+    return property(get, set, doc=doc)
+
+
+class Result(object):
+    """
+    Result of a sampler run.
+    """
+    samples = _field('samples', 'Posterior samples, shape (npar, nsamples).')
+    bestp   = _field('bestp',   'Best parameters.')
+    weights = _field('weights', 'Weight of each sample.  None if the ' + \
+                                'samples are equally weighted.')
+    logl    = _field('logl',    'Log likelihood of each sample.  None if ' + \
+                                'unknown.')
+
+    def __init__(self, samples=None, bestp=None, weights=None, logl=None,
+                 logz=None, logzerr=None, timing=None, meta=None):
+        """
+        Inputs
+        ------
+        samples: array.  Posterior, shape (npar, nsamples).
+        bestp  : array.  Best parameters.
+        weights: array.  Weight of each sample.  None for equal weights.
+        logl   : array.  Log likelihood of each sample, if known.
+        logz   : float.  Log evidence, if any.
+        logzerr: float.  Uncertainty of `logz`, if any.
+        timing : dict.   Timing of the run: total wall time (s) and, if
+                         profiled, the time of each phase.
+        meta   : dict.   Metadata: sampler, parameter names, etc.
+        """
+        self._arrays  = {}
+        self._index   = {}
+        self._fname   = None
+        self.samples  = samples
+        self.bestp    = bestp
+        self.weights  = weights
+        self.logl     = logl
+        self.logz     = None if logz    is None else float(logz)
+        self.logzerr  = None if logzerr is None else float(logzerr)
+        self.timing   = timing or {}
+        self.meta     = meta   or {}
+
+    @property
+    def nsamples(self):
+        """
+        Number of samples, read from the header for loaded Results.
+        """
+        if 'samples' in self._arrays:
+            samples = self._arrays['samples']
+            return None if samples is None else samples.shape[-1]
+        if 'samples' in self._index:
+            return self._index['samples']['shape'][-1]
+        return None
+
+    def __iter__(self):
+        # Unpacks as (outp, bestp)
+        yield self.samples
+        yield self.bestp
+
+    def __getitem__(self, i):
+        return (self.samples, self.bestp)[i]
+
+    def __repr__(self):
+        out = 'Result(' + str(self.meta.get('alg', '')) + ', nsamples=' + \
+              str(self.nsamples)
+        if self.logz is not None:
+            out += ', logz=' + str(self.logz) + ' +- ' + str(self.logzerr)
+        return out + ')'
+
+    def _map(self, name):
+        """
+        Memory-maps array `name` from the file of a loaded Result.
+        """
+        info  = self._index[name]
+        dtype = np.dtype(info['dtype'])
+        shape = tuple(info['shape'])
+        if int(np.prod(shape)) == 0:
+            # Empty arrays cannot be memory-mapped
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(self._fname, dtype=dtype, mode='r',
+                         offset=info['offset'], shape=shape,
+                         order=info['order'])
+
+    def save(self, fname):
+        """
+        Saves the Result to `fname`.  The file is written under a temporary
+        name first, so that an interrupted save does not leave a partial
+        file.
+        """
+        arrays = [(name, getattr(self, name)) for name in ARRAYS]
+        arrays = [(name, arr) for name, arr in arrays if arr is not None]
+        # Offsets are relative to the end of the header until it is sized
+        index  = {}
+        offset = 0
+        for name, arr in arrays:
+            index[name] = {'dtype'  : arr.dtype.str,
+                           'shape'  : list(arr.shape),
+                           'order'  : 'F' if arr.ndim > 1 else 'C',
+                           'offset' : offset}
+            offset += -(-arr.nbytes // ALIGN) * ALIGN
+        header = {'version' : VERSION,
+                  'logz'    : self.logz,
+                  'logzerr' : self.logzerr,
+                  'timing'  : self.timing,
+                  'meta'    : self.meta,
+                  'arrays'  : index}
+        # The arrays start after the header, whose length depends on their
+        # offsets; grow the start until the header fits before it
+        start = 0
+        while True:
+            text = json.dumps(dict(header, arrays={name : dict(info,
+                                       offset=info['offset'] + start)
+                                       for name, info in index.items()}))
+            text = text.encode()
+            need = -(-(len(MAGIC) + 8 + len(text)) // ALIGN) * ALIGN
+            if need <= start:
+                break
+            start = need
+        text += b' ' * (start - len(MAGIC) - 8 - len(text))
+        for info in index.values():
+            info['offset'] += start
+        with open(fname + '.tmp', 'wb') as f:
+            f.write(MAGIC + struct.pack('<Q', len(text)) + text)
+            for name, arr in arrays:
+                f.seek(index[name]['offset'])
+                if arr.ndim > 1:
+                    for i in range(0, arr.shape[-1], storage.CHUNKSIZE):
+                        chunk = arr[..., i:i+storage.CHUNKSIZE]
+                        f.write(np.asarray(chunk).tobytes(order='F'))
+                else:
+                    f.write(np.asarray(arr).tobytes())
+            f.truncate(offset + start)
+        os.replace(fname + '.tmp', fname)
+
+
+def load(fname):
+    """
+    Loads a Result saved by Result.save.  Only the header is read; arrays
+    are memory-mapped (read-only) when first accessed.
+    """
+    with open(fname, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(fname + " is not a LISA result file.")
+        hlen   = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(hlen).decode())
+    if header['version'] > VERSION:
+        raise ValueError(fname + " was saved by a newer version of LISA.")
+    result = Result(logz=header['logz'], logzerr=header['logzerr'],
+                    timing=header['timing'], meta=header['meta'])
+    result._arrays = {}
+    result._index  = header['arrays']
+    result._fname  = fname
+    return result
@@ -0,0 +1,183 @@
+"""
+Worker pools that send large arrays to the workers through shared memory.
+
+Functions sent to a process pool are pickled, along with every array they
+hold (e.g., the data and uncertainties bound to a log likelihood), for each
+task.  SharedPool instead copies large arrays once into shared memory
+blocks, and replaces them with SharedArrays, which pickle as the name of
+their block.  Workers attach to the block on first use, and get a zero-copy
+view of the array.
+
+The process that creates a block owns it: it unlinks the block when the
+pool is closed, or when the pool is garbage collected.  Workers are started
+by the owner, and share its resource tracker, so they only attach to the
+blocks and never unlink them.
+
+Classes
+-------
+SharedArray: ndarray in a shared memory block, pickled by name
+SharedPool : process pool which shares large arrays with its workers
+"""
+
+import types
+import weakref
+import functools
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+# Arrays smaller than this, in bytes, are pickled as usual
+MINBYTES = 2**16
+
+# Blocks attached in this process, by name
+_attached = {}
+
+
+def _attach(name, shape, dtype):
+    """
+    Returns a SharedArray viewing the shared memory block `name`, attaching
+    to it on first use.
+    """
+    if name not in _attached:
+        try:
+            # Python >= 3.13: do not register the block with the tracker
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=name)
+        _attached[name] = shm
+    return SharedArray(_attached[name], shape, dtype)
+
+
+class SharedArray(np.ndarray):
+    """
+    Array stored in a shared memory block.  Pickles as the name, shape, and
+    dtype of the block, so that unpickling gives a view of the same memory.
+    Arrays derived from it (slices, results of operations) are ordinary
+    arrays when pickled.
+    """
+    def __new__(cls, shm, shape, dtype):
+        obj = super(SharedArray, cls).__new__(cls, shape, dtype=dtype,
+                                              buffer=shm.buf)
+        obj._shm = shm
+        return obj
+
+    def __array_finalize__(self, obj):
+        # Views do not necessarily span the block
+        self._shm = None
+
+    def __reduce__(self):
+        if self._shm is None:
+            return np.ndarray.__reduce__(self.view(np.ndarray))
+        return _attach, (self._shm.name, self.shape, self.dtype.str)
+
+
+def _release(pool, blocks):
+    """
+    Shuts down `pool`, and unlinks the shared memory `blocks`.  Used by
+    SharedPool.close() and its finalizer, so it must not refer to the
+    SharedPool itself.
+    """
+    if pool:
+        pool[0].close()
+        pool[0].join()
+        del pool[:]
+    for shm, arr, shared in blocks.values():
+        _attached.pop(shm.name, None)
+        shm.unlink()
+        try:
+            shm.close()
+        except BufferError:
+            # Views are still in use; the memory is freed with them
+            pass
+    blocks.clear()
+
+
+class SharedPool(object):
+    """
+    Process pool, created on first use and reused until closed, which shares
+    large arrays with its workers.  Use as a context manager, or call close()
+    when done; otherwise, it is closed when garbage collected.
+    """
+    def __init__(self, nproc, minbytes=MINBYTES):
+        """
+        Inputs
+        ------
+        nproc   : int. Number of worker processes.
+        minbytes: int. Arrays at least this large, in bytes, are placed in
+                       shared memory by share().
+        """
+        self.nproc    = nproc
+        self.minbytes = minbytes
+        # Kept in containers, so that the finalizer can release them
+        self._pool    = []
+        self._blocks  = {}
+        self._final   = weakref.finalize(self, _release, self._pool,
+                                         self._blocks)
+
+    @property
+    def pool(self):
+        """
+        The multiprocess Pool, created on first access.
+        """
+        if not self._pool:
+            import multiprocess as mp
+            # Started before the workers, so that they share it even if
+            # blocks are created after them
+            resource_tracker.ensure_running()
+            self._pool.append(mp.Pool(self.nproc))
+        return self._pool[0]
+
+    def share_array(self, arr):
+        """
+        Returns a SharedArray copy of `arr`.  The block is reused (with its
+        contents updated) if the same array is shared again.
+        """
+        key = id(arr)
+        if key in self._blocks:
+            shared = self._blocks[key][2]
+            np.copyto(shared, arr)
+            return shared
+        shm    = shared_memory.SharedMemory(create=True,
+                                            size=max(1, arr.nbytes))
+        shared = SharedArray(shm, arr.shape, arr.dtype)
+        np.copyto(shared, arr)
+        _attached[shm.name] = shm
+        # Keep `arr` alive, so that its id is not reused
+        self._blocks[key] = (shm, arr, shared)
+        return shared
+
+    def share(self, obj):
+        """
+        Returns `obj` with its large arrays placed in shared memory.  Handles
+        arrays, functools.partial objects, bound methods, and objects with a
+        share_arrays(pool) method (e.g., GaussianLogLike).  Other objects are
+        returned unchanged.
+        """
+        if isinstance(obj, SharedArray):
+            return obj
+        if isinstance(obj, np.ndarray):
+            if obj.nbytes < self.minbytes or obj.dtype.hasobject:
+                return obj
+            return self.share_array(obj)
+        if isinstance(obj, functools.partial):
+            return functools.partial(self.share(obj.func),
+                                     *[self.share(arg) for arg in obj.args],
+                                     **{key : self.share(val)
+                                        for key, val in obj.keywords.items()})
+        if isinstance(obj, types.MethodType):
+            return types.MethodType(obj.__func__, self.share(obj.__self__))
+        if hasattr(obj, 'share_arrays'):
+            return obj.share_arrays(self)
+        return obj
+
+    def close(self):
+        """
+        Shuts down the workers, and releases the shared memory.  The pool
+        may be used again afterwards.
+        """
+        _release(self._pool, self._blocks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,314 @@
+"""
+On-disk storage for posteriors, in LISA's (npar, nsamples) layout.
+
+Posteriors are written in the NPY format with Fortran ordering, so that the
+parameters of each sample are contiguous on disk and new samples can be
+appended to the end of the file.  The header has a fixed length, and is
+rewritten with the current number of samples whenever the file is flushed.
+The files can be read with np.load(fname, mmap_mode='r').  A posterior is
+written to a temporary file in the same directory, which replaces the
+posterior file once complete, so that memory maps of a previous posterior in
+that file (e.g., of an earlier run) remain valid.
+
+The posterior is written once the sampler returns it: the samplers do not
+hand LISA their samples as they go, so a run that dies leaves no posterior
+file (the samplers' own output files, e.g. for `resume`, are unaffected).
+
+Other arrays that grow during a run (e.g., a sampler's record of particles)
+are written by ArrayWriter, row by row, into preallocated space that is
+doubled whenever it runs out, through a memory map.
+
+Classes
+-------
+PosteriorWriter: appends samples to a posterior file
+ArrayWriter    : appends rows to a growable NPY file
+
+Functions
+---------
+npy_name      : file name used for a posterior, as in np.save
+is_stored     : determines whether an array is a memory map of a file
+load_posterior: loads a posterior file, memory-mapped by default
+"""
+
+import os
+import time
+import struct
+import numpy as np
+
+# Length of the NPY header, in bytes, including the magic string
+HEADER_LEN = 128
+# Number of samples written at a time when saving an in-memory posterior
+CHUNKSIZE  = 100000
+# Rows initially preallocated by an ArrayWriter, and seconds between the
+# updates of its header
+CAPACITY       = 1024
+FLUSH_INTERVAL = 1.
+
+
+def npy_name(fname):
+    """
+    Returns the name of the file that np.save would write for `fname`.
+    """
+    if not fname.endswith('.npy'):
+        return fname + '.npy'
+    return fname
+
+
+def is_stored(outp, fname):
+    """
+    Determines whether `outp` is a memory map of the posterior file `fname`.
+    """
+    return isinstance(outp, np.memmap) and outp.filename is not None and \
+           os.path.abspath(outp.filename) == os.path.abspath(npy_name(fname))
+
+
+def _info(dtype, shape, fortran):
+    """
+    Dictionary of an NPY header, as a string.
+    """
+    return "{'descr': " + repr(np.lib.format.dtype_to_descr(dtype)) + \
+           ", 'fortran_order': " + str(fortran) + ", 'shape': " + \
+           str(tuple(shape)) + ", }"
+
+
+def _npy_header(dtype, shape, fortran, length):
+    """
+    Builds an NPY version 1.0 header of `length` bytes.
+    """
+    info = _info(dtype, shape, fortran)
+    hlen = length - 10
+    if len(info) + 1 > hlen:
+        raise ValueError("The array is too large for the header.")
+    info = info.ljust(hlen - 1) + '\n'
+    return np.lib.format.magic(1, 0) + struct.pack('<H', hlen) + \
+           info.encode('latin1')
+
+
+def _header(dtype, npar, nsamp):
+    """
+    Builds an NPY version 1.0 header of length HEADER_LEN describing a
+    Fortran-ordered array of shape (npar, nsamp).
+    """
+    return _npy_header(dtype, (npar, nsamp), True, HEADER_LEN)
+
+
+class PosteriorWriter(object):
+    """
+    Appends samples to a posterior file.  Use as a context manager, or call
+    close() when done, so that the header reflects all written samples and
+    the file replaces any previous one; discard() drops the samples
+    instead.  The context manager discards them if an exception is raised.
+    """
+    def __init__(self, fname, npar, dtype=np.float64):
+        """
+        Inputs
+        ------
+        fname: string. Path to the posterior file, which is replaced on
+                       close().  '.npy' is appended if missing, as in
+                       np.save.
+        npar : int.    Number of parameters per sample.
+        dtype: dtype.  Data type of the posterior.
+        """
+        self.fname    = npy_name(fname)
+        self.npar     = npar
+        self.dtype    = np.dtype(dtype)
+        self.nsamp    = 0
+        self.itemsize = self.npar * self.dtype.itemsize
+        # Named by process, as several may write the same posterior at once
+        self.tmpname  = self.fname + '.' + str(os.getpid()) + '.tmp'
+        self.f        = open(self.tmpname, 'w+b')
+        self.flush()
+
+    def append(self, samples):
+        """
+        Appends samples, shape (npar, n), to the file.
+        """
+        samples = np.asarray(samples, dtype=self.dtype)
+        if samples.ndim != 2 or samples.shape[0] != self.npar:
+            raise ValueError("Samples must have shape (" + str(self.npar) + \
+                             ", n), but have shape " + \
+                             str(samples.shape) + ".")
+        self.f.seek(0, os.SEEK_END)
+        self.f.write(samples.tobytes(order='F'))
+        self.nsamp += samples.shape[1]
+
+    def write(self, outp, chunksize=CHUNKSIZE):
+        """
+        Appends a posterior, shape (npar, n), in chunks of `chunksize`
+        samples, so that no more than one chunk is copied at a time.
+        """
+        for i in range(0, np.shape(outp)[1], chunksize):
+            self.append(outp[:, i:i+chunksize])
+
+    def reserve(self, n):
+        """
+        Extends the file by `n` samples, and returns a writable memory map of
+        shape (npar, n) over them, to be filled in place.
+        """
+        offset = HEADER_LEN + self.nsamp * self.itemsize
+        self.f.truncate(offset + n * self.itemsize)
+        self.nsamp += n
+        self.flush()
+        if n == 0:
+            return np.empty((self.npar, 0), dtype=self.dtype)
+        return np.memmap(self.tmpname, dtype=self.dtype, mode='r+',
+                         offset=offset, shape=(self.npar, n), order='F')
+
+    def flush(self):
+        """
+        Updates the header with the number of samples, and flushes the file.
+        """
+        self.f.seek(0)
+        self.f.write(_header(self.dtype, self.npar, self.nsamp))
+        self.f.seek(0, os.SEEK_END)
+        self.f.flush()
+
+    def close(self):
+        """
+        Flushes and closes the file, which then replaces the posterior file.
+        Memory maps returned by reserve() remain valid.
+        """
+        if not self.f.closed:
+            self.flush()
+            self.f.close()
+            os.replace(self.tmpname, self.fname)
+
+    def discard(self):
+        """
+        Closes and removes the file, leaving the posterior file as it was.
+        """
+        if not self.f.closed:
+            self.f.close()
+            os.remove(self.tmpname)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class ArrayWriter(object):
+    """
+    Appends rows to an NPY file of shape (nrows,) + rowshape.  Space for the
+    rows is preallocated, and doubled whenever it runs out, so that rows are
+    copied into a memory map rather than written to the file one at a time.
+    The header is updated with the number of rows every FLUSH_INTERVAL
+    seconds, and on flush() and close(); close() also trims the unused
+    space, so that the file can be read with np.load.
+    """
+    def __init__(self, fname, dtype, rowshape=(), capacity=CAPACITY):
+        """
+        Inputs
+        ------
+        fname   : string. Path to the file.  '.npy' is appended if missing,
+                          as in np.save.  It is overwritten.
+        dtype   : dtype.  Data type of the rows (may be structured).
+        rowshape: tuple.  Shape of each row.
+        capacity: int.    Number of rows initially preallocated.
+        """
+        self.fname    = npy_name(fname)
+        self.dtype    = np.dtype(dtype)
+        self.rowshape = tuple(rowshape)
+        self.nrows    = 0
+        self.capacity = 0
+        self.itemsize = self.dtype.itemsize * int(np.prod(self.rowshape))
+        # Long enough for any number of rows, and aligned as NPY requires
+        self.hlen     = -(-(len(_info(self.dtype, (2**63,) + self.rowshape, 
+                                      False)) + 11) // 64) * 64
+        self._map     = None
+        self._flushed = time.time()
+        self.f        = open(self.fname, 'w+b')
+        self._grow(max(1, capacity))
+        self.flush()
+
+    def _grow(self, capacity):
+        """
+        Extends the preallocated space to `capacity` rows.
+        """
+        if self._map is not None:
+            self._map.flush()
+            self._map = None
+        self.f.truncate(self.hlen + capacity * self.itemsize)
+        self.capacity = capacity
+        self._map     = np.memmap(self.fname, dtype=self.dtype, mode='r+', 
+                                  offset=self.hlen, 
+                                  shape=(capacity,) + self.rowshape)
+
+    def append(self, rows):
+        """
+        Appends rows, shape (n,) + rowshape, to the file.
+        """
+        rows = np.asarray(rows, dtype=self.dtype).reshape((-1,) + 
+                                                          self.rowshape)
+        n    = len(rows)
+        if self.nrows + n > self.capacity:
+            self._grow(max(2 * self.capacity, self.nrows + n))
+        self._map[self.nrows:self.nrows+n] = rows
+        self.nrows += n
+        if time.time() - self._flushed > FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """
+        Flushes the rows, and updates the header with their number.
+        """
+        self._map.flush()
+        self.f.seek(0)
+        self.f.write(_npy_header(self.dtype, (self.nrows,) + self.rowshape, 
+                                 False, self.hlen))
+        self.f.flush()
+        self._flushed = time.time()
+
+    def array(self):
+        """
+        Returns a read-only memory map of the rows written so far.
+        """
+        self.flush()
+        if self.nrows == 0 or self.itemsize == 0:
+            # Empty arrays cannot be memory-mapped
+            return np.empty((self.nrows,) + self.rowshape, dtype=self.dtype)
+        return np.memmap(self.fname, dtype=self.dtype, mode='r', 
+                         offset=self.hlen, 
+                         shape=(self.nrows,) + self.rowshape)
+
+    def close(self):
+        """
+        Flushes the rows, trims the unused space, and closes the file.
+        """
+        if not self.f.closed:
+            self.flush()
+            self._map = None
+            self.f.truncate(self.hlen + self.nrows * self.itemsize)
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def load_posterior(fname, mmap=True):
+    """
+    Loads a posterior file.
+
+    Inputs
+    ------
+    fname: string. Path to the posterior file.  '.npy' is appended if
+                   missing, as in np.save.
+    mmap : bool.   If True, returns a read-only memory map of the file
+                   instead of reading it into memory.
+
+    Outputs
+    -------
+    outp: array. Posterior, shape (npar, nsamples).
+    """
+    fname = npy_name(fname)
+    if mmap and os.path.getsize(fname) > HEADER_LEN:
+        return np.load(fname, mmap_mode='r')
+    # Empty arrays cannot be memory-mapped
+    return np.load(fname)
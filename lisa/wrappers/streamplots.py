@@ -0,0 +1,550 @@
+"""
+Posterior plots for long chains, computed in a streaming way.
+
+MC3's plots (trace, histogram, pairwise) draw every sample, which for 10^7
+samples of 20 parameters takes very long and holds gigabytes of memory.
+The plots here have the same layout, but are drawn from summaries computed
+over the posterior in chunks of samples, so that a memory-mapped posterior
+(see storage.py) is streamed from disk rather than loaded:
+  - histograms (1D, and 2D for each pair of parameters) are accumulated
+    chunk by chunk, from the bin index of each sample;
+  - kernel density estimates are evaluated on a grid, by smoothing fine
+    histograms with a Gaussian kernel (binned KDE) whose bandwidth follows
+    Scott's rule, from moments accumulated in the same pass as the ranges;
+  - traces are decimated, keeping the minimum and maximum of each bucket of
+    consecutive samples, so that excursions of the chains remain visible;
+  - scatter layers show a bounded random subsample of the posterior.
+
+The histograms may be computed by the worker processes of a SharedPool
+(see sharedmem.py), each over a range of the samples, so that the time for
+the pairwise plot, whose number of panels grows as npar^2, scales with the
+number of cores.  Workers read the posterior without copies: a memory map
+is mapped again from its file, and an array in memory is placed in a
+shared memory block.  The partial counts are summed as they arrive.
+
+The plotting functions accept the arguments of MC3's, so that either module
+can be used by BaseSampler.make_plots (see `plotmode`).
+
+Functions
+---------
+chunks    : yields the thinned posterior in chunks of samples
+summarize : range, mean, and standard deviation of each parameter
+histograms: 1D and 2D histograms of the posterior
+smooth    : Gaussian smoothing of a histogram
+decimate  : min/max decimation of the traces
+subsample : random subsample of the posterior
+trace     : plots the trace of each parameter
+histogram : plots the 1D marginal posteriors
+pairwise  : plots the 2D marginal posteriors
+"""
+
+import mmap
+import numpy as np
+
+from . import storage
+
+# Plotting modes of BaseSampler.make_plots: MC3's plots of every sample, or
+# the streamed plots, with histograms or KDEs
+MODES          = ['full', 'stream', 'kde']
+# Samples per chunk, and ranges of samples per worker process
+CHUNKSIZE      = storage.CHUNKSIZE
+TASKS_PER_PROC = 4
+# Bins of the histograms, and of the grids of the KDEs
+BINS           = 20
+KDE_BINS       = 256
+KDE_BINS2      = 100
+# Points drawn per trace, and in scatter layers
+NPOINTS        = 20000
+NSCATTER       = 10000
+# Width of the KDE grids beyond the range of the samples, in bandwidths
+KDE_PAD        = 3
+# Densities below this fraction of the maximum are not drawn
+KDE_FLOOR      = 1e-3
+
+
+def _pairs(npar):
+    """
+    Pairs of parameters (i, j), i < j, of the 2D histograms.
+    """
+    return [(i, j) for i in range(npar) for j in range(i+1, npar)]
+
+
+def _share(outp, pool):
+    """
+    Returns a view of `outp` that is sent to worker processes without
+    copying the samples: the layout of the file of a memory map, which the
+    workers map again, or a SharedArray in a shared memory block of `pool`.
+    """
+    if isinstance(outp, np.memmap) and isinstance(outp.base, mmap.mmap) \
+       and (outp.flags.c_contiguous or outp.flags.f_contiguous):
+        order = 'C' if outp.flags.c_contiguous else 'F'
+        return ('file', outp.filename, outp.offset, outp.shape,
+                outp.dtype.str, order)
+    return pool.share_array(np.asarray(outp))
+
+
+def _open(view):
+    """
+    Returns the posterior from a view made by _share.
+    """
+    if isinstance(view, tuple):
+        fname, offset, shape, dtype, order = view[1:]
+        return np.memmap(fname, dtype=dtype, mode='r', offset=offset,
+                         shape=shape, order=order)
+    return view
+
+
+def _call(task):
+    """
+    Calls `func` on samples `start` to `stop` of the posterior.
+    """
+    func, view, start, stop, args = task
+    return func(_open(view)[:, start:stop], *args)
+
+
+def _map(pool, func, outp, thinning, *args):
+    """
+    Calls func(outp[:, start:stop], *args) on ranges of samples, in the
+    worker processes of `pool` if given, and yields the results as they
+    come, so that they are reduced without being held at once.  Ranges
+    start at multiples of `thinning`, so that the thinned samples are the
+    same as for the whole posterior.
+    """
+    nsamp = -(-outp.shape[1] // thinning)
+    if pool is None or pool.nproc <= 1 or nsamp < 2 * pool.nproc:
+        yield func(outp, *args)
+        return
+    view   = _share(outp, pool)
+    # Several ranges per worker, to balance the load
+    ntask  = min(TASKS_PER_PROC * pool.nproc, nsamp)
+    bounds = np.linspace(0, nsamp, ntask + 1).astype(int) * thinning
+    tasks  = [(func, view, start, stop, args)
+              for start, stop in zip(bounds[:-1], bounds[1:])]
+    for out in pool.pool.imap_unordered(_call, tasks):
+        yield out
+
+
+def chunks(outp, thinning=1, chunksize=CHUNKSIZE):
+    """
+    Yields the posterior `outp`, shape (npar, nsamples), thinned, in chunks
+    of up to `chunksize` samples, as in-memory arrays of shape (npar, n).
+    """
+    step = chunksize * thinning
+    for i in range(0, outp.shape[1], step):
+        yield np.asarray(outp[:, i:i+step:thinning], dtype=np.float64)
+
+
+def _moments(outp, shift, thinning, chunksize):
+    """
+    Range, and sums of the deviations from `shift` and of their squares, of
+    each parameter, and the number of samples.
+    """
+    npar = outp.shape[0]
+    lo   = np.full(npar,  np.inf)
+    hi   = np.full(npar, -np.inf)
+    s1   = np.zeros(npar)
+    s2   = np.zeros(npar)
+    n    = 0
+    for chunk in chunks(outp, thinning, chunksize):
+        if chunk.shape[1] == 0:
+            continue
+        lo  = np.minimum(lo, chunk.min(axis=1))
+        hi  = np.maximum(hi, chunk.max(axis=1))
+        dev = chunk - shift[:, None]
+        s1 += dev.sum(axis=1)
+        s2 += (dev**2).sum(axis=1)
+        n  += chunk.shape[1]
+    return lo, hi, s1, s2, n
+
+
+def summarize(outp, thinning=1, chunksize=CHUNKSIZE, pool=None):
+    """
+    Computes, in one pass, the range, mean, and standard deviation of each
+    parameter, in the worker processes of `pool` (a SharedPool), if given.
+
+    Outputs
+    -------
+    lo  : array. Minimum of each parameter.
+    hi  : array. Maximum of each parameter.
+    mean: array. Mean of each parameter.
+    std : array. Standard deviation of each parameter.
+    n   : int.   Number of (thinned) samples.
+    """
+    if outp.shape[1] == 0:
+        raise ValueError("The posterior has no samples.")
+    # Moments about the first sample, for numerical stability
+    shift = np.array(outp[:, 0], dtype=np.float64)
+    lo, hi, s1, s2, n = None, None, 0, 0, 0
+    for part in _map(pool, _moments, outp, thinning, shift, thinning,
+                     chunksize):
+        lo  = part[0] if lo is None else np.minimum(lo, part[0])
+        hi  = part[1] if hi is None else np.maximum(hi, part[1])
+        s1 += part[2]
+        s2 += part[3]
+        n  += part[4]
+    mean  = shift + s1 / n
+    std   = np.sqrt(np.maximum(s2 / n - (s1 / n)**2, 0))
+    return lo, hi, mean, std, n
+
+
+def _limits(lo, hi):
+    """
+    Widens degenerate ranges, so that their bins have a nonzero width.
+    """
+    lo   = np.array(lo, dtype=np.float64)
+    hi   = np.array(hi, dtype=np.float64)
+    same = lo == hi
+    lo[same] -= 0.5
+    hi[same] += 0.5
+    return lo, hi
+
+
+def _counts(outp, bins, lo, hi, pairs, thinning, chunksize):
+    """
+    Histogram of each parameter and, if `pairs`, of each pair of parameters
+    (flattened, in the order of _pairs), of the samples of `outp`.
+    """
+    npar   = outp.shape[0]
+    hist1d = np.zeros((npar, bins), dtype=np.int64)
+    hist2d = np.zeros((len(_pairs(npar)), bins * bins), dtype=np.int64) \
+             if pairs else None
+    scale  = bins / (hi - lo)
+    for chunk in chunks(outp, thinning, chunksize):
+        inside = (chunk >= lo[:, None]) & (chunk <= hi[:, None])
+        index  = ((chunk - lo[:, None]) * scale[:, None]).astype(np.intp)
+        # The maxima fall in the last bin, as in np.histogram
+        np.clip(index, 0, bins - 1, out=index)
+        # Usually all samples are within the ranges, and need no masking
+        allin  = inside.all()
+        for i in range(npar):
+            hist1d[i] += np.bincount(index[i] if allin else
+                                     index[i, inside[i]], minlength=bins)
+        if pairs:
+            rows = index * bins
+            for k, (i, j) in enumerate(_pairs(npar)):
+                flat = rows[i] + index[j]
+                if not allin:
+                    flat = flat[inside[i] & inside[j]]
+                hist2d[k] += np.bincount(flat, minlength=bins * bins)
+    return hist1d, hist2d
+
+
+def histograms(outp, bins=BINS, lo=None, hi=None, pairs=False,
+               thinning=1, chunksize=CHUNKSIZE, pool=None):
+    """
+    Computes the histogram of each parameter and, optionally, of each pair
+    of parameters, in one pass over the posterior.
+
+    Inputs
+    ------
+    outp     : array.      Posterior, shape (npar, nsamples).  May be a
+                           memory map.
+    bins     : int.        Number of bins per parameter.
+    lo, hi   : array.      Range of the bins of each parameter.  Samples
+                           outside are not counted.  If None, the range of
+                           the samples.
+    pairs    : bool.       If True, also computes the 2D histograms.
+    thinning : int.        Thinning factor of the posterior.
+    chunksize: int.        Number of samples processed at a time.
+    pool     : SharedPool. If given, its worker processes each count a
+                           range of the samples, read through a shared view
+                           of the posterior, and the counts are summed.
+
+    Outputs
+    -------
+    edges : array. Bin edges of each parameter, shape (npar, bins+1).
+    hist1d: array. Counts, shape (npar, bins).
+    hist2d: dict.  Counts of each pair (i, j), i < j, shape (bins, bins),
+                   with parameter i along the first axis.  None if `pairs`
+                   is False.
+    """
+    npar = outp.shape[0]
+    if lo is None or hi is None:
+        lo, hi = summarize(outp, thinning, chunksize, pool)[:2]
+    lo, hi = _limits(lo, hi)
+    edges  = np.linspace(lo, hi, bins + 1, axis=1)
+    hist1d = 0
+    counts = 0
+    for part in _map(pool, _counts, outp, thinning, bins, lo, hi, pairs,
+                     thinning, chunksize):
+        hist1d = hist1d + part[0]
+        if pairs:
+            counts = counts + part[1]
+    hist2d = None
+    if pairs:
+        hist2d = {pair : counts[k].reshape(bins, bins)
+                  for k, pair in enumerate(_pairs(npar))}
+    return edges, hist1d, hist2d
+
+
+def smooth(hist, sigma):
+    """
+    Smooths a histogram (of any dimension) with a Gaussian kernel, whose
+    standard deviation along each axis is given by `sigma`, in bins.
+    Counts smoothed beyond the edges are lost, as for a KDE evaluated on
+    the grid.
+    """
+    out = np.asarray(hist, dtype=np.float64)
+    for axis, s in enumerate(np.broadcast_to(sigma, (out.ndim,))):
+        n = out.shape[axis]
+        h = int(min(np.ceil(4 * s), n - 1))
+        if s <= 0 or h == 0:
+            continue
+        kernel  = np.exp(-0.5 * (np.arange(-h, h + 1) / s)**2)
+        kernel /= kernel.sum()
+        out = np.apply_along_axis(lambda row: np.convolve(row, kernel)[h:h+n],
+                                  axis, out)
+    return out
+
+
+def _kde_grids(outp, pairs, thinning, chunksize, pool=None):
+    """
+    Evaluates the KDE of each parameter (and pair) on a grid, from fine
+    histograms.  Returns the grid edges, and the densities.
+    """
+    lo, hi, mean, std, n = summarize(outp, thinning, chunksize, pool)
+    # Scott's rule, in 1 and 2 dimensions
+    bw1 = std * n**(-1. / 5)
+    bw2 = std * n**(-1. / 6)
+    lo1, hi1 = _limits(lo - KDE_PAD * bw1, hi + KDE_PAD * bw1)
+    edges, hist1d, _ = histograms(outp, KDE_BINS, lo1, hi1, False,
+                                  thinning, chunksize, pool)
+    width = (hi1 - lo1) / KDE_BINS
+    kde1d = np.array([smooth(hist1d[i], bw1[i] / width[i]) / (n * width[i])
+                      for i in range(len(hist1d))])
+    edges2 = None
+    kde2d  = None
+    if pairs:
+        lo2, hi2 = _limits(lo - KDE_PAD * bw2, hi + KDE_PAD * bw2)
+        edges2, _, hist2d = histograms(outp, KDE_BINS2, lo2, hi2, True,
+                                       thinning, chunksize, pool)
+        width2 = (hi2 - lo2) / KDE_BINS2
+        kde2d  = {(i, j) : smooth(h, [bw2[i] / width2[i],
+                                      bw2[j] / width2[j]]) /
+                           (n * width2[i] * width2[j])
+                  for (i, j), h in hist2d.items()}
+    return edges, kde1d, edges2, kde2d
+
+
+def decimate(outp, npoints=NPOINTS, thinning=1, chunksize=CHUNKSIZE):
+    """
+    Decimates the trace of each parameter to about `npoints` points, by
+    keeping the minimum and maximum of each bucket of consecutive samples,
+    in the order they were sampled.
+
+    Outputs
+    -------
+    x: array. Index of each point in the thinned posterior, shape (npar, m).
+    y: array. Value of each point, shape (npar, m).
+    """
+    npar  = outp.shape[0]
+    nsamp = -(-outp.shape[1] // thinning)
+    if nsamp <= npoints:
+        y = np.concatenate(list(chunks(outp, thinning, chunksize)) or
+                           [np.empty((npar, 0))], axis=1)
+        return np.broadcast_to(np.arange(nsamp), y.shape), y
+    size  = -(-2 * nsamp // npoints)
+    # Chunks of whole buckets
+    csize = max(1, chunksize // size) * size
+    xs, ys = [], []
+    start = 0
+    rows  = np.arange(npar)[:, None]
+    for chunk in chunks(outp, thinning, csize):
+        n      = chunk.shape[1]
+        nfull  = n // size * size
+        parts  = [chunk[:, :nfull].reshape(npar, -1, size)]
+        if n > nfull:
+            parts.append(chunk[:, nfull:].reshape(npar, 1, n - nfull))
+        for part in parts:
+            imin  = part.argmin(axis=2)
+            imax  = part.argmax(axis=2)
+            first = np.minimum(imin, imax)
+            last  = np.maximum(imin, imax)
+            base  = start + np.arange(part.shape[1]) * part.shape[2]
+            x     = np.stack([base + first, base + last], axis=2)
+            y     = np.stack([part[rows, np.arange(part.shape[1]), first],
+                              part[rows, np.arange(part.shape[1]), last]],
+                             axis=2)
+            xs.append(x.reshape(npar, -1))
+            ys.append(y.reshape(npar, -1))
+            start += part.shape[1] * part.shape[2]
+    return np.concatenate(xs, axis=1), np.concatenate(ys, axis=1)
+
+
+def subsample(outp, nmax=NSCATTER, thinning=1, seed=None):
+    """
+    Returns a random subsample of at most `nmax` samples of the thinned
+    posterior, in their order, shape (npar, n).
+    """
+    nsamp = -(-outp.shape[1] // thinning)
+    if nsamp <= nmax:
+        return np.asarray(outp[:, ::thinning])
+    rng   = np.random.default_rng(seed)
+    index = np.sort(rng.choice(nsamp, size=nmax, replace=False)) * thinning
+    return np.asarray(outp[:, index])
+
+
+def _names(parname, npar):
+    if parname is None:
+        return [r"P{:d}".format(i) for i in range(npar)]
+    return list(parname)
+
+
+def trace(allparams, title=None, parname=None, thinning=1, savefile=None,
+          sep=None, truepars=None, npoints=NPOINTS, chunksize=CHUNKSIZE,
+          **kwargs):
+    """
+    Plots the trace of each parameter, decimated to about `npoints` points
+    (see decimate).  Arguments as for MC3's trace; `sep` is the number of
+    samples per chain.
+    """
+    import matplotlib.pyplot as plt
+    npar  = allparams.shape[0]
+    names = _names(parname, npar)
+    x, y  = decimate(allparams, npoints, thinning, chunksize)
+    nsamp = -(-allparams.shape[1] // thinning)
+    fig   = plt.figure(figsize=(8, 8))
+    plt.subplots_adjust(left=0.15, right=0.95, bottom=0.05, top=0.9,
+                        hspace=0.15)
+    if title is not None:
+        plt.suptitle(title, size=16)
+    for i in range(npar):
+        ax = plt.subplot(npar, 1, i+1)
+        ax.plot(x[i], y[i], ',')
+        if sep is not None and 0 < sep / thinning < nsamp:
+            for xsep in np.arange(sep / thinning, nsamp, sep / thinning):
+                ax.axvline(xsep, color='0.5', ls='--')
+        if truepars is not None:
+            ax.axhline(truepars[i], color='red', ls='-', lw=1)
+        ax.set_xlim(0, nsamp)
+        ax.set_ylabel(names[i], size=10)
+        if i == npar - 1:
+            ax.set_xlabel('MCMC sample', size=10)
+        else:
+            ax.set_xticklabels([])
+    if savefile is not None:
+        plt.savefig(savefile)
+    plt.close(fig)
+
+
+def histogram(allparams, title=None, parname=None, thinning=1,
+              savefile=None, truepars=None, density=False, bins=BINS,
+              kde=False, chunksize=CHUNKSIZE, pool=None, **kwargs):
+    """
+    Plots the marginal posterior of each parameter, as a histogram or (if
+    `kde`) a KDE, computed in chunks, by the worker processes of `pool` (a
+    SharedPool) if given.  Arguments as for MC3's histogram.
+    """
+    import matplotlib.pyplot as plt
+    npar  = allparams.shape[0]
+    names = _names(parname, npar)
+    if kde:
+        edges, dens = _kde_grids(allparams, False, thinning, chunksize,
+                                 pool)[:2]
+        if not density:
+            # Scaled to the counts of `bins` bins, as the histograms
+            nsamp = -(-allparams.shape[1] // thinning)
+            dens  = dens * nsamp * (edges[:, -1:] - edges[:, :1]) / bins
+    else:
+        edges, counts, _ = histograms(allparams, bins, thinning=thinning,
+                                      chunksize=chunksize, pool=pool)
+    nperrow = 3
+    nrows   = (npar - 1) // nperrow + 1
+    fig     = plt.figure(figsize=(8.5, 2.5 * nrows + 0.5))
+    plt.subplots_adjust(left=0.1, right=0.95, bottom=0.1, top=0.9,
+                        hspace=0.7, wspace=0.1)
+    if title is not None:
+        plt.suptitle(title, size=16)
+    for i in range(npar):
+        ax = plt.subplot(nrows, nperrow, i+1)
+        centers = 0.5 * (edges[i, 1:] + edges[i, :-1])
+        if kde:
+            ax.plot(centers, dens[i], lw=2)
+            ax.set_ylim(bottom=0)
+        else:
+            ax.hist(centers, bins=edges[i], weights=counts[i],
+                    density=density, histtype='step', lw=2)
+        if truepars is not None:
+            ax.axvline(truepars[i], color='red', ls='-', lw=1)
+        ax.set_xlabel(names[i], size=10)
+        if i % nperrow == 0:
+            ax.set_ylabel('Normalized point density' if density else
+                          'N samples', size=10)
+        else:
+            ax.set_yticklabels([])
+    if savefile is not None:
+        plt.savefig(savefile)
+    plt.close(fig)
+
+
+def pairwise(allparams, title=None, parname=None, thinning=1,
+             savefile=None, style='hist', truepars=None, bins=BINS,
+             kde=False, nscatter=NSCATTER, chunksize=CHUNKSIZE, pool=None,
+             **kwargs):
+    """
+    Plots the 2D marginal posterior of each pair of parameters, as
+    histograms or (if `kde`) KDEs computed in chunks, or (style='points')
+    as a random subsample of at most `nscatter` samples.  Arguments as for
+    MC3's pairwise.
+
+    If `pool` (a SharedPool) is given, the histograms of all panels are
+    computed by its worker processes, each over a range of the samples
+    read through a shared view of the posterior (see histograms); this
+    process sums them, and assembles the figure.
+    """
+    import matplotlib.pyplot as plt
+    npar  = allparams.shape[0]
+    names = _names(parname, npar)
+    if npar < 2:
+        return
+    if style == 'points':
+        points = subsample(allparams, nscatter, thinning, seed=0)
+    elif kde:
+        edges, _, _, grids = _kde_grids(allparams, True, thinning, chunksize,
+                                        pool)
+    else:
+        edges, _, grids = histograms(allparams, bins, pairs=True,
+                                     thinning=thinning, chunksize=chunksize,
+                                     pool=pool)
+    palette = plt.cm.YlOrRd.copy()
+    palette.set_under(alpha=0.0)
+    palette.set_bad(alpha=0.0)
+    fig = plt.figure(figsize=(8, 8))
+    plt.subplots_adjust(left=0.15, right=0.85, bottom=0.15, top=0.9,
+                        hspace=0.05, wspace=0.05)
+    if title is not None:
+        plt.suptitle(title, size=16)
+    image = None
+    for j in range(1, npar):
+        for i in range(npar - 1):
+            if i >= j:
+                continue
+            ax = plt.subplot(npar - 1, npar - 1, (j - 1) * (npar - 1) + i + 1)
+            if style == 'points':
+                ax.plot(points[i], points[j], ',')
+            else:
+                grid  = grids[(i, j)]
+                vmin  = grid.max() * KDE_FLOOR if kde else 1
+                image = ax.imshow(grid.T, extent=(edges[i, 0], edges[i, -1],
+                                                  edges[j, 0], edges[j, -1]),
+                                  cmap=palette, vmin=vmin, aspect='auto',
+                                  origin='lower', interpolation='bilinear')
+            if truepars is not None:
+                ax.plot(truepars[i], truepars[j], '*', color='red', ms=10)
+            if i == 0:
+                ax.set_ylabel(names[j], size=10)
+            else:
+                ax.set_yticklabels([])
+            if j == npar - 1:
+                ax.set_xlabel(names[i], size=10)
+                plt.xticks(rotation=90)
+            else:
+                ax.set_xticklabels([])
+    if image is not None:
+        cax = fig.add_axes([0.87, 0.15, 0.02, 0.75])
+        bar = fig.colorbar(image, cax=cax)
+        bar.set_label('Probability density' if kde else 'N samples',
+                      size=10)
+    if savefile is not None:
+        plt.savefig(savefile)
+    plt.close(fig)
@@ -0,0 +1,254 @@
+"""
+Summary statistics of the posterior, computed in a single streaming pass.
+
+The mean, standard deviation, range, and correlations of the parameters are
+accumulated from moments about the first sample, and their median and
+credible intervals from a quantile sketch, chunk by chunk, so that a
+memory-mapped posterior (e.g., `fsavefile`) is never loaded at once.  Each
+range of samples may be summarized in a separate worker process; partial
+summaries (moments and sketches) are merged.
+
+Summaries are dictionaries, saved as JSON or, if the file name ends in
+'.npz', as a Numpy archive, so that later jobs read the statistics of a run
+without its samples.
+
+Classes
+-------
+Sketch: mergeable quantile sketch of each parameter
+
+Functions
+---------
+summarize: computes the summary statistics of a posterior
+save     : saves a summary as JSON or NPZ
+load     : loads a summary saved by save
+"""
+
+import json
+import numpy as np
+
+from . import streamplots
+
+# Credible levels of the intervals (1, 2, and 3 sigma)
+LEVELS    = [0.6827, 0.9545, 0.9973]
+# Items kept per level of a sketch; the rank error is about 1/SKETCH_K
+SKETCH_K  = 2048
+# Keys of a summary holding one value per parameter
+PER_PARAM = ['mean', 'std', 'median', 'min', 'max', 'bestp']
+
+
+class Sketch(object):
+    """
+    Quantile sketch of each of `npar` parameters: a KLL-type sketch whose
+    compactors all hold up to `k` items, vectorized over the parameters.
+    Level i holds items of weight 2**i; when a level exceeds `k` items, they
+    are sorted and every other one, starting at a random offset, is moved
+    to the next level.  Sketches of different samples are merged by
+    combining their levels.
+    """
+    def __init__(self, npar, k=SKETCH_K, seed=None):
+        """
+        Inputs
+        ------
+        npar: int. Number of parameters.
+        k   : int. Capacity of each level.
+        seed: int. Seed of the random offsets of the compactions.
+        """
+        self.npar   = npar
+        self.k      = k
+        self.n      = 0
+        self.levels = [np.empty((npar, 0))]
+        self.rng    = np.random.default_rng(seed)
+
+    def _compress(self):
+        i = 0
+        while i < len(self.levels):
+            items = self.levels[i]
+            if items.shape[1] > self.k:
+                # With an odd number of items, the first stays at this level
+                odd   = items.shape[1] % 2
+                items = np.sort(items[:, odd:], axis=1)
+                start = self.rng.integers(0, 2, size=(self.npar, 1))
+                iup   = start + 2 * np.arange(items.shape[1] // 2)
+                up    = np.take_along_axis(items, iup, axis=1)
+                self.levels[i] = self.levels[i][:, :odd]
+                if i + 1 == len(self.levels):
+                    self.levels.append(up)
+                else:
+                    self.levels[i+1] = np.concatenate([self.levels[i+1], up],
+                                                      axis=1)
+            i += 1
+
+    def update(self, values):
+        """
+        Adds samples `values`, shape (npar, n), to the sketch.
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(self.npar, -1)
+        self.levels[0] = np.concatenate([self.levels[0], values], axis=1)
+        self.n        += values.shape[1]
+        self._compress()
+
+    def merge(self, other):
+        """
+        Adds the samples summarized by sketch `other` to this sketch.
+        """
+        if other.npar != self.npar:
+            raise ValueError("Sketches of " + str(other.npar) + " and " + \
+                             str(self.npar) + " parameters cannot be merged.")
+        for i, items in enumerate(other.levels):
+            if i == len(self.levels):
+                self.levels.append(items)
+            else:
+                self.levels[i] = np.concatenate([self.levels[i], items],
+                                                axis=1)
+        self.n += other.n
+        self._compress()
+
+    def quantiles(self, q):
+        """
+        Returns the quantiles `q` (in [0, 1]) of each parameter, shape
+        (npar, len(q)), interpolated between the items of the sketch as
+        np.percentile does with method='hazen'.
+        """
+        if self.n == 0:
+            raise ValueError("The sketch is empty.")
+        q       = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        items   = np.concatenate(self.levels, axis=1)
+        weights = np.concatenate([np.full(level.shape[1], 2.**i)
+                                  for i, level in enumerate(self.levels)])
+        order   = np.argsort(items, axis=1)
+        items   = np.take_along_axis(items, order, axis=1)
+        weights = weights[order]
+        ranks   = (np.cumsum(weights, axis=1) - weights / 2) / \
+                  weights.sum(axis=1, keepdims=True)
+        return np.array([np.interp(q, ranks[i], items[i])
+                         for i in range(self.npar)])
+
+
+def _partial(outp, shift, k, chunksize):
+    """
+    Moments about `shift`, range, and sketch of samples `outp`.
+    """
+    npar   = outp.shape[0]
+    lo     = np.full(npar,  np.inf)
+    hi     = np.full(npar, -np.inf)
+    s1     = np.zeros(npar)
+    s2     = np.zeros((npar, npar))
+    sketch = Sketch(npar, k)
+    for chunk in streamplots.chunks(outp, 1, chunksize):
+        if chunk.shape[1] == 0:
+            continue
+        lo  = np.minimum(lo, chunk.min(axis=1))
+        hi  = np.maximum(hi, chunk.max(axis=1))
+        dev = chunk - shift[:, None]
+        s1 += dev.sum(axis=1)
+        s2 += dev @ dev.T
+        sketch.update(chunk)
+    return lo, hi, s1, s2, sketch
+
+
+def summarize(outp, bestp=None, pnames=None, levels=LEVELS, k=SKETCH_K,
+              chunksize=streamplots.CHUNKSIZE, pool=None):
+    """
+    Computes the summary statistics of a posterior in one pass.
+
+    Inputs
+    ------
+    outp     : array.  Posterior, shape (npar, nsamples).  May be a memory
+                       map; it is read in chunks.
+    bestp    : array.  Best parameters, recorded in the summary.
+    pnames   : list.   Name of each parameter.
+    levels   : list.   Credible levels of the intervals, in (0, 1).
+    k        : int.    Capacity of each level of the quantile sketches.
+    chunksize: int.    Number of samples read at a time.
+    pool     : object. SharedPool whose worker processes each summarize a
+                       range of samples.  If None, done in this process.
+
+    Outputs
+    -------
+    summary: dict. Number of samples; mean, standard deviation, median,
+                   minimum, maximum, and best value of each parameter;
+                   credible intervals, shape (nlevels, npar, 2), centered on
+                   the median; and correlation matrix of the parameters.
+    """
+    npar, nsamp = outp.shape
+    if nsamp == 0:
+        raise ValueError("The posterior has no samples.")
+    levels = [float(level) for level in levels]
+    if any(level <= 0 or level >= 1 for level in levels):
+        raise ValueError("Credible levels must be in (0, 1).")
+    # Moments about the first sample, for numerical stability
+    shift  = np.array(outp[:, 0], dtype=np.float64)
+    lo, hi, s1, s2, sketch = None, None, 0, 0, None
+    for part in streamplots._map(pool, _partial, outp, 1, shift, k,
+                                 chunksize):
+        lo  = part[0] if lo is None else np.minimum(lo, part[0])
+        hi  = part[1] if hi is None else np.maximum(hi, part[1])
+        s1 += part[2]
+        s2  = s2 + part[3]
+        if sketch is None:
+            sketch = part[4]
+        else:
+            sketch.merge(part[4])
+    mean   = shift + s1 / nsamp
+    cov    = s2 / nsamp - np.outer(s1, s1) / nsamp**2
+    std    = np.sqrt(np.maximum(np.diag(cov), 0))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = cov / np.outer(std, std)
+    # Parameters with no spread are uncorrelated with the others
+    corr[~np.isfinite(corr)] = 0
+    np.fill_diagonal(corr, 1)
+    corr   = np.clip(corr, -1, 1)
+    q      = [0.5] + [p for level in levels
+                        for p in ((1 - level) / 2, (1 + level) / 2)]
+    quant  = sketch.quantiles(q)
+    return {'nsamples'  : int(nsamp),
+            'pnames'    : None if pnames is None else
+                          [str(name) for name in pnames],
+            'mean'      : mean,
+            'std'       : std,
+            'median'    : quant[:, 0],
+            'min'       : lo,
+            'max'       : hi,
+            'bestp'     : None if bestp is None else
+                          np.asarray(bestp, dtype=np.float64).ravel(),
+            'levels'    : np.array(levels),
+            'intervals' : quant[:, 1:].reshape(npar, -1, 2).transpose(1, 0, 2),
+            'corr'      : corr}
+
+
+def save(summary, fname):
+    """
+    Saves `summary` to `fname`: a Numpy archive if its extension is '.npz',
+    and JSON otherwise.
+    """
+    if fname.endswith('.npz'):
+        arrays = {key : np.asarray(val) for key, val in summary.items()
+                  if val is not None}
+        with open(fname, 'wb') as f:
+            np.savez(f, **arrays)
+        return
+    out = {key : val.tolist() if isinstance(val, np.ndarray) else val
+           for key, val in summary.items()}
+    with open(fname, 'w') as f:
+        json.dump(out, f)
+
+
+def load(fname):
+    """
+    Loads a summary saved by save, with its statistics as arrays.
+    """
+    if fname.endswith('.npz'):
+        with np.load(fname) as data:
+            summary = {key : data[key] for key in data.files}
+        summary['nsamples'] = int(summary['nsamples'])
+        if 'pnames' in summary:
+            summary['pnames'] = [str(name) for name in summary['pnames']]
+    else:
+        with open(fname, 'r') as f:
+            summary = json.load(f)
+        for key in PER_PARAM + ['levels', 'intervals', 'corr']:
+            if summary.get(key) is not None:
+                summary[key] = np.array(summary[key], dtype=np.float64)
+    for key in ['pnames', 'bestp']:
+        summary.setdefault(key, None)
+    return summary
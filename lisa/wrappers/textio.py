@@ -0,0 +1,218 @@
+"""
+Fast reading of the text tables written by MultiNest and PolyChord (e.g.,
+post_equal_weights.dat, .txt, _equal_weights.txt), which reach gigabytes for
+long runs.
+
+Tables are read in chunks of whole lines, each parsed in compiled code by
+np.loadtxt, and streamed into a preallocated array (or memory-mapped NPY
+file), so that only one chunk of text is held in memory at a time.  Chunks
+that np.loadtxt cannot parse, such as numbers written by Fortran without
+the exponent letter when the exponent has three digits (0.1234567-100) or
+with a D exponent, are parsed by a slower fallback.  Rows with a different
+number of columns than the first raise a ValueError.
+
+The parsed table is cached as an NPY file next to the text file (the text
+file name with '.npy' appended), along with the size and modification time
+of the text file (in the cache name with '.json' appended).  Later loads of
+the same, unmodified, table memory-map the cache instead of parsing the
+text again.
+
+Functions
+---------
+count_rows: counts the rows of a text table
+read_table: parses a text table into an array
+load_table: loads a text table via its NPY cache
+"""
+
+import io
+import os
+import re
+import json
+import warnings
+import numpy as np
+
+# Bytes of text parsed at a time
+CHUNKSIZE = 2**24
+# Suffixes of the cache of a table, and of the record of the table it holds
+CACHE_EXT = '.npy'
+STAT_EXT  = '.json'
+# Numbers written by Fortran without the exponent letter, e.g. 0.1234-100
+_FORTRAN  = re.compile(rb'(?<=[0-9.])([+-][0-9]+)')
+
+
+def _chunks(fname, chunksize=CHUNKSIZE):
+    """
+    Yields the contents of `fname` in chunks of whole lines.
+    """
+    with open(fname, 'rb') as f:
+        rest = b''
+        while True:
+            data = f.read(chunksize)
+            if not data:
+                break
+            data = rest + data
+            iend = data.rfind(b'\n') + 1
+            if iend == 0:
+                rest = data
+                continue
+            rest = data[iend:]
+            yield data[:iend]
+        if rest.strip():
+            yield rest + b'\n'
+
+
+def count_rows(fname):
+    """
+    Returns the number of lines of `fname` (an upper bound on its number of
+    rows, if it has blank lines), and the number of columns of its first
+    row.
+    """
+    nrows = 0
+    ncol  = None
+    for chunk in _chunks(fname):
+        if ncol is None:
+            for line in chunk.splitlines():
+                if line.strip():
+                    ncol = len(line.split())
+                    break
+        nrows += chunk.count(b'\n')
+    return nrows, ncol
+
+
+def _parse_slow(chunk, ncol):
+    """
+    Parses a chunk of text, allowing for blank lines and Fortran-formatted
+    numbers.
+    """
+    chunk = chunk.replace(b'D', b'E').replace(b'd', b'e')
+    rows  = [_FORTRAN.sub(rb'E\1', line).split()
+             for line in chunk.splitlines() if line.strip()]
+    for row in rows:
+        if len(row) != ncol:
+            raise ValueError("Expected " + str(ncol) + " columns, but " + \
+                             "found a row with " + str(len(row)) + ": " + \
+                             b' '.join(row).decode(errors='replace'))
+    return np.array(rows, dtype=np.float64).reshape(-1, ncol)
+
+
+def _parse(chunk, ncol):
+    """
+    Parses a chunk of text into an array of shape (nrows, ncol).
+    """
+    try:
+        with warnings.catch_warnings():
+            # Chunks of blank lines hold no rows
+            warnings.simplefilter('ignore', UserWarning)
+            rows = np.loadtxt(io.BytesIO(chunk), dtype=np.float64, ndmin=2)
+    except ValueError:
+        rows = None
+    if rows is not None and rows.size == 0:
+        return np.empty((0, ncol))
+    if rows is not None and rows.shape[1] == ncol:
+        return rows
+    # Reports rows with the wrong number of columns
+    return _parse_slow(chunk, ncol)
+
+
+def read_table(fname, out=None):
+    """
+    Parses the text table `fname`.
+
+    Inputs
+    ------
+    fname: string. Path to the table.
+    out  : array.  Preallocated array (or memory map) to write the rows to,
+                   with at least as many rows as the table.  If None, it is
+                   allocated.
+
+    Outputs
+    -------
+    table: array. Rows of the table, shape (nrows, ncol): `out`, or the
+                  leading rows of it if the table has blank lines.
+    """
+    if out is None:
+        nrows, ncol = count_rows(fname)
+        out = np.empty((nrows, ncol or 0))
+    ncol = out.shape[1]
+    irow = 0
+    for chunk in _chunks(fname):
+        rows = _parse(chunk, ncol)
+        if irow + len(rows) > len(out):
+            raise ValueError(fname + " has more rows than the output array.")
+        out[irow:irow+len(rows)] = rows
+        irow += len(rows)
+    return out[:irow]
+
+
+def _cache_name(fname):
+    return fname + CACHE_EXT
+
+
+def _stat(fname):
+    stat = os.stat(fname)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _cache_valid(fname, fcache):
+    try:
+        with open(fcache + STAT_EXT, 'r') as f:
+            return os.path.exists(fcache) and json.load(f) == _stat(fname)
+    except (OSError, ValueError):
+        return False
+
+
+def load_table(fname, cache=True, mmap=True):
+    """
+    Loads the text table `fname` (at least 2D, as np.loadtxt with ndmin=2).
+
+    Inputs
+    ------
+    fname: string. Path to the table.
+    cache: bool.   If True, loads the table from its NPY cache if the cache
+                   is up to date, and writes the cache otherwise (unless the
+                   directory is not writable).
+    mmap : bool.   If True, a cached table is returned as a read-only
+                   memory map.
+
+    Outputs
+    -------
+    table: array. Rows of the table, shape (nrows, ncol).
+    """
+    fcache = _cache_name(fname)
+    if cache and _cache_valid(fname, fcache):
+        try:
+            return np.load(fcache, mmap_mode='r' if mmap else None)
+        except ValueError:
+            pass
+    # Taken before parsing, so that changes made meanwhile are detected
+    stat        = _stat(fname)
+    nrows, ncol = count_rows(fname)
+    if not cache or nrows == 0:
+        return read_table(fname, np.empty((nrows, ncol or 0)))
+    # Parsed directly into the cache file, which is renamed when complete;
+    # named by process, as several may load the same table at once
+    ftmp = fcache + '.' + str(os.getpid()) + '.tmp'
+    try:
+        out = np.lib.format.open_memmap(ftmp, mode='w+',
+                                        dtype=np.float64,
+                                        shape=(nrows, ncol))
+    except OSError:
+        return read_table(fname, np.empty((nrows, ncol)))
+    try:
+        table = read_table(fname, out)
+    except ValueError:
+        del out
+        os.remove(ftmp)
+        raise
+    out.flush()
+    if len(table) < nrows:
+        # Blank lines: the cache holds the rows that were read
+        table = np.array(table)
+        with open(ftmp, 'wb') as f:
+            np.save(f, table)
+    del out, table
+    os.replace(ftmp, fcache)
+    with open(ftmp + STAT_EXT, 'w') as f:
+        json.dump(stat, f)
+    os.replace(ftmp + STAT_EXT, fcache + STAT_EXT)
+    return np.load(fcache, mmap_mode='r' if mmap else None)
@@ -0,0 +1,127 @@
+"""
+Transforms between the parameter spaces seen by the samplers and the user.
+
+Nested samplers draw points in the unit hypercube of the free parameters,
+which the prior maps to physical values between `pmin` and `pmax`.  Models
+usually need the full parameter vector, including the parameters held
+constant.  ParamTransform precomputes everything needed for these mappings
+once, so that they are cheap to evaluate for single points or batches.
+
+Parameters are classified by `pstep`, following MC3: free if pstep > 0,
+fixed at `pinit` if pstep == 0, and shared with parameter number -pstep
+(counting from 1) if pstep < 0.
+
+Classes
+-------
+ParamTransform: maps between the unit hypercube, free, and full parameters
+"""
+
+import numpy as np
+
+
+class ParamTransform(object):
+    """
+    Maps between the unit hypercube of the free parameters, the physical
+    free parameters, and the full parameter vector.  Each method accepts a
+    single point, shape (n,), or a batch of points, shape (nbatch, n), and
+    an optional preallocated output array `out`.
+
+    Attributes
+    ----------
+    npar   : int.   Total number of parameters.
+    nfree  : int.   Number of free parameters.
+    ifree  : array. Indices of the free parameters.
+    ifixed : array. Indices of the fixed parameters.
+    ishared: array. Indices of the shared parameters.
+    offset : array. Minimum of each free parameter.
+    scale  : array. Range (pmax - pmin) of each free parameter.
+    """
+    def __init__(self, pmin, pmax, pstep=None, pinit=None):
+        """
+        Inputs
+        ------
+        pmin : array. Minimum value for each parameter.
+        pmax : array. Maximum value for each parameter.
+        pstep: array. Step size for each parameter, which determines the
+                      free, fixed, and shared parameters.  If None, all
+                      parameters are free.
+        pinit: array. Values of the fixed parameters.  If None, fixed
+                      parameters are set to the middle of their range.
+        """
+        pmin = np.asarray(pmin, dtype=float)
+        pmax = np.asarray(pmax, dtype=float)
+        if pstep is None:
+            pstep = np.ones(pmin.size)
+        pstep = np.asarray(pstep)
+        if pmin.ndim != 1 or pmin.shape != pmax.shape or \
+           pmin.shape != pstep.shape:
+            raise ValueError("pmin, pmax, and pstep must be 1D arrays of " + \
+                             "the same size.")
+        if pinit is None:
+            pinit = 0.5 * (pmin + pmax)
+        pinit = np.asarray(pinit, dtype=float)
+        if pinit.shape != pmin.shape:
+            raise ValueError("pinit must have the same size as pmin.")
+        self.npar     = pmin.size
+        self.ifree    = np.flatnonzero(pstep >  0)
+        self.ifixed   = np.flatnonzero(pstep == 0)
+        self.ishared  = np.flatnonzero(pstep <  0)
+        self.isource  = (-pstep[self.ishared]).astype(int) - 1
+        self.nfree    = self.ifree.size
+        if np.any((self.isource < 0) | (self.isource >= self.npar)):
+            raise ValueError("Shared parameters must refer to an existing " + \
+                             "parameter.")
+        if np.any(pmax[self.ifree] <= pmin[self.ifree]):
+            raise ValueError("pmax must be greater than pmin for each free " + \
+                             "parameter.")
+        self.offset   = pmin[self.ifree]
+        self.scale    = pmax[self.ifree] - pmin[self.ifree]
+        self.invscale = 1. / self.scale
+        # Full parameter vector, with the fixed values in place
+        self.template = pinit.copy()
+
+    def unit_to_physical(self, cube, out=None):
+        """
+        Maps points in the unit hypercube to the free parameters, uniformly
+        between `pmin` and `pmax`.  May be used directly as a prior for the
+        nested samplers.  `out` may be `cube` itself.
+        """
+        out  = np.multiply(cube, self.scale, out=out)
+        out += self.offset
+        return out
+
+    def physical_to_unit(self, free, out=None):
+        """
+        Maps free parameters to the unit hypercube.  Inverse of
+        unit_to_physical().
+        """
+        out  = np.subtract(free, self.offset, out=out)
+        out *= self.invscale
+        return out
+
+    def free_to_full(self, free, out=None):
+        """
+        Expands free parameters into the full parameter vector, filling in
+        the fixed and shared parameters.
+        """
+        free = np.asarray(free)
+        if out is None:
+            out = np.empty(free.shape[:-1] + (self.npar,))
+        out[...] = self.template
+        out[..., self.ifree] = free
+        if self.ishared.size:
+            out[..., self.ishared] = out[..., self.isource]
+        return out
+
+    def full_to_free(self, full, out=None):
+        """
+        Extracts the free parameters from the full parameter vector.  Inverse
+        of free_to_full().
+        """
+        return np.take(full, self.ifree, axis=-1, out=out)
+
+    def unit_to_full(self, cube, out=None):
+        """
+        Maps points in the unit hypercube to the full parameter vector.
+        """
+        return self.free_to_full(self.unit_to_physical(cube), out=out)
@@ -1,23 +1,67 @@
 """
 Wrapper for UltraNest algorithm of Buchner (2014, 2016, 2019).
 
+plot_corner: plots UltraNest's corner plot
+plot_run   : plots UltraNest's diagnostics of the run
+plot_trace : plots UltraNest's trace plot
+
 Sampler: class to setup and run an inference
 """
 
 import sys, os
 import numpy as np
-import matplotlib.pyplot as plt
 import ultranest
 
 from .helper import BaseSampler
+from . import adapter
+
+
+def plot_corner(results, fname):
+    """
+    Plots the corner plot of UltraNest's `results` to `fname`.
+    """
+    import matplotlib.pyplot as plt
+    from ultranest.plot import cornerplot
+    cornerplot(results)
+    plt.savefig(fname, bbox_inches='tight')
+    plt.close()
+
+
+def plot_run(run_sequence, fname):
+    """
+    Plots the live points, likelihood, weights, and evidence of UltraNest's 
+    `run_sequence` against the prior volume, to `fname`.
+    """
+    import matplotlib.pyplot as plt
+    from ultranest.plot import runplot
+    runplot(results=run_sequence, logplot=True)
+    plt.savefig(fname, bbox_inches='tight')
+    plt.close()
+
+
+def plot_trace(run_sequence, labels, fname):
+    """
+    Plots the trace of each parameter of UltraNest's `run_sequence` to 
+    `fname`.
+    """
+    import matplotlib.pyplot as plt
+    from ultranest.plot import traceplot
+    traceplot(results=run_sequence, labels=labels)
+    plt.savefig(fname, bbox_inches='tight')
+    plt.close()
 
 
 class Sampler(BaseSampler):
-    def __init__(self, dlogz=0.1, fbestp='bestp.npy', fext='.png', 
-                       frac_remain=0.01, fsavefile='output.npy', kll=None, 
-                       Lepsilon=0.001, loglike=None, min_ess=500, model=None, 
-                       niter=None, nlive=500, outputdir=None, pnames=None, 
-                       prior=None, pstep=None, resume=False, truepars=None, 
+    def __init__(self, algplots=True, cachesize=0, data=None, dlogz=0.1, 
+                       fbestp='bestp.npy', fcache=None, fext='.png', 
+                       frac_remain=0.01, fresult=None, fsavefile='output.npy', 
+                       fsummary='summary.json', invalidate=False, kll=None, 
+                       kll_batch=1000, Lepsilon=0.001, loglike=None, 
+                       maptype='thread', min_ess=500, model=None, ncpu=1, 
+                       niter=None, nlive=500, outputdir=None, pinit=None, 
+                       plotcpu=1, plotmode='full', pmax=None, pmin=None, 
+                       pnames=None, prior=None, profile=False, pstep=None, 
+                       resume=False, reuse=False, truepars=None, uncert=None, 
                        verb=0):
         """
         For details on the inputs, instantiate an object `obj` and call 
@@ -27,36 +71,58 @@ class Sampler(BaseSampler):
         super(Sampler, self).__init__()
         # General info about the algorithm
         self.alg = 'ultranest' #name
-        self.reqpar = ['loglike', 'model', 'nlive', 'outputdir', 
-                       'prior', 'pstep'] #required parameters
-        self.optpar = ['dlogz', 'fbestp', 'fext', 'frac_remain', 'fsavefile', 
-                       'kll', 'Lepsilon', 'min_ess', 'niter', 'pnames', 
-                       'resume', 'truepars', 'verb'] #optional parameters
+        self.reqpar = ['model', 'nlive', 'outputdir', 
+                       'pstep'] #required parameters
+        self.optpar = ['algplots', 'cachesize', 'data', 'dlogz', 'fbestp', 
+                       'fcache', 'fext', 'frac_remain', 'fresult', 'fsavefile', 
+                       'fsummary', 'invalidate', 'kll', 'kll_batch', 
+                       'Lepsilon', 'loglike', 'maptype', 'min_ess', 'ncpu', 
+                       'niter', 'pinit', 'plotcpu', 'plotmode', 'pmax', 'pmin', 
+                       'pnames', 'prior', 'profile', 'resume', 'reuse', 
+                       'truepars', 'uncert', 'verb'] #optional parameters
         # Only keep help entries relevant to this algorithm
         self.helpinfo = {key : self.helpinfo[key] 
                          for key in self.reqpar+self.optpar}
         # Load supplied parameters
+        self.algplots    = algplots
+        self.cachesize   = cachesize
+        self.data        = data
         self.dlogz       = dlogz
         self.fbestp      = fbestp
+        self.fcache      = fcache
         self.fext        = fext
         self.frac_remain = frac_remain
+        self.fresult     = fresult
         self.fsavefile   = fsavefile
+        self.fsummary    = fsummary
+        self.invalidate  = invalidate
         self.kll         = kll
+        self.kll_batch   = kll_batch
         self.Lepsilon    = Lepsilon
         self.loglike     = loglike
+        self.maptype     = maptype
         self.min_ess     = min_ess
         self.model       = model
+        self.ncpu        = ncpu
         self.niter       = niter
         self.nlive       = nlive
         self.outputdir   = outputdir
+        self.pinit       = pinit
+        self.plotcpu     = plotcpu
+        self.plotmode    = plotmode
+        self.pmax        = pmax
+        self.pmin        = pmin
         self.pnames      = pnames
         self.prior       = prior
+        self.profile     = profile
         self.pstep       = pstep
         if resume:
             self.resume  = 'resume'
         else:
             self.resume  = 'overwrite'
+        self.reuse       = reuse
         self.truepars    = truepars
+        self.uncert      = uncert
         self.verb        = verb
         if self.verb:
             print("UltraNest sampler initialized")
@@ -73,24 +139,51 @@ class Sampler(BaseSampler):
         self.unprepared = 0
         # Prepare inputs that may be arrays
         self.prep_arr('pstep')
+        for attr in ['data', 'pinit', 'pmax', 'pmin', 'uncert']:
+            if getattr(self, attr) is not None:
+                self.prep_arr(attr)
+        # Parameter transform, which defines the default prior
+        self.make_transform()
         # Check non-negative float inputs
         self.check_nonnegfloat('dlogz')
         self.check_nonnegfloat('frac_remain')
         self.check_nonnegfloat('Lepsilon')
+        # Check non-negative int inputs
+        self.check_nonnegint('cachesize')
         # Check positive int inputs
+        self.check_posint('kll_batch')
         self.check_posint('min_ess')
+        self.check_posint('ncpu')
         self.check_posint('nlive')
+        # Check the type of workers for single-point functions
+        if self.maptype not in adapter.MAPTYPES:
+            print("maptype must be one of:", ", ".join(adapter.MAPTYPES))
+            self.unprepared += 1
         # Check that required arguments are not none
+        # Default to the built-in Gaussian log likelihood
+        if self.loglike is None:
+            self.loglike = self.make_loglike()
         self.check_none('loglike')
         self.check_none('model')
+        # Default to a uniform prior between pmin and pmax
+        if self.prior is None and self.transform is not None:
+            self.prior = self.transform.unit_to_physical
         self.check_none('prior')
         # Make sure outputdir is an absolute path & exists
         if self.make_abspath('outputdir'):
             # Now update paths based on that, if needed
             self.update_path('fbestp')
+            self.update_path('fcache')
+            self.update_path('fresult')
             self.update_path('fsavefile')
+            self.update_path('fsummary')
         # Ensure proper pnames exist as numpy array
         self.check_pnames()
+        # Check mode of the posterior plots
+        self.check_plotmode()
+        # Calling conventions of the prior and log likelihood
+        if not self.unprepared:
+            self.make_adapters()
         # Ready to run?
         if self.unprepared:
             print("Correct the", self.unprepared, 
@@ -105,42 +198,74 @@ class Sampler(BaseSampler):
         """
         Executes the inference
         """
-        if self.prepare():
-            # Set up the inference
-            un = ultranest.ReactiveNestedSampler(list(self.pnames), 
-                                                 self.loglike, 
-                                                 self.prior, 
-                                                 log_dir=self.outputdir, 
-                                                 vectorized=True, 
-                                                 resume=self.resume)
-            # Run it
-            out = un.run(min_ess=self.min_ess, max_iters=self.niter, 
-                         min_num_live_points=self.nlive, 
-                         frac_remain=self.frac_remain, 
-                         Lepsilon=self.Lepsilon, dlogz=self.dlogz)
+        self.start_profile()
+        with self.phase('prepare'):
+            ready = self.prepare()
+        if ready:
+            # Reuse the result of a completed run with the same inputs
+            if self.load_result():
+                return self.make_result()
+            with self.phase('sampling'):
+                # Set up the inference, evaluating batches of points
+                un = ultranest.ReactiveNestedSampler(list(self.pnames), 
+                                            self.loglike_adapter.batch, 
+                                            self.prior_adapter.batch, 
+                                            log_dir=self.outputdir, 
+                                            vectorized=True, 
+                                            resume=self.resume)
+                # Run it
+                out = un.run(min_ess=self.min_ess, max_iters=self.niter, 
+                             min_num_live_points=self.nlive, 
+                             frac_remain=self.frac_remain, 
+                             Lepsilon=self.Lepsilon, dlogz=self.dlogz)
+            self.loglike_adapter.close()
+            self.prior_adapter.close()
+            self.logz    = out['logz']
+            self.logzerr = out['logzerr']
             if self.verb:
                 un.print_results()
 
             # Posterior and best parameters
-            self.bestp = np.array(un.results['maximum_likelihood']['point'])
-            self.outp  = un.results['samples'].T
-            if self.kll is not None:
-                for i in range(self.outp.shape[-1]):
-                    self.kll.update(self.model(self.outp[:,i], fullout=True))
-
-            # UltraNest Plotting
-            un.plot_corner()
-            un.plot_run()
-            un.plot_trace()
+            with self.phase('postprocessing'):
+                best       = un.results['maximum_likelihood']['point']
+                self.bestp = np.array(best)
+                self.outp  = un.results['samples'].T
+            # Inputs of UltraNest's plots, see alg_plot_tasks()
+            self.plotdata = {'results'      : un.results, 
+                             'run_sequence' : un.run_sequence, 
+                             'labels'       : un.paramnames + 
+                                              un.derivedparamnames, 
+                             'plotdir'      : un.logs['plots']}
+            # Model quantiles
+            self.model_quantiles()
 
             # Save posterior and bestfit params
-            if self.fsavefile is not None:
-                np.save(self.fsavefile, self.outp)
+            self.save_posterior()
             if self.fbestp is not None:
                 np.save(self.fbestp, self.bestp)
+            self.save_result()
+            self.save_profile()
+            self.flush_cache()
+            return self.make_result()
         else:
             if self.verb:
                 print("Sampler is not fully prepared to run. " + \
                       "Correct the above errors and try again.")
 
-
+    def alg_plot_tasks(self):
+        """
+        Returns UltraNest's plots of the last run, as tasks for 
+        plotting.render.  They are saved in the plots directory of 
+        UltraNest's outputs, as by ReactiveNestedSampler.plot_corner(), 
+        plot_run(), and plot_trace().
+        """
+        if self.plotdata is None:
+            print("UltraNest's plots require the results of run().")
+            return []
+        data = self.plotdata
+        return [(plot_corner, data['results'], 
+                 os.path.join(data['plotdir'], 'corner.pdf')), 
+                (plot_run, data['run_sequence'], 
+                 os.path.join(data['plotdir'], 'run.pdf')), 
+                (plot_trace, data['run_sequence'], data['labels'], 
+                 os.path.join(data['plotdir'], 'trace.pdf'))]
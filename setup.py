@@ -31,6 +31,7 @@ setuptools.setup(
     name='lisa',
     version=VER,
     scripts=[],
+    entry_points={'console_scripts': ['lisa = lisa.cli:main']},
     author='Michael Himes',
     author_email='mhimes@knights.ucf.edu',
     description='Large-selection Interface for Sampling Algorithms',
@@ -43,8 +44,8 @@ setuptools.setup(
         "Programming Language :: Python :: 3",
         "Operating System :: OS Independent",
         ],
-    python_requires='>=3.6',
-    install_requires=['numpy>=1.16', 'matplotlib>=3.0', 
+    python_requires='>=3.8',
+    install_requires=['numpy>=1.17', 'matplotlib>=3.0', 
                       'pymultinest==2.9', 'ultranest>=2.2.1', 'dynesty>=1.0.1', 
                       'dnest4>=0.2.4', 'mpi4py>=3.0.3'], 
     cmdclass={'build_py': lisa_build}